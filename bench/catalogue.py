@@ -0,0 +1,53 @@
+"""
+Builds realistic looking payloads for the benchmarks, roughly what the CPLs and ingest history on a busy screen
+server look like once they've been turned into something we can send over the wire.
+"""
+from uuid import UUID
+import random
+
+def fake_uuid(rand):
+    return str(UUID(int=rand.getrandbits(128), version=4))
+
+def cpl(rand):
+    reels = []
+    for r in xrange(rand.randint(1, 8)):
+        assets = []
+        for kind in ('MainPicture', 'MainSound', 'MainSubtitle')[:rand.randint(2, 3)]:
+            assets.append({
+                "id": fake_uuid(rand),
+                "type": kind,
+                "annotation_text": "{0} reel {1}".format(kind, r + 1),
+                "edit_rate": [24, 1],
+                "intrinsic_duration": rand.randint(14400, 28800),
+                "entry_point": 0,
+                "duration": rand.randint(14400, 28800),
+                "key_id": fake_uuid(rand) if rand.random() < 0.5 else None,
+                "hash": "".join(rand.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/") for i in xrange(27)) + "=",
+                "path": "{0}.mxf".format(fake_uuid(rand))
+            })
+        reels.append({"id": fake_uuid(rand), "assets": assets})
+
+    return {
+        "id": fake_uuid(rand),
+        "content_title_text": "FEATURE-TITLE_FTR-{0}_F_EN-XX_UK-12A_51_2K_STUDIO_20131220_FAC_IOP_OV".format(rand.randint(1, 9)),
+        "annotation_text": "Feature title",
+        "issue_date": "2013-12-20T10:00:00+00:00",
+        "issuer": "Studio",
+        "creator": "Mastering house",
+        "content_kind": rand.choice(["feature", "trailer", "advertisement", "teaser"]),
+        "rating_list": [{"agency": "http://www.bbfc.co.uk", "label": "12A"}],
+        "encrypted": rand.random() < 0.5,
+        "duration_in_seconds": rand.randint(30, 10800),
+        "reels": reels
+    }
+
+def cpls(count, seed=1):
+    rand = random.Random(seed)
+    return [cpl(rand) for i in xrange(count)]
+
+def ingest_history(count, seed=1):
+    rand = random.Random(seed)
+    history = {}
+    for i in xrange(count):
+        history[fake_uuid(rand)] = [{"timestamp": "2013-12-20T10:00:{0:02d}".format(state), "state": state} for state in xrange(rand.randint(1, 3))]
+    return history
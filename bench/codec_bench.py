@@ -0,0 +1,38 @@
+"""
+Compares the JSON and MessagePack value codecs on encode/decode throughput and payload size.
+
+python -m bench.codec_bench
+"""
+import timeit
+
+from screener.lib import codec
+from screener.lib.codec import JSON, MSGPACK
+from bench import catalogue
+
+payloads = [
+    ("status", {"status": 0, "state": 2, "cpl": "Feature title"}),
+    ("get_cpl_uuids x 2000", {"status": 0, "cpl_uuids": [c["id"] for c in catalogue.cpls(2000)]}),
+    ("get_cpls x 100", {"status": 0, "cpls": catalogue.cpls(100)}),
+    ("get_cpls x 2000", {"status": 0, "cpls": catalogue.cpls(2000)}),
+    ("get_ingest_history x 5000", {"status": 0, "history": catalogue.ingest_history(5000)}),
+]
+
+def bench(encode, decode, payload):
+    encoded = encode(payload)
+
+    # Aim for roughly the same amount of work for each payload.
+    number = max(1, 2000000 / (len(encoded) + 1))
+    encode_time = min(timeit.repeat(lambda: encode(payload), number=number, repeat=3)) / number
+    decode_time = min(timeit.repeat(lambda: decode(encoded), number=number, repeat=3)) / number
+    return len(encoded), encode_time, decode_time
+
+if __name__ == '__main__':
+    print 'MessagePack implementation: {0}'.format(codec.implementation)
+    print '{0:<28}{1:<10}{2:>12}{3:>14}{4:>14}{5:>12}{6:>12}'.format('payload', 'codec', 'bytes', 'encode/s', 'decode/s', 'enc MB/s', 'dec MB/s')
+
+    for name, payload in payloads:
+        for codec_name, c in (('json', JSON), ('msgpack', MSGPACK)):
+            encode, decode = codec.codecs[c]
+            size, encode_time, decode_time = bench(encode, decode, payload)
+            print '{0:<28}{1:<10}{2:>12}{3:>14.1f}{4:>14.1f}{5:>12.1f}{6:>12.1f}'.format(name, codec_name, size,
+                1 / encode_time, 1 / decode_time, size / encode_time / 1e6, size / decode_time / 1e6)
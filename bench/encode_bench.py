@@ -0,0 +1,36 @@
+"""
+Messages per second for encoding responses, the original klv/bytearray path against encode_parts().
+
+python -m bench.encode_bench
+"""
+import json, klv, timeit
+
+from screener.lib.util import encode_parts
+from bench import catalogue
+
+def klv_encode(handler_key, value):
+    # How responses used to be built, kept here as the baseline.
+    key = [0x06, 0x0e, 0x2b, 0x34, 0x02, 0x04, 0x01] + ([0x00] * 8) + [handler_key]
+    return str(klv.encode(key, json.dumps(value)))
+
+def parts_encode(handler_key, value):
+    return encode_parts(handler_key, value)
+
+payloads = [
+    ("status", 0x02, {"status": 0, "state": 2}),
+    ("get_cpl_uuids x 2000", 0x04, {"status": 0, "cpl_uuids": [c["id"] for c in catalogue.cpls(2000)]}),
+    ("get_cpls x 500", 0x30, {"status": 0, "cpls": catalogue.cpls(500)}),
+]
+
+if __name__ == '__main__':
+    print '{0:<24}{1:<10}{2:>14}{3:>14}'.format('payload', 'encoder', 'msgs/s', 'speedup')
+
+    for name, handler_key, payload in payloads:
+        size = len(klv_encode(handler_key, payload))
+        number = max(1, 5000000 / size)
+
+        results = []
+        for encoder_name, encoder in (('klv', klv_encode), ('parts', parts_encode)):
+            elapsed = min(timeit.repeat(lambda: encoder(handler_key, payload), number=number, repeat=5)) / number
+            results.append(1 / elapsed)
+            print '{0:<24}{1:<10}{2:>14.1f}{3:>13.2f}x'.format(name, encoder_name, results[-1], results[-1] / results[0])
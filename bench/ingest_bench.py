@@ -0,0 +1,50 @@
+"""
+Measures how long ingests wait between being submitted and a worker starting on them, for a burst of small DCPs.
+The FTP download is stubbed out with a short sleep so this is only the cost of the queue and workers.
+
+python -m bench.ingest_bench [count] [workers] [hosts]
+"""
+import shutil, sys, tempfile, time
+from threading import Lock
+
+from screener.content import Content
+from screener.lib.metrics import Histogram
+
+def run(count=100, workers=4, hosts=4, ingest_time=0.002):
+    root = tempfile.mkdtemp()
+    try:
+        content = Content(incoming_path=root + '/INCOMING', assets_path=root + '/ASSETS', ingest_path=root + '/INGEST',
+                          workers=workers, per_host=max(1, workers / hosts))
+
+        submitted = {}
+        latency = Histogram()
+        lock = Lock()
+
+        def fake_ingest(ingest_uuid, item):
+            started = time.time()
+            with lock:
+                latency.record((started - submitted[item['dcp_path']]) * 1e6)
+            time.sleep(ingest_time)
+
+        content.ingest_dcp = fake_ingest
+
+        start = time.time()
+        for i in xrange(count):
+            dcp_path = 'dcp_{0}'.format(i)
+            with lock:
+                submitted[dcp_path] = time.time()
+            content.ingest({"host": 'host{0}'.format(i % hosts), "port": 21}, dcp_path)
+
+        content.ingest_queue.join()
+        return latency, time.time() - start
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:4]]
+    count, workers, hosts = args + [100, 4, 4][len(args):]
+
+    latency, elapsed = run(count, workers, hosts)
+    print '{0} DCPs, {1} workers, {2} hosts: all done in {3:.3f}s'.format(count, workers, hosts, elapsed)
+    print 'submit to start (ms): p50 {0:.2f}  p99 {1:.2f}  max {2:.2f}'.format(
+        latency.percentile(50) / 1000.0, latency.percentile(99) / 1000.0, latency.max / 1000.0)
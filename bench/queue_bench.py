@@ -0,0 +1,37 @@
+"""
+Queues up a large number of entries on an IndexableQueue, looks them up, moves and cancels some and drains the rest,
+timing each step.
+
+python -m bench.queue_bench [entries]
+"""
+import random, sys, time
+
+from screener.lib.util import IndexableQueue
+
+def timed(name, count, f):
+    start = time.time()
+    f()
+    elapsed = time.time() - start
+    print '{0:<24}{1:>10}{2:>12.3f}s{3:>14.0f}/s'.format(name, count, elapsed, count / elapsed)
+
+def run(entries=100000):
+    q = IndexableQueue()
+    uuids = []
+    rand = random.Random(1)
+
+    timed('put', entries, lambda: uuids.extend(q.put({"dcp_path": "dcp"}, priority=rand.randint(0, 3)) for i in xrange(entries)))
+
+    lookups = [rand.choice(uuids) for i in xrange(entries)]
+    timed('lookup', entries, lambda: [q[uuid] for uuid in lookups])
+
+    moves = rand.sample(uuids, entries / 10)
+    timed('move to front', len(moves), lambda: [q.move(uuid, first=True) for uuid in moves])
+
+    cancels = rand.sample(uuids, entries / 10)
+    timed('cancel', len(cancels), lambda: [q.cancel(uuid) for uuid in cancels])
+
+    remaining = q.qsize()
+    timed('get', remaining, lambda: [q.get() for i in xrange(remaining)])
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
@@ -13,5 +13,10 @@ rsp_codes = {
 	8: {'status': 8, 'err_msg': 'Invalid playlist supplied'},
 	9: {'status': 9, 'err_msg': 'Schedule mode not recognised'},
 	10: {'status': 10, 'err_msg': 'Schedule not found'},
-	11: {'status': 11, 'err_msg': 'Ingest not found'}
+	11: {'status': 11, 'err_msg': 'Ingest not found'},
+	12: {'status': 12, 'err_msg': 'Invalid batch request'},
+	13: {'status': 13, 'err_msg': 'Unknown subscription event'},
+	14: {'status': 14, 'err_msg': 'Resync required'},
+	15: {'status': 15, 'err_msg': 'Request failed'},
+	16: {'status': 16, 'err_msg': 'Invalid rate'}
 }
\ No newline at end of file
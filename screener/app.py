@@ -1,13 +1,21 @@
 """
 A DCI media server emulator
 """
-from twisted.internet import protocol, reactor
-import logging, json
-
-from screener import cfg
+from twisted.internet import protocol, reactor, threads, task
+from twisted.internet.interfaces import IPullProducer
+from twisted.python.threadpool import ThreadPool
+from zope.interface import implementer
+from collections import deque
+from itertools import count
+import logging, json, os
+
+from screener import cfg, rsp_codes
 from screener.lib import config as config_handler
-from screener.lib.util import encode_msg, decode_msg
+from screener.lib import codec
+from screener.lib.metrics import Metrics, timer
+from screener.lib.util import encode_parts, decode_msg, create_dirs, correlate, correlation_id, KLVStream
 from screener.lib.bus import Bus
+from screener.lib.changelog import ChangeLog
 from screener.system import system_time
 from screener.playback import Playback
 from screener.playlists import Playlists
@@ -15,15 +23,95 @@ from screener.content import Content
 from screener.schedule import Schedule
 
 
+# Unique id for each connection, used to route asynchronous messages back to the right client.
+client_ids = count(1)
+
+def client_topic(client_id):
+    return 'to_client.{0}'.format(client_id)
+
+# Unique id for each screen hosted in this process, keeps their change topics apart on a shared bus.
+screen_ids = count(1)
+
+def build_content(paths, bus):
+    """
+    Creates the content store, set up for ingesting as the config says.
+
+    Args:
+        paths (dict): Storage paths, the incoming, assets and ingest ones are used.
+        bus (Bus): Where ingest progress is published.
+    """
+    content = Content(incoming_path=paths["incoming"], assets_path=paths["assets"], ingest_path=paths["ingest"], bus=bus,
+            workers=cfg.ingest_workers(), per_host=cfg.ingest_per_host(), ftp_connections=cfg.ingest_connections(),
+            segment_size=cfg.ingest_segment_size() * 1024 * 1024, listing_ttl=cfg.ftp_listing_ttl(),
+            ftp_pool_size=cfg.ftp_pool_size(), ftp_idle_timeout=cfg.ftp_idle_timeout(), bandwidth=cfg.ingest_bandwidth(),
+            bandwidth_profile=cfg.ingest_bandwidth_profile(), bandwidth_per_ingest=cfg.ingest_bandwidth_per_ingest(),
+            progress_rate=cfg.ingest_progress_rate(), hash_workers=cfg.ingest_hash_workers())
+    return content
+
+def maintain_ftp_pool(pool):
+    """
+    Starts hanging up on the pool's idle FTP sessions once they've timed out, even if there are no ingests to notice.
+
+    Returns:
+        The LoopingCall doing it, stop it along with the content (see Content.stop()).
+    """
+    # On a thread, saying goodbye waits for the server.
+    loop = task.LoopingCall(threads.deferToThread, pool.evict_idle)
+    loop.start(max(1, pool.idle_timeout / 2.0), now=False)
+    return loop
+
+
 class ScreenServer(object):
-    def __init__(self, paths):
-        # Used for sending messages back to the client asynchronously from anywhere in the app.
-        self.bus = Bus()
+    def __init__(self, paths, content=None, bus=None, changelog=None):
+        """
+        Args:
+            paths (dict): Storage paths, see ScreenerFactory.startFactory()
+            content (Content, None): Content store to share with other screens in the same process, one is created
+                if not given.
+            bus (Bus, None): Message bus to share with other screens, it should be the one the shared content uses.
+            changelog (ChangeLog, None): Change log to share with other screens, again along with the content. Taken
+                from the shared content if not given.
+        """
+        # Content changes go in the change log of the screen that first set it up, so every screen sharing it has
+        # to share that too.
+        if content is not None and content.changelog is not None:
+            if changelog is not None and changelog is not content.changelog:
+                raise ValueError('Shared content already has a different change log')
+            changelog = content.changelog
+
+        # Used for sending messages back to the client asynchronously from anywhere in the app. Each connection
+        # listens on its own topic, see client_topic()
+        self.bus = bus or Bus()
+        self.screen_id = next(screen_ids)
+
+        # Recent changes to the content, playlists and schedule so reconnecting clients can catch up.
+        self.changelog = changelog or ChangeLog(cfg.changelog_size())
+
+        self.content = content or build_content(paths, self.bus)
+        self.playlists = Playlists(playlists_path=paths["playlists"], bus=self.bus)
+        self.playback = Playback(self.content, self.playlists, bus=self.bus)
+        self.schedule = Schedule(self.content, self.playlists, self.playback, bus=self.bus)
+
+        # Topics each store publishes its changes on, see subscribe(). Content (and its ingests) can be shared
+        # between screens so isn't tied to this one, everything else is.
+        self.change_topics = {
+                'content': 'changes.content',
+                'ingest': 'changes.ingest',
+                'playlists': 'changes.{0}.playlists'.format(self.screen_id),
+                'schedule': 'changes.{0}.schedule'.format(self.screen_id),
+                'playback': 'changes.{0}.playback'.format(self.screen_id)
+            }
+        self.content.topic = self.change_topics['content']
+        self.content.ingest_topic = self.change_topics['ingest']
+        self.playlists.topic = self.change_topics['playlists']
+        self.schedule.topic = self.change_topics['schedule']
+        self.playback.topic = self.change_topics['playback']
+
+        for store in (self.content, self.playlists, self.schedule):
+            store.changelog = self.changelog
 
-        self.content = Content(incoming_path=paths["incoming"], assets_path=paths["assets"], ingest_path=paths["ingest"])
-        self.playlists = Playlists(playlists_path=paths["playlists"])
-        self.playback = Playback(self.content, self.playlists)
-        self.schedule = Schedule(self.content, self.playlists, self.playback)
+        # reply_to topic -> [(change topic, callback)] for each connection that has subscribed to changes.
+        self.subscriptions = {}
 
         # @todo: Work out what to do with numbering. Provisional idea is content spans 1-20, playlists 21-40 etc.
         # @todo: Make these hex instead of decimal!!!
@@ -37,6 +125,7 @@ class ScreenServer(object):
                 0x32 : self.content.cancel_ingest,
                 0x33 : self.content.get_ingest_history,
                 0x34 : self.content.clear_ingest_history,
+                0x35 : self.content.set_ingest_bandwidth,
 
                 0x26 : self.playlists.get_playlist_uuids,
                 0x27 : self.playlists.get_playlists,
@@ -65,27 +154,294 @@ class ScreenServer(object):
                 0x24 : self.schedule.delete_schedule,
                 0x25 : self.schedule.set_mode,
 
-                0x03 : system_time
+                0x03 : system_time,
+
+                0x40 : self.batch,
+                0x41 : self.negotiate_codec,
+                0x42 : self.get_metrics,
+                0x43 : self.subscribe,
+                0x44 : self.get_changes_since
+            }
+
+        # Read only handlers and the store they read from, their responses are cached until that store changes.
+        self.cacheable = {
+                0x04 : self.content,
+                0x30 : self.content,
+                0x31 : self.content,
+
+                0x26 : self.playlists,
+                0x27 : self.playlists,
+                0x28 : self.playlists,
+
+                0x19 : self.schedule,
+                0x20 : self.schedule,
+                0x21 : self.schedule
             }
+        self.rsp_cache = {}
+
+        # Handlers that can take a while, these are run on the handler thread pool so they don't hold up everyone
+        # else. Everything else (importantly playback control and status) runs straight away on the reactor thread.
+        # They only read, anything that changes state has to stay on the reactor. See also is_pooled().
+        self.pooled = set([0x30, 0x07, 0x33, 0x27, 0x20])
 
-    def process_msg(self, handler_key, **kwargs):
+        # Handlers that page through a collection (limit/cursor/next_cursor), these can be streamed back a page at a
+        # time, see ChunkProducer.
+        self.streamable = set([0x30, 0x27, 0x33])
+
+        # Handlers that send messages back later on, these are told which topic to publish them to.
+        self.routed = set([0x06, 0x22, 0x23, 0x40, 0x43])
+
+        # Request counts and how long each stage of dealing with them takes, per handler key.
+        self.metrics = Metrics()
+
+    def is_pooled(self, handler_key, params):
+        """
+        Whether a request should be run on the handler thread pool. A batch is if everything in it would be, a batch
+        that changes anything (e.g. playback) runs on the reactor like its requests would on their own.
+        """
+        if handler_key != 0x40:
+            return handler_key in self.pooled
+
+        requests = params.get('requests')
+        if not isinstance(requests, list) or not requests:
+            return False
+        for request in requests:
+            if not isinstance(request, (list, tuple)) or len(request) != 2 or request[0] not in self.pooled:
+                return False
+        return True
+
+    def process_msg(self, handler_key, reply_to=None, **kwargs):
         """
         Processes the message passed to it by the socket
 
         Args:
             handler_key - Which operation to perform.
+            reply_to - Bus topic of the connection that sent the message, passed on to the handlers in self.routed
             **kwargs - The arguments to pass to the called operation.
 
         Returns:
             handler_key - The key of the response message.
             result - A dictionary of the data being passed back in the response.
         """
-        print "key: ", handler_key
         handler = self.handlers[handler_key]
+        if handler_key in self.routed:
+            kwargs['reply_to'] = reply_to
+
+        start = timer()
         result = handler(**kwargs) or {}
+        self.metrics.record(handler_key, 'handle', timer() - start)
 
         return handler_key, result
 
+    def encode_rsp(self, response_key, result, codec):
+        start = timer()
+        encoded = encode_parts(response_key, result, codec)
+        self.metrics.record(response_key, 'encode', timer() - start)
+
+        return encoded
+
+    def process_encoded(self, handler_key, codec=codec.JSON, reply_to=None, **kwargs):
+        """
+        Same as process_msg() but hands back the response ready encoded to go straight out on the socket. Responses
+        from read only handlers are cached against the version of the store they come from, so repeat requests
+        don't do any work until something changes.
+
+        Returns:
+            handler_key - The key of the response message.
+            result - A dictionary of the data being passed back in the response, None if it came from the cache.
+            encoded - The encoded KLV response, as a list of strings to write out in order.
+        """
+        store = self.cacheable.get(handler_key)
+        if store is None:
+            response_key, result = self.process_msg(handler_key, reply_to, **kwargs)
+            return response_key, result, self.encode_rsp(response_key, result, codec)
+
+        # Grab the version before running the handler, if the store changes underneath us we'll just miss next time.
+        version = store.version
+        cache_key = (handler_key, codec, json.dumps(kwargs, sort_keys=True))
+
+        cached = self.rsp_cache.get(cache_key)
+        if cached is not None and cached[0] == version:
+            self.metrics.incr(handler_key, 'cache_hits')
+            return handler_key, None, cached[1]
+
+        response_key, result = self.process_msg(handler_key, **kwargs)
+        encoded = self.encode_rsp(response_key, result, codec)
+
+        # Stale entries get overwritten as we go, this just stops lots of different arguments growing it forever.
+        if len(self.rsp_cache) >= cfg.rsp_cache_size():
+            self.rsp_cache.clear()
+        self.rsp_cache[cache_key] = (version, encoded)
+
+        return response_key, result, encoded
+
+    def batch(self, requests, reply_to=None):
+        """
+        Runs a list of requests one after the other and returns all of their results in a single response, saves a
+        round trip per request when a client needs to make a lot of calls in one go.
+
+        Args:
+            requests (list): Ordered list of [handler_key, kwargs] pairs, kwargs being the arguments for that request.
+                Any handler but batch and negotiate_codec.
+
+        Returns:
+            The return status::
+
+                0 -- Success
+                12 -- Invalid batch request
+
+            The results of each request, in the same order as they were given, as [handler_key, result] pairs.
+        """
+        # Check the whole lot up front so we don't run half a batch and then give up.
+        for index, request in enumerate(requests):
+            try:
+                handler_key, kwargs = request
+            except (TypeError, ValueError):
+                handler_key, kwargs = None, None
+
+            # Batches don't nest, and negotiate_codec has to be sent on its own for the connection to switch codec.
+            if handler_key not in self.handlers or handler_key in (0x40, 0x41) or not isinstance(kwargs, dict):
+                rsp = dict(rsp_codes[12])
+                rsp['index'] = index
+                return rsp
+
+        results = []
+        for handler_key, kwargs in requests:
+            response_key, result = self.process_msg(handler_key, reply_to, **kwargs)
+            # Take a copy, some handlers hand back a shared dict which the next request would write over.
+            results.append([response_key, dict(result)])
+
+        rsp = dict(rsp_codes[0])
+        rsp['results'] = results
+        return rsp
+
+    def negotiate_codec(self, codecs):
+        """
+        Picks the codec used to encode message values for the rest of the connection. The response to this message
+        is still encoded with the codec in use when it was sent, everything after it uses the new one.
+
+        Args:
+            codecs (list): The codecs the client understands, in order of preference.
+
+        Available Codecs::
+
+            0 (default) -- JSON
+            1 -- MessagePack
+
+        Returns:
+            The return status::
+
+                0 -- Success
+
+            The codec chosen, JSON if none of the ones offered are supported.
+        """
+        chosen = next((c for c in codecs if c in codec.codecs), codec.JSON)
+
+        rsp = dict(rsp_codes[0])
+        rsp['codec'] = chosen
+        return rsp
+
+    def get_metrics(self, reset=False):
+        """
+        Returns the request counters and latency histograms for each handler key, latencies are in microseconds
+        and broken down into decode, handle, encode and write time.
+
+        Args:
+            reset (bool): Clear the metrics once they've been read.
+
+        Returns:
+            The return status::
+
+                0 -- Success
+
+            The metrics themselves, keyed by handler key in hex.
+        """
+        rsp = dict(rsp_codes[0])
+        rsp['metrics'] = self.metrics.snapshot()
+
+        if reset:
+            self.metrics.reset()
+
+        return rsp
+
+    def subscribe(self, events, reply_to=None):
+        """
+        Asks for changes to be pushed to this connection as they happen, rather than having to poll for them. Each
+        call replaces the connection's previous subscriptions, subscribe to [] to stop.
+
+        Args:
+            events (list): Any of "content", "playlists", "schedule", "playback" and "ingest".
+
+        Returns:
+            The return status::
+
+                0 -- Success
+                13 -- Unknown subscription event
+
+            The events subscribed to. After that a message with this key is pushed for each change, it has the
+            event, what changed and its version (see get_changes_since(), playback changes just have the version of
+            the playback state)::
+
+                content, playlists, schedule -- added, removed and/or updated lists of UUIDs
+                playback -- state
+                ingest -- ingest_uuid and state
+        """
+        events = set(events)
+        if not events.issubset(self.change_topics):
+            return rsp_codes[13]
+
+        self.unsubscribe(reply_to)
+
+        def forward(bus, change):
+            bus.publish(reply_to, 0x43, dict(change, status=0))
+
+        subscriptions = self.subscriptions[reply_to] = [(self.change_topics[event], forward) for event in events]
+        for topic, callback in subscriptions:
+            self.bus.subscribe(topic, callback)
+
+        rsp = dict(rsp_codes[0])
+        rsp['events'] = sorted(events)
+        return rsp
+
+    def get_changes_since(self, version, log_id=None):
+        """
+        Returns the changes to the content, playlists and schedule since a given version, so a client that has been
+        disconnected can catch up without fetching everything again. The versions come from this response and from
+        the changes pushed to subscribers, see subscribe().
+
+        Args:
+            version (int): The last version the client has seen, 0 to start from the beginning.
+            log_id (string, None): The log_id from the response the version came from, it changes when the server
+                restarts and the versions start again.
+
+        Returns:
+            The return status::
+
+                0 -- Success
+                14 -- Resync required
+
+            The current version and log_id. On success the changes themselves, in order, in the same format they're
+            pushed to subscribers. Resync required means the changes have been lost (the server has restarted or
+            too much has changed since), fetch everything again and carry on from the version returned.
+        """
+        topics = set(self.change_topics[event] for event in ('content', 'playlists', 'schedule'))
+        current, changes = self.changelog.since(version, topics)
+
+        if changes is None or (log_id is not None and log_id != self.changelog.id):
+            rsp = dict(rsp_codes[14])
+        else:
+            rsp = dict(rsp_codes[0])
+            rsp['changes'] = changes
+
+        rsp['version'] = current
+        rsp['log_id'] = self.changelog.id
+        return rsp
+
+    def unsubscribe(self, reply_to):
+        # Drops all of a connection's subscriptions, e.g. once it has gone away.
+        for topic, callback in self.subscriptions.pop(reply_to, []):
+            self.bus.unsubscribe(topic, callback)
+
     def reset(self):
         self.__init__()
 
@@ -96,55 +452,248 @@ class Screener(protocol.Protocol):
 
         self.factory = factory
 
+        # Reads can hold part of a message or several of them, so collect them up here until they are complete.
+        self.stream = KLVStream()
+
+        # Everyone starts off talking JSON until they negotiate something else.
+        self.codec = codec.JSON
+
+        # Streamed responses waiting to go out, the transport only takes one producer at a time.
+        self.streams = deque()
+
     def connectionMade(self):
         # Keep track of which clients we have currently connected. (In theory only 1 but can handle more)
         self.factory.clients.add(self)
 
-        # Set up the handler for being able to send responses back to the client asynchronously.
-        self.ss.bus.subscribe('to_client', self.send_rsp)
+        # Set up the handler for being able to send responses back to the client asynchronously. Only messages
+        # meant for this connection are published on its topic, so adding clients doesn't add work for the others.
+        self.topic = client_topic(next(client_ids))
+        self.ss.bus.subscribe(self.topic, self.bus_rsp)
 
     def connectionLost(self, reason):
         # Always best to clear up after yourself for each connection.
         self.factory.clients.remove(self)
-        self.ss.bus.unsubscribe('to_client', self.send_rsp)
+        self.ss.bus.remove(self.topic)
+        self.ss.unsubscribe(self.topic)
+        self.streams.clear()
 
     def dataReceived(self, data):
-        # Actually do the decoding in this function so we can make our tests that little bit nicer going forward.
-        key, params = decode_msg(data)
-        response_key, return_data = self.ss.process_msg(key[15], **params)
+        for msg in self.stream.feed(data):
+            self.msgReceived(msg)
 
-        # Send acknowledgement message back straight away, this should be keyed the same as the request.
-        self.send_rsp(response_key, return_data)
+    def msgReceived(self, msg):
+        # Actually do the decoding in this function so we can make our tests that little bit nicer going forward.
+        start = timer()
+        key, params = decode_msg(msg)
+        handler_key = key[15]
+        correlation = correlation_id(key)
+
+        self.ss.metrics.record(handler_key, 'decode', timer() - start)
+        self.ss.metrics.incr(handler_key, 'requests')
+
+        if handler_key in self.ss.streamable and params.pop('stream', False):
+            self.stream_rsp(ChunkProducer(self, handler_key, correlation, params))
+        elif self.ss.is_pooled(handler_key, params):
+            d = threads.deferToThreadPool(reactor, self.factory.pool, self.ss.process_encoded, handler_key, self.codec, self.topic, **params)
+            d.addCallback(self.write_rsp, correlation)
+            d.addErrback(self.pooled_failed, handler_key, correlation)
+        else:
+            # Send acknowledgement message back straight away, this should be keyed the same as the request.
+            self.write_rsp(self.ss.process_encoded(handler_key, self.codec, self.topic, **params), correlation)
+
+    def write_rsp(self, rsp, correlation=0):
+        response_key, return_data, encoded_data = rsp
+
+        # Pooled responses can finish after the client has gone away.
+        if not self.connected:
+            return
+
+        start = timer()
+        # Echo the request's correlation id back so the client can match the response up with it.
+        self.transport.writeSequence(correlate(encoded_data, correlation))
+        self.ss.metrics.record(response_key, 'write', timer() - start)
+
+        if response_key == 0x41:
+            self.codec = return_data['codec']
+
+    def stream_rsp(self, producer):
+        self.streams.append(producer)
+        if len(self.streams) == 1:
+            self.transport.registerProducer(producer, False)
+
+    def stream_finished(self):
+        self.transport.unregisterProducer()
+        self.streams.popleft()
+
+        if self.streams and self.connected:
+            self.transport.registerProducer(self.streams[0], False)
+
+    def pooled_failed(self, failure, handler_key, correlation=0):
+        logging.error('Handler 0x{0:02x} failed: {1}'.format(handler_key, failure.getTraceback()))
+
+        # The client is still waiting for a response to this request, don't leave it hanging.
+        rsp = rsp_codes[15]
+        self.write_rsp((handler_key, rsp, self.ss.encode_rsp(handler_key, rsp, self.codec)), correlation)
+
+    def bus_rsp(self, bus, response_key, result):
+        # Messages can be published from any thread (e.g. ingests), only ever write to the socket from the reactor.
+        reactor.callFromThread(self.send_rsp, response_key, result)
 
     def send_rsp(self, response_key, result):
-        encoded_data = encode_msg(response_key, **result)
-        self.transport.write(str(encoded_data))
+        if not self.connected:
+            return
+
+        self.transport.writeSequence(encode_parts(response_key, result, self.codec))
+
+
+@implementer(IPullProducer)
+class ChunkProducer(object):
+    """
+    Streams the results of a paged handler back as a series of messages, one page per message, all with the same
+    key and correlation id as the request. The last one has a null next_cursor. The transport asks for the next page
+    once it has written out the last one, so only a page of the serialised result is ever held in memory.
+    """
+    def __init__(self, screener, handler_key, correlation, params):
+        self.screener = screener
+        self.handler_key = handler_key
+        self.correlation = correlation
+
+        self.params = params
+        self.params.setdefault('limit', cfg.stream_chunk_size())
+        self.finished = False
+
+    def resumeProducing(self):
+        if self.finished:
+            return
+
+        ss = self.screener.ss
+        try:
+            response_key, result = ss.process_msg(self.handler_key, **self.params)
+            encoded = ss.encode_rsp(response_key, result, self.screener.codec)
+        except Exception:
+            logging.exception('Streaming handler 0x{0:02x} failed'.format(self.handler_key))
+            # Finish the stream with an error rather than leave the client waiting for the rest.
+            response_key, result = self.handler_key, rsp_codes[15]
+            encoded = ss.encode_rsp(response_key, result, self.screener.codec)
+
+        self.screener.write_rsp((response_key, result, encoded), self.correlation)
+
+        # Errors don't have a next_cursor either, so they finish the stream too.
+        self.params['cursor'] = result.get('next_cursor')
+        if self.params['cursor'] is None:
+            self.finished = True
+            self.screener.stream_finished()
+
+    def stopProducing(self):
+        self.finished = True
 
 
 class ScreenerFactory(protocol.Factory):
+    def __init__(self, screen_server=None, pool=None):
+        """
+        Args:
+            screen_server (ScreenServer, None): The screen to serve, one is created when the factory starts if not given.
+            pool (ThreadPool, None): Handler thread pool shared with other factories, we start our own if not given.
+        """
+        self.ss = screen_server
+        self.own_screen = screen_server is None
+        self.pool = pool
+        self.own_pool = pool is None
+
     def startFactory(self):
         self.clients = set()
 
-        logging.info('Instantiating ScreenServer()')
-        # We want a singleton instance of the screen server so we persist storage of assets between calls.
+        if self.ss is None:
+            logging.info('Instantiating ScreenServer()')
+            # We want a singleton instance of the screen server so we persist storage of assets between calls.
+
+            paths = {
+                "incoming": cfg.incoming_path(),
+                "assets": cfg.assets_path(),
+                "ingest": cfg.ingest_path(),
+                "playlists": cfg.playlists_path()
+            }
+            self.ss = ScreenServer(paths=paths)
+
+        if self.own_screen:
+            self.ftp_pool_loop = maintain_ftp_pool(self.ss.content.ftp_pool)
 
-        paths = {
-            "incoming": cfg.incoming_path(),
-            "assets": cfg.assets_path(),
-            "ingest": cfg.ingest_path(),
-            "playlists": cfg.playlists_path()
-        }
-        self.ss = ScreenServer(paths=paths)
+        # Threads for the slow handlers, see ScreenServer.pooled
+        if self.own_pool:
+            self.pool = ThreadPool(minthreads=1, maxthreads=cfg.handler_threads(), name='Handlers')
+            self.pool.start()
 
     def stopFactory(self):
         # Force disconnect any remaining clients, apologies.
         for c in self.clients:
             c.transport.loseConnection()
 
+        if self.own_pool:
+            self.pool.stop()
+
+        # Let the ingests in progress finish and the last changes to the pending ones be written out.
+        if self.own_screen:
+            self.ftp_pool_loop.stop()
+            self.ss.content.stop(5)
+
     def buildProtocol(self, addr):
         return Screener(self.ss, self)
 
 
+def build_screens(count):
+    """
+    Builds factories for a number of screens all hosted in this process. Each screen has its own playlists,
+    playback and schedule but they all share one content store (and its ingest queue), message bus and handler
+    thread pool, so an extra screen costs very little.
+
+    Returns:
+        A list of ScreenerFactory, one for each screen.
+    """
+    bus = Bus()
+    changelog = ChangeLog(cfg.changelog_size())
+    content = build_content({"incoming": cfg.incoming_path(), "assets": cfg.assets_path(), "ingest": cfg.ingest_path()}, bus)
+
+    pool = ThreadPool(minthreads=1, maxthreads=cfg.handler_threads(), name='Handlers')
+    pool.start()
+    reactor.addSystemEventTrigger('after', 'shutdown', pool.stop)
+
+    # Once for the process, the content is shared by all the screens.
+    loop = maintain_ftp_pool(content.ftp_pool)
+    reactor.addSystemEventTrigger('before', 'shutdown', loop.stop)
+    reactor.addSystemEventTrigger('before', 'shutdown', content.stop, 5)
+
+    factories = []
+    for screen in xrange(1, count + 1):
+        paths = {"playlists": os.path.join(cfg.playlists_path(), 'screen_{0}'.format(screen))}
+        create_dirs(paths["playlists"])
+
+        screen_server = ScreenServer(paths=paths, content=content, bus=bus, changelog=changelog)
+        factories.append(ScreenerFactory(screen_server=screen_server, pool=pool))
+
+    return factories
+
+
+class MetricsDump(protocol.Protocol):
+    """
+    Writes out a plain text dump of the metrics and hangs up, e.g. nc localhost 9501
+    """
+    def connectionMade(self):
+        factories = self.factory.screener_factories
+        for screen, screener_factory in enumerate(factories, 1):
+            if len(factories) > 1:
+                self.transport.write('# screen {0}\n'.format(screen))
+            self.transport.write(screener_factory.ss.metrics.dump())
+
+        self.transport.loseConnection()
+
+
+class MetricsFactory(protocol.Factory):
+    protocol = MetricsDump
+
+    def __init__(self, screener_factories):
+        self.screener_factories = screener_factories
+
+
 def setup_logging():
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
@@ -164,7 +713,17 @@ if __name__ == '__main__':
     setup_logging()
 
     logging.info('Setting up Screener')
-    reactor.listenTCP(cfg.screener_port(), ScreenerFactory(), interface=cfg.screener_host())
-
-    logging.info('Serving on localhost:{0}'.format(cfg.screener_port()))
+    if cfg.screens() > 1:
+        screener_factories = build_screens(cfg.screens())
+    else:
+        screener_factories = [ScreenerFactory()]
+
+    # Each screen listens on the next port along.
+    for screen, screener_factory in enumerate(screener_factories):
+        reactor.listenTCP(cfg.screener_port() + screen, screener_factory, interface=cfg.screener_host())
+        logging.info('Serving screen {0} on localhost:{1}'.format(screen + 1, cfg.screener_port() + screen))
+
+    if cfg.metrics_port():
+        reactor.listenTCP(cfg.metrics_port(), MetricsFactory(screener_factories), interface='127.0.0.1')
+        logging.info('Serving metrics on localhost:{0}'.format(cfg.metrics_port()))
     reactor.run()
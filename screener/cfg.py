@@ -9,6 +9,24 @@ from screener.lib import config as c
 config_file = c.OptionStr('app', 'config_file', os.path.join(os.path.dirname(__file__), 'screener.cfg'), False, False)
 screener_host = c.OptionStr('app', 'host', '0.0.0.0', description='The listen address for Screener. It will listen on all available network addresses if set to 0.0.0.0')
 screener_port = c.OptionNum('app', 'port', 9500, description='The port that the Screener socket listens on.')
+screens = c.OptionNum('app', 'screens', 1, minval=1, description='The number of screens to emulate in this process. Screen n listens on port + n - 1, they all share the same content.')
+metrics_port = c.OptionNum('app', 'metrics_port', 0, description='Local port to serve a plain text dump of the request metrics on, 0 to turn it off.')
+handler_threads = c.OptionNum('app', 'handler_threads', 4, minval=1, description='The maximum number of threads used to run slow requests (e.g. get_cpls) off the main thread.')
+rsp_cache_size = c.OptionNum('app', 'rsp_cache_size', 1024, minval=1, description='The maximum number of encoded responses to keep cached for read only requests.')
+stream_chunk_size = c.OptionNum('app', 'stream_chunk_size', 100, minval=1, description='The number of items sent in each message of a streamed response unless the client asks for a different limit.')
+ingest_workers = c.OptionNum('app', 'ingest_workers', 2, minval=1, description='The number of DCPs that can be ingested at the same time.')
+ingest_per_host = c.OptionNum('app', 'ingest_per_host', 1, minval=1, description='The number of DCPs that can be ingested at the same time from any one FTP server.')
+ingest_connections = c.OptionNum('app', 'ingest_connections', 4, minval=1, description='The number of FTP sessions each ingest downloads over at once.')
+ingest_segment_size = c.OptionNum('app', 'ingest_segment_size', 256, minval=1, description='MXF files bigger than this many MB are downloaded in segments over several FTP sessions at once.')
+ftp_listing_ttl = c.OptionNum('app', 'ftp_listing_ttl', 60, minval=0, description='The number of seconds to remember FTP directory listings for, so DCPs on the same server are quicker to find.')
+ftp_pool_size = c.OptionNum('app', 'ftp_pool_size', 8, minval=0, description='The most idle FTP sessions to keep logged in for the next ingest.')
+ftp_idle_timeout = c.OptionNum('app', 'ftp_idle_timeout', 60, minval=0, description='The number of seconds to keep an idle FTP session open before hanging up on it.')
+ingest_bandwidth = c.OptionNum('app', 'ingest_bandwidth', 0, minval=0, description='The most KB/s all ingests together can download at, 0 for no limit.')
+ingest_bandwidth_profile = c.OptionStr('app', 'ingest_bandwidth_profile', '', description='Different limits for all ingests together at different times of day as HH:MM-HH:MM=KB/s, comma separated e.g. 12:00-23:30=2048 to hold back during show hours. ingest_bandwidth applies outside these.')
+ingest_bandwidth_per_ingest = c.OptionNum('app', 'ingest_bandwidth_per_ingest', 0, minval=0, description='The most KB/s each ingest can download at, 0 for no limit.')
+ingest_progress_rate = c.OptionNum('app', 'ingest_progress_rate', 2, minval=1, description='The most times a second each ingest sends out how far its download has got.')
+ingest_hash_workers = c.OptionNum('app', 'ingest_hash_workers', 2, minval=0, description='The number of threads to check downloaded files against the PKL hashes on, 0 to hash on the download threads.')
+changelog_size = c.OptionNum('app', 'changelog_size', 10000, minval=1, description='The number of recent changes kept for clients catching up with get_changes_since, older ones need a full resync.')
 
 incoming_path = c.OptionStr('storage', 'incoming_path', os.path.join(os.path.dirname(__file__), 'INCOMING'))
 assets_path = c.OptionStr('storage', 'assets_path', os.path.join(os.path.dirname(__file__), 'ASSETS'))
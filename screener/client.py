@@ -2,11 +2,20 @@
 A basic testing client for the Screener app
 '''
 import socket, json, traceback, time
+from collections import deque
 from datetime import datetime
-from threading import Thread, RLock
+from itertools import count
+from Queue import Queue
+from threading import Thread, RLock, Lock, Event
 
-import klv
-from screener.lib.util import bytes_to_str, encode_msg, decode_msg
+from screener.lib.codec import JSON, CodecError
+from screener.lib.util import bytes_to_str, encode_parts, decode_msg, msg_length, correlation_id
+
+# Starting size of the receive buffer, it grows if a single message won't fit in it.
+RECV_BUFFER_SIZE = 64 * 1024
+
+# How many unsolicited messages (e.g. ingest progress) we'll hold on to before we stop reading from the socket.
+INBOUND_QUEUE_SIZE = 1000
 
 """
 Core communication methods to and from the server.
@@ -20,40 +29,199 @@ class CommMixin(object):
         self.host = host
         self.port = port
 
+        # Changed once the server has agreed to a different codec, see System.negotiate_codec()
+        self.codec = JSON
+
+        # Lots of threads can be sending at once, make sure their messages don't get interleaved.
+        self.send_lock = Lock()
+
+        # Everything we read goes straight into buf, data we haven't handed out yet is buf[start:end].
+        self.buf = bytearray(RECV_BUFFER_SIZE)
+        self.view = memoryview(self.buf)
+        self.start = self.end = 0
+
+        # Complete messages we've read off the socket but not handed out yet.
+        self.msgs = deque()
+
         self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.s.connect((self.host, self.port,))
 
-        return self
-
     def close(self, *args):
+        # Shut it down first so a thread blocked reading from the socket wakes up.
+        try:
+            self.s.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
         self.s.close()
 
     def send_msg(self, handler_key, **kwargs):
-        msg = encode_msg(handler_key, **kwargs)
-        self.s.sendall(msg)
+        self.send(handler_key, kwargs)
+
+    def send(self, handler_key, kwargs, correlation=0):
+        # One send, splitting the header and body across two packets would leave us waiting on delayed ACKs.
+        msg = ''.join(encode_parts(handler_key, kwargs, self.codec, correlation))
+        with self.send_lock:
+            self.s.sendall(msg)
+
+    def recv_rsp(self):
+        """
+        Reads the next message from the socket. Whatever else comes in on the same read is held on to for the next
+        call rather than going back to the socket for each message.
+        """
+        if not self.msgs:
+            self.msgs.extend(self.recv_msgs())
+
+        return decode_msg(self.msgs.popleft())
 
-    def recv_rsp(self, key_len=16, length_len=4):
+    def recv_msgs(self):
         """
-        The key is a a fixed size with the value length parameter variable but up to 4 bytes. Therefore read the first 20
-        bytes to determine to value length and read the rest of the value for the socket into rsp and return it for processing.
+        Reads from the socket straight into the receive buffer until there's at least one complete message in it
+        and returns all of the complete messages as memoryviews onto the buffer, so nothing gets copied. The views
+        are only good until the next call, which reuses the space.
         """
-        rsp = bytearray(self.s.recv(key_len + length_len))
-        val_length, ber_length = klv.decode_ber(rsp[key_len:])
-        rsp += bytearray(self.s.recv(val_length - (4 - ber_length)))
+        while True:
+            msgs = []
+            while True:
+                length = msg_length(self.buf, self.start, end=self.end)
+                if length is None or self.end - self.start < length:
+                    break
+                msgs.append(self.view[self.start:self.start + length])
+                self.start += length
+
+            if msgs:
+                return msgs
+
+            self.make_room(length)
+            n = self.s.recv_into(self.view[self.end:])
+            if not n:
+                raise socket.error('Connection closed by the server')
+            self.end += n
+
+    def make_room(self, length):
+        # Move the partial message we're left with to the front of the buffer, it's normally only a few bytes.
+        pending = self.end - self.start
+        if self.start:
+            self.buf[:pending] = self.buf[self.start:self.end]
+            self.start, self.end = 0, pending
+
+        # Swap in a bigger buffer if the message won't fit (or we can't even tell how long it is yet). Resizing
+        # the bytearray in place isn't allowed while there are views onto it.
+        if (length or 0) > len(self.buf) or self.end == len(self.buf):
+            buf = bytearray(max(len(self.buf) * 2, length or 0))
+            buf[:pending] = self.buf[:pending]
+            self.buf, self.view = buf, memoryview(buf)
+
+
+class RequestTimeout(Exception):
+    pass
+
+
+class Future(object):
+    """
+    The response to a request that is still on its way back from the server, see Client.request().
+    """
+    def __init__(self, handler_key):
+        self.handler_key = handler_key
+        self.finished = Event()
+        self.value = None
+        self.error = None
+        self.callbacks = []
+        self.lock = Lock()
+
+    def done(self):
+        return self.finished.is_set()
+
+    def finished_by(self, value):
+        return True
+
+    def result(self, timeout=None):
+        """
+        Blocks until the response turns up (or timeout seconds go by) and returns it.
+        """
+        if not self.finished.wait(timeout):
+            raise RequestTimeout('No response to 0x{0:02x} after {1}s'.format(self.handler_key, timeout))
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def add_done_callback(self, fn):
+        # Callbacks get called with the future from the thread reading the socket, so keep them short.
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, value):
+        self.value = value
+        self.finish()
+
+    def set_exception(self, error):
+        self.error = error
+        self.finish()
+
+    def finish(self):
+        with self.lock:
+            self.finished.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+class Stream(object):
+    """
+    The pages of a streamed response as they come in, see Client.stream(). Iterate over it to get them in order,
+    it stops after the last page (the one with a null next_cursor).
+    """
+    def __init__(self, handler_key):
+        self.handler_key = handler_key
+        self.pages = Queue()
+
+    def finished_by(self, value):
+        return value.get('next_cursor') is None
+
+    def set_result(self, value):
+        self.pages.put(value)
+
+    def set_exception(self, error):
+        self.pages.put(error)
 
-        return decode_msg(rsp)
+    def __iter__(self):
+        while True:
+            page = self.pages.get()
+            if isinstance(page, Exception):
+                raise page
+
+            yield page
+            if self.finished_by(page):
+                return
 
 
 class Client(CommMixin):
     """
     Deal with high level, app specific details of the implementation of the client.
+
+    Requests made with request() are tagged with a correlation id and hand back a Future, so any number of them
+    can be in flight on the one connection. Everything else the server sends us (responses to send_msg() and
+    messages the server pushes to us) goes on a bounded queue and is handed to rsp_handlers from there.
     """
     def __init__(self, *args, **kwargs):
+        inbound_size = kwargs.pop('inbound_size', INBOUND_QUEUE_SIZE)
         super(Client, self).__init__(*args, **kwargs)
 
         # Just used for testing, make sure that only one thread can write to the console at any one time.
         self.out_lock = RLock()
 
+        # correlation id -> Future for every request we haven't had a response to yet.
+        self.correlation_ids = count(1)
+        self.pending = {}
+        self.pending_lock = Lock()
+
+        # Why we stopped reading from the socket, once we have.
+        self.error = None
+
+        self.inbound = Queue(maxsize=inbound_size)
+
         self.playback = Playback(self)
         self.content = Content(self)
         self.system = System(self)
@@ -62,20 +230,99 @@ class Client(CommMixin):
             0x04: self.content.get_cpl_uuids_rsp,
             0x06: self.content.ingest_rsp,
             0x07: self.content.get_ingests_info_rsp,
-            0x08: self.content.get_ingest_info_rsp
+            0x08: self.content.get_ingest_info_rsp,
+            0x41: self.system.negotiate_codec_rsp,
+            0x43: self.system.change_rsp
         }
 
-        # Kick off a background thread to handle and messages that come back from the screen server.
-        self.rsp_thread = Thread(target=self.process_rsp, args=(self.rsp_handlers,), name='ProcessResponse')
+        # Kick off a background thread to read everything that comes back from the screen server and another to
+        # deal with the messages nobody is waiting on.
+        self.rsp_thread = Thread(target=self.process_rsp, name='ProcessResponse')
         self.rsp_thread.daemon = True
         self.rsp_thread.start()
 
-    def process_rsp(self, rsp_handlers):
-        # This function runs continuously and will read anything back from the socket and process it.
-        k, v = self.recv_rsp()
+        self.dispatch_thread = Thread(target=self.dispatch_rsp, args=(self.rsp_handlers,), name='DispatchResponse')
+        self.dispatch_thread.daemon = True
+        self.dispatch_thread.start()
 
-        # @todo: Implement a back-pressure queue to avoid potentially lost messages from the server.
-        rsp_handlers[k[15]](**v)
+    def request(self, handler_key, **kwargs):
+        """
+        Sends a request and returns a Future for the response without waiting for it.
+        """
+        return self.send_tagged(Future(handler_key), kwargs)
+
+    def stream(self, handler_key, **kwargs):
+        """
+        Asks for a collection (e.g. get_cpls) to be streamed back a page at a time and returns a Stream of the pages.
+        """
+        kwargs['stream'] = True
+        return self.send_tagged(Stream(handler_key), kwargs)
+
+    def send_tagged(self, future, kwargs):
+        handler_key = future.handler_key
+
+        # Ids wrap round before they overflow the 4 bytes in the key, skipping 0 which means untagged.
+        correlation = next(self.correlation_ids) % 0xffffffff + 1
+        with self.pending_lock:
+            if self.error is not None:
+                future.set_exception(self.error)
+                return future
+            self.pending[correlation] = future
+
+        try:
+            self.send(handler_key, kwargs, correlation)
+        except socket.error as e:
+            with self.pending_lock:
+                self.pending.pop(correlation, None)
+            future.set_exception(e)
+
+        return future
+
+    def process_rsp(self):
+        # This function runs continuously and will read anything back from the socket and process it.
+        try:
+            while True:
+                k, v = self.recv_rsp()
+
+                with self.pending_lock:
+                    correlation = correlation_id(k)
+                    future = self.pending.get(correlation)
+
+                    # Streams get a response per page, everything else just the one.
+                    if future is not None and future.finished_by(v):
+                        del self.pending[correlation]
+
+                if future is not None:
+                    future.set_result(v)
+                else:
+                    # Blocks when the queue is full, so we stop reading and TCP pushes back on the server rather
+                    # than us dropping messages on the floor.
+                    self.inbound.put((k[15], v))
+        except (socket.error, CodecError) as e:
+            # Connection's gone (or the server's sending rubbish), nobody is getting a response now.
+            with self.pending_lock:
+                self.error = e
+                pending, self.pending = self.pending, {}
+            for future in pending.itervalues():
+                future.set_exception(e)
+        finally:
+            self.inbound.put(None)
+
+    def dispatch_rsp(self, rsp_handlers):
+        while True:
+            item = self.inbound.get()
+            if item is None:
+                return
+
+            handler_key, v = item
+            if handler_key not in rsp_handlers:
+                continue
+
+            try:
+                rsp_handlers[handler_key](**v)
+            except Exception:
+                with self.out_lock:
+                    print traceback.format_exc()
 
 """
 Potenital Response Messages
@@ -94,10 +341,24 @@ class ContentResponseMixin(object):
         with self.c.out_lock:
             print u'DCP Info (should be a list): ', info
 
-    def get_ingest_info_rsp(self, info):
+    def get_ingest_info_rsp(self, **info):
+        # Comes back in response to get_ingest_info() and whenever the state of one of our ingests changes.
         with self.c.out_lock:
             print u'DCP Info: ', info
 
+class SystemResponseMixin(object):
+    def negotiate_codec_rsp(self, codec, *args, **kwargs):
+        # Everything we send from here on should use the codec the server picked.
+        self.c.codec = codec
+
+        with self.c.out_lock:
+            print u'Codec negotiated: {0}'.format(codec)
+
+    def change_rsp(self, **change):
+        # Comes back in response to subscribe() and whenever something we've subscribed to changes.
+        with self.c.out_lock:
+            print u'Change: ', change
+
 """
 Available Client Actions
 """
@@ -120,17 +381,38 @@ class Playback(ClientAPI):
     def pause(self):
         self.c.send_msg(0x05)
 
-class System(ClientAPI):
+class System(ClientAPI, SystemResponseMixin):
     def system_time(self):
         self.c.send_msg(0x03)
 
+    def negotiate_codec(self, codecs):
+        # codecs is the list of codecs we understand in order of preference, e.g. [1, 0] for MessagePack then JSON.
+        self.c.send_msg(0x41, codecs=codecs)
+
+    def get_metrics(self, reset=False):
+        self.c.send_msg(0x42, reset=reset)
+
+    def subscribe(self, events):
+        # e.g. ["content", "playlists"], changes to those are pushed to us from then on. [] to stop.
+        self.c.send_msg(0x43, events=events)
+
+    def get_changes_since(self, version, log_id=None):
+        return self.c.request(0x44, version=version, log_id=log_id)
+
+    def batch(self, requests):
+        # requests is a list of [handler_key, kwargs] pairs, all of the results come back in one response.
+        self.c.send_msg(0x40, requests=requests)
+
 class Content(ClientAPI, ContentResponseMixin):
     def get_cpl_uuids(self):
         self.c.send_msg(0x04)
 
-    def ingest(self, connection_details, dcp_path):
+    def get_cpls(self, cpl_uuids=None, limit=None, cursor=None):
+        return self.c.request(0x30, cpl_uuids=cpl_uuids, limit=limit, cursor=cursor)
+
+    def ingest(self, connection_details, dcp_path, priority=0):
         # Sends the ingest DCP command to screener, returns the ingest queue uuid.
-        self.c.send_msg(0x06, connection_details=connection_details, dcp_path=dcp_path)
+        self.c.send_msg(0x06, connection_details=connection_details, dcp_path=dcp_path, priority=priority)
 
     def get_ingests_info(self, ingest_uuids):
         self.c.send_msg(0x07, ingest_uuids=ingest_uuids)
@@ -139,16 +421,16 @@ class Content(ClientAPI, ContentResponseMixin):
         self.c.send_msg(0x08, ingest_uuid=ingest_uuid)
 
     def cancel_ingest(self, ingest_uuid):
-        rsp = self.send(0x32, ingest_uuid=ingest_uuid)
-        return self.decode_rsp(rsp)
+        return self.c.request(0x32, ingest_uuid=ingest_uuid)
 
-    def get_ingest_history(self):
-        rsp = self.send(0x33)
-        return self.decode_rsp(rsp)
+    def get_ingest_history(self, limit=None, cursor=None):
+        return self.c.request(0x33, limit=limit, cursor=cursor)
 
     def clear_ingest_history(self):
-        rsp = self.send(0x34)
-        return self.decode_rsp(rsp)
+        return self.c.request(0x34)
+
+    def set_ingest_bandwidth(self, rate=None, ingest_uuid=None):
+        return self.c.request(0x35, rate=rate, ingest_uuid=ingest_uuid)
 
 if __name__ == '__main__':
     try:
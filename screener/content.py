@@ -1,19 +1,38 @@
+from collections import OrderedDict
 from uuid import uuid4
-from threading import Thread, RLock
-import datetime, os, logging, time
-
-from screener.lib.util import IndexableQueue, create_dirs
-from screener.dcp import DCPDownloader, repackage_dcp
+from threading import Thread, RLock, Condition
+import os, shutil, logging, time
+
+from screener.lib.util import FairQueue, Versioned, create_dirs, paginate, save_json, load_json
+from screener.lib.ratelimit import TokenBucket, ScheduledBucket, Profile
+from screener.lib.progress import Progress
+from screener.dcp import DCPDownloader, FTPPool, ListingCache, HashPool, HashMismatchError, repackage_dcp, \
+    verify_hashes, clear_checkpoint
 from screener import rsp_codes
 from smpteparsers.dcp import DCP
 
-QUEUED, INGESTING, INGESTED, CANCELLED = range(4)
+QUEUED, INGESTING, INGESTED, CANCELLED, FAILED, HASH_MISMATCH = range(6)
+
+def ftp_host(connection_details):
+    """
+    The FTP server an ingest comes from, ingests are shared out fairly between these.
+    """
+    connection_details = connection_details or {}
+    return '{0}:{1}'.format(connection_details.get('host'), connection_details.get('port') or 21)
 
-class Content(object):
+class Content(Versioned):
+    event = 'content'
 
-    def __init__(self, incoming_path=None, assets_path=None, ingest_path=None):
+    def __init__(self, incoming_path=None, assets_path=None, ingest_path=None, bus=None, workers=1, per_host=1,
+                 ftp_connections=1, segment_size=None, listing_ttl=60, ftp_pool_size=8, ftp_idle_timeout=60,
+                 bandwidth=0, bandwidth_profile='', bandwidth_per_ingest=0, progress_rate=2, hash_workers=0):
         logging.info('Instantiating Content()')
 
+        # Ingest progress is published on here, to the topic of the client that asked for the ingest and to
+        # ingest_topic for anyone that has subscribed to hear about every ingest.
+        self.bus = bus
+        self.ingest_topic = None
+
         self.content = {}
         self.content_lock = RLock()
 
@@ -29,10 +48,57 @@ class Content(object):
         self.ingest_path = ingest_path
         create_dirs(self.ingest_path)
 
-        self.ingest_queue = IndexableQueue()
-        self.ingest_thread = Thread(target=self.process_ingests, name='ProcessIngests')
-        self.ingest_thread.daemon = True
-        self.ingest_thread.start()
+        # Ingests are handed out round robin between FTP hosts, at most per_host from one host at a time and at most
+        # workers altogether.
+        self.ingest_queue = FairQueue(per_host)
+
+        # How each DCP is downloaded, see DCPDownloader.
+        self.ftp_connections = ftp_connections
+        self.segment_size = segment_size
+        # Shared by all the workers so DCPs on the same server don't each have to list it again, or log in again.
+        self.listing_cache = ListingCache(listing_ttl)
+        self.ftp_pool = FTPPool(ftp_pool_size, ftp_idle_timeout)
+        # Files are hashed on these threads (shared by all the workers) as they download, or on the download
+        # threads themselves if there aren't any.
+        self.hash_pool = HashPool(hash_workers) if hash_workers else None
+
+        # Download speed limits in KB/s (0 for none), one for all ingests together that follows bandwidth_profile
+        # through the day and one for each queued or in progress ingest, see set_ingest_bandwidth()
+        self.bandwidth = ScheduledBucket(Profile(bandwidth_profile), bandwidth, scale=1024)
+        self.bandwidth_per_ingest = bandwidth_per_ingest
+        self.ingest_bandwidth = {}
+
+        # How each ingest in progress is getting on (ingest_uuid -> (item, Progress)), published at most
+        # progress_rate times a second for each.
+        self.ingest_progress = {}
+        self.progress_rate = progress_rate
+
+        # Ingests that are queued or in progress are kept on disk (guarded by ingest_history_lock) so they can be
+        # picked up again after a restart, the downloads carry on from their checkpoints. They're written out on a
+        # thread of their own so nobody (the reactor in particular) waits on the disk, see save_pending_ingests()
+        self.pending_ingests = OrderedDict()
+        self.pending_ingests_path = os.path.join(self.incoming_path, 'ingests.json')
+        # How many times they've changed and how many of those changes have been written out.
+        self.pending_changes = 0
+        self.pending_saved = 0
+        self.pending_saving = Condition()
+        # Set by stop(), the writer goes once everything's been written out.
+        self.pending_stopped = False
+
+        self.pending_writer = Thread(target=self.write_pending_ingests, name='PendingIngestWriter')
+        self.pending_writer.daemon = True
+        self.pending_writer.start()
+
+        for ingest in load_json(self.pending_ingests_path, []):
+            logging.info('Resuming ingest of "{0}"'.format(ingest['dcp_path']))
+            self.queue_ingest(ingest['ftp_details'], ingest['dcp_path'], ingest['priority'], ingest_uuid=ingest['ingest_uuid'])
+
+        self.ingest_threads = []
+        for worker in xrange(1, workers + 1):
+            thread = Thread(target=self.process_ingests, args=(worker,), name='IngestWorker-{0}'.format(worker))
+            thread.daemon = True
+            thread.start()
+            self.ingest_threads.append(thread)
 
         # Scan the ingest_path for existing content and load it into memory.
         if self.ingest_path is not None:
@@ -44,51 +110,211 @@ class Content(object):
                     for uuid, cpl in dcp.cpls.iteritems():
                         self.content[uuid] = cpl
 
-    def process_ingests(self, interval=1):
-        logging.info('Starting ingest queue processing thread.')
+    def process_ingests(self, worker):
+        logging.info('Starting ingest worker {0}.'.format(worker))
         while True:
-            if not self.ingest_queue.empty():
+            # Sleeps until there's an ingest this worker is allowed to start, or the queue is closed by stop()
+            job = self.ingest_queue.get()
+            if job is None:
+                logging.info('Stopping ingest worker {0}.'.format(worker))
+                return
+            host, ingest_uuid, item = job
+            try:
+                self.update_ingest_history(ingest_uuid, INGESTING, item.get('reply_to'), worker=worker)
+                self.ingest_dcp(ingest_uuid, item)
+                self.update_ingest_history(ingest_uuid, INGESTED, item.get('reply_to'), worker=worker)
+            except HashMismatchError as e:
+                logging.error('Ingest {0} failed verification'.format(ingest_uuid))
+                self.update_ingest_history(ingest_uuid, HASH_MISMATCH, item.get('reply_to'), worker=worker,
+                                           error=str(e), files=e.paths)
+            except Exception as e:
+                # One bad DCP (or FTP server) mustn't take the worker down with it.
+                logging.exception('Ingest {0} failed'.format(ingest_uuid))
+                self.update_ingest_history(ingest_uuid, FAILED, item.get('reply_to'), worker=worker, error=str(e))
+            finally:
+                self.forget_ingest(ingest_uuid)
+                # Let the next one from this host go.
+                self.ingest_queue.task_done(host)
+
+    def ingest_dcp(self, ingest_uuid, item):
+        logging.info('Downloading "{0}" from the ingest queue'.format(item['dcp_path']))
+        def on_update(snapshot):
+            self.publish_progress(ingest_uuid, snapshot, item.get('reply_to'))
+
+        progress = Progress(on_update=on_update, interval=1.0 / self.progress_rate)
+        with self.ingest_history_lock:
+            self.ingest_progress[ingest_uuid] = (item, progress)
+
+        with DCPDownloader(self.incoming_path, item['ftp_details'], self.ftp_connections, self.segment_size,
+                           self.listing_cache, self.ftp_pool, self.limiters(ingest_uuid),
+                           self.hash_pool) as dcp_downloader:
+            local_dcp_path = dcp_downloader.download(item['dcp_path'], progress)
+
+        logging.info('Parsing DCP "{0}"'.format(local_dcp_path))
+        incoming_dcp = DCP(local_dcp_path)
+
+        mismatched = verify_hashes(incoming_dcp, dcp_downloader.digests())
+        if mismatched:
+            # Don't keep any of it, otherwise trying again would pick up from the checkpoint with the same files.
+            shutil.rmtree(local_dcp_path)
+            clear_checkpoint(self.incoming_path, item['dcp_path'])
+            raise HashMismatchError(mismatched)
+
+        # Now we have the DCP downloaded and parsed, but it could contain multiple CPLs so let's mirror
+        # the TMS setup and repackage the DCP into multiple ones, one for each CPL.
+        cpl_dcp_paths = repackage_dcp(incoming_dcp, assets_path=self.assets_path, ingest_path=self.ingest_path)
+        repackaged_dcps = []
+        for path in cpl_dcp_paths:
+            repackaged_dcps.append(DCP(path))
+
+        # Finally add all CPLs to content store
+        added, updated = [], []
+        with self.content_lock:
+            for dcp in repackaged_dcps:
+                for uuid, cpl in dcp.cpls.iteritems():
+                    (updated if uuid in self.content else added).append(uuid)
+                    self.content[uuid] = cpl
+            self.changed(added=added, updated=updated)
 
-                ingest_uuid, item = self.ingest_queue.get()
-                self.update_ingest_history(ingest_uuid, INGESTING)
+        clear_checkpoint(self.incoming_path, item['dcp_path'])
 
-                logging.info('Downloading "{0}" from the ingest queue'.format(item['dcp_path']))
-                with DCPDownloader(self.incoming_path, item['ftp_details']) as dcp_downloader:
-                    local_dcp_path = dcp_downloader.download(item['dcp_path'])
+    def limiters(self, ingest_uuid):
+        with self.ingest_history_lock:
+            limiter = self.ingest_bandwidth.get(ingest_uuid)
+        return [self.bandwidth] if limiter is None else [self.bandwidth, limiter]
 
-                logging.info('Parsing DCP "{0}"'.format(local_dcp_path))
-                incoming_dcp = DCP(local_dcp_path)
+    def save_pending_ingests(self):
+        """
+        Has the pending ingests written out, doesn't wait for it to happen. Lots of changes in quick succession are
+        written out together.
+        """
+        with self.pending_saving:
+            self.pending_changes += 1
+            self.pending_saving.notify_all()
 
-                # Now we have the DCP downloaded and parsed, but it could contain multiple CPLs so let's mirror
-                # the TMS setup and repackage the DCP into multiple ones, one for each CPL.
-                cpl_dcp_paths = repackage_dcp(incoming_dcp, assets_path=self.assets_path, ingest_path=self.ingest_path)
-                repackaged_dcps = []
-                for path in cpl_dcp_paths:
-                    repackaged_dcps.append(DCP(path))
+    def write_pending_ingests(self):
+        while True:
+            with self.pending_saving:
+                while self.pending_saved == self.pending_changes and not self.pending_stopped:
+                    self.pending_saving.wait()
+                if self.pending_saved == self.pending_changes:
+                    return
+                changes = self.pending_changes
 
-                # Finally add all CPLs to content store
-                with self.content_lock:
-                    for dcp in repackaged_dcps:
-                        for uuid, cpl in dcp.cpls.iteritems():
-                            self.content[uuid] = cpl
+            # Anything that changes after this gets written out next time round.
+            with self.ingest_history_lock:
+                pending = self.pending_ingests.values()
 
-                self.update_ingest_history(ingest_uuid, INGESTED)
+            try:
+                save_json(self.pending_ingests_path, pending)
+            except (IOError, OSError):
+                # Not the end of the world, they just won't be picked up again after a restart.
+                logging.exception('Unable to save the pending ingests')
 
-                # Release the task from the queue, we can move on, yay!
-                self.ingest_queue.task_done()
+            with self.pending_saving:
+                self.pending_saved = changes
+                self.pending_saving.notify_all()
 
-            time.sleep(interval)
+    def flush_pending_ingests(self, timeout=None):
+        """
+        Waits for the pending ingests as they are now to be written out.
+
+        Returns:
+            True if they have been, False if timeout ran out first.
+        """
+        with self.pending_saving:
+            changes = self.pending_changes
+            end = None if timeout is None else time.time() + timeout
+            while self.pending_saved < changes:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.pending_saving.wait(remaining)
+            return True
+
+    def stop(self, timeout=5):
+        """
+        Stops the ingest workers once they've finished the ingests they're on (the queued ones stay on disk for next
+        time), then the hashing and pending ingest writer threads, and hangs up on the idle FTP sessions. Waits up to
+        timeout seconds altogether, the threads are left to finish on their own after that.
+        """
+        end = time.time() + timeout
+        self.ingest_queue.close()
+        for thread in self.ingest_threads:
+            thread.join(max(0, end - time.time()))
+
+        # A worker still downloading needs its hashers.
+        if self.hash_pool is not None and not any(thread.is_alive() for thread in self.ingest_threads):
+            self.hash_pool.stop(max(0, end - time.time()))
+
+        with self.pending_saving:
+            self.pending_stopped = True
+            self.pending_saving.notify_all()
+        self.pending_writer.join(max(0, end - time.time()))
+
+        self.ftp_pool.clear()
+
+    def forget_ingest(self, ingest_uuid):
+        with self.ingest_history_lock:
+            self.ingest_bandwidth.pop(ingest_uuid, None)
+            self.ingest_progress.pop(ingest_uuid, None)
+            if self.pending_ingests.pop(ingest_uuid, None) is not None:
+                self.save_pending_ingests()
 
-    def update_ingest_history(self, ingest_uuid, state):
+    def update_ingest_history(self, ingest_uuid, state, reply_to=None, **info):
+        """
+        Records an ingest moving to a new state, info (e.g. the worker doing the ingest) is kept with it.
+        """
         with self.ingest_history_lock:
             if ingest_uuid not in self.ingest_history:
                 self.ingest_history[ingest_uuid] = []
 
-            timestamp = datetime.datetime.now()
-            self.ingest_history[ingest_uuid].append({"timestamp": timestamp, "state": state})
+            # Seconds since the epoch like system_time(), a datetime can't be sent back to the client.
+            timestamp = time.time()
+            entry = dict(info, timestamp=timestamp, state=state)
+            self.ingest_history[ingest_uuid].append(entry)
 
             logging.info("Ingest state updated: {0} - {1} - {2}".format(ingest_uuid, state, timestamp))
 
+        # Let the client that asked for the ingest know how it's getting on.
+        if self.bus is not None and reply_to is not None:
+            self.bus.publish(reply_to, 0x08, dict(info, status=0, ingest_uuid=ingest_uuid, state=state))
+        if self.bus is not None and self.ingest_topic is not None:
+            self.bus.publish(self.ingest_topic, dict(info, event="ingest", ingest_uuid=ingest_uuid, state=state))
+
+    def publish_progress(self, ingest_uuid, progress, reply_to=None):
+        """
+        Lets the client that asked for an ingest, and anyone listening to ingest_topic, know how far the download has
+        got. Unlike a change of state this isn't kept in the history.
+        """
+        logging.debug('Ingest {0} progress: {1:.0%}'.format(ingest_uuid, progress['progress']))
+
+        if self.bus is not None and reply_to is not None:
+            self.bus.publish(reply_to, 0x08, dict(status=0, ingest_uuid=ingest_uuid, state=INGESTING,
+                                                  progress=progress))
+        if self.bus is not None and self.ingest_topic is not None:
+            self.bus.publish(self.ingest_topic, dict(event="ingest", ingest_uuid=ingest_uuid, state=INGESTING,
+                                                     progress=progress))
+
+    def find_ingest(self, ingest_uuid):
+        """
+        What the client can be told about an ingest that's queued or in progress, with how far the download has got
+        (see Progress.snapshot()) if it's started. Raises KeyError if it's neither.
+        """
+        with self.ingest_history_lock:
+            if ingest_uuid in self.ingest_progress:
+                item, progress = self.ingest_progress[ingest_uuid]
+            else:
+                item, progress = self.ingest_queue[ingest_uuid], None
+
+        # Not the FTP password, or the topic for replying to whoever asked for it.
+        info = dict((key, value) for key, value in item.iteritems() if key != 'reply_to')
+        info['ftp_details'] = dict((key, value) for key, value in (item.get('ftp_details') or {}).iteritems()
+                                   if key != 'passwd')
+        if progress is not None:
+            info['progress'] = progress.snapshot()
+        return info
+
     def __getitem__(self, cpl_uuid):
         with self.content_lock:
             return self.content[cpl_uuid]
@@ -103,23 +329,41 @@ class Content(object):
                 0 -- Success
         """
         with self.content_lock:
-            rsp = rsp_codes[0]
+            rsp = dict(rsp_codes[0])
             rsp["cpl_uuids"] = self.content.keys()
             return rsp
 
-    def get_cpls(self, cpl_uuids):
+    def get_cpls(self, cpl_uuids=None, limit=None, cursor=None):
         """
-        Returns a list of CPLs
+        Returns a list of CPLs, a page at a time if a limit is given.
+
+        Args:
+            cpl_uuids (list, None): The UUIDs of the CPLs to return, all of them if not given.
+            limit (int, None): The most CPLs to return in one response.
+            cursor (string, None): The next_cursor from the previous page, start from the beginning if not given.
 
         Returns:
             The return status::
 
                 0 -- Success
                 1 -- CPL not found
+
+            The CPLs, plus next_cursor (null on the last page) if a limit was given.
         """
         with self.content_lock:
-            cpl_uuids = self.content.keys() # Do this outside to avoid having to calculate this each time in the loop :)
-            return [self.content[cpl_uuid] for cpl_uuid in cpl_uuids if cpl_uuid in cpl_uuids]
+            if cpl_uuids is None:
+                cpl_uuids = self.content.keys()
+            elif any(cpl_uuid not in self.content for cpl_uuid in cpl_uuids):
+                return rsp_codes[1]
+
+            page, next_cursor = paginate(cpl_uuids, limit, cursor)
+
+            rsp = dict(rsp_codes[0])
+            rsp["cpls"] = [self.content[cpl_uuid] for cpl_uuid in page]
+
+        if limit is not None:
+            rsp["next_cursor"] = next_cursor
+        return rsp
 
     def get_cpl(self, cpl_uuid):
         """
@@ -137,7 +381,7 @@ class Content(object):
             except KeyError:
                 return rsp_codes[1]
 
-            rsp = rsp_codes[0]
+            rsp = dict(rsp_codes[0])
             rsp["cpl"] = cpl
             return rsp
 
@@ -156,51 +400,159 @@ class Content(object):
         """
         raise NotImplementedError
 
-    def ingest(self, connection_details, dcp_path):
+    def ingest(self, connection_details, dcp_path, priority=0, reply_to=None):
         """
         Ingest a DCP by pulling in the content from the FTP connection details supplied and the path to the individual DCP.
+        Updates to the state of the ingest are sent back to the client that asked for it.
+
+        Several DCPs ingest at once (see the ingest_workers and ingest_per_host options), taking turns between FTP
+        servers so a big batch from one doesn't hold up the others. Possible ingest states::
+
+            0 -- Queued
+            1 -- Ingesting
+            2 -- Ingested
+            3 -- Cancelled
+            4 -- Failed
+            5 -- Hash mismatch (some of the assets downloaded don't match the hashes in the PKL, they're listed in
+                 files)
+
+        Ingests that are queued or part way through when the server stops start again when it comes back up,
+        picking up the download where it left off.
+
+        Args:
+            connection_details (dict): FTP host, port, user, passwd and mode (passive or active)
+            dcp_path (string): Path to the DCP on the FTP server
+            priority (int): Ingests with a higher priority go before anything lower waiting on the same FTP server.
 
         Returns:
             The return status::
 
                 0 -- Success
         """
-        logging.info('Adding DCP "{dcp_path}" to the ingest queue'.format(dcp_path=dcp_path))
-
-        ingest_uuid = self.ingest_queue.put({
-            'ftp_details': connection_details,
-            'dcp_path': dcp_path
-        })
-        
-        self.update_ingest_history(ingest_uuid, QUEUED)
+        ingest_uuid = self.queue_ingest(connection_details, dcp_path, priority, reply_to)
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp["ingest_uuid"] = ingest_uuid
         return rsp
 
-    # TODO add in response codes?
+    def queue_ingest(self, connection_details, dcp_path, priority=0, reply_to=None, ingest_uuid=None):
+        logging.info('Adding DCP "{dcp_path}" to the ingest queue'.format(dcp_path=dcp_path))
+
+        # A worker can pick the ingest up straight away, hold on to the history until it's been recorded as queued
+        # so that always comes first.
+        with self.ingest_history_lock:
+            ingest_uuid = self.ingest_queue.put(ftp_host(connection_details), {
+                'ftp_details': connection_details,
+                'dcp_path': dcp_path,
+                'reply_to': reply_to
+            }, priority, ingest_uuid)
+
+            self.update_ingest_history(ingest_uuid, QUEUED, reply_to)
+            self.ingest_bandwidth[ingest_uuid] = TokenBucket(self.bandwidth_per_ingest * 1024)
+
+            # The connection that asked for it won't be around after a restart, so no reply_to.
+            self.pending_ingests[ingest_uuid] = {
+                'ingest_uuid': ingest_uuid,
+                'ftp_details': connection_details,
+                'dcp_path': dcp_path,
+                'priority': priority
+            }
+            self.save_pending_ingests()
+
+        return ingest_uuid
+
     # TODO cancel the ingest if it has already started (how?)
     def cancel_ingest(self, ingest_uuid):
-        raise NotImplementedError
+        """
+        Cancels an ingest that's still waiting in the queue.
 
-        # Since we're using IndexableQueue, we can't just use del x
-        self.ingest_queue.cancel(ingest_uuid)
-        update_ingest_history(self.ingest_history, self.ingest_history_lock, ingest_uuid, CANCELLED)
+        Args:
+            ingest_uuid (string): The ingest_uuid to cancel
+
+        Returns:
+            The return status::
+
+                0 -- Success
+                11 -- Ingest not found (it may have already started)
+        """
+        with self.ingest_history_lock:
+            try:
+                item = self.ingest_queue[ingest_uuid]
+            except KeyError:
+                return rsp_codes[11]
+
+            if not self.ingest_queue.cancel(ingest_uuid):
+                return rsp_codes[11]
+
+            # The client that asked for the ingest hears about it, like any other change of state.
+            self.update_ingest_history(ingest_uuid, CANCELLED, item.get('reply_to'))
+            self.forget_ingest(ingest_uuid)
+
+        return rsp_codes[0]
 
-    def get_ingest_history(self):
+    def set_ingest_bandwidth(self, rate=None, ingest_uuid=None):
         """
-        Returns the ingest history since it was last cleared or the server was restarted.
+        Changes how fast ingests are allowed to download, e.g. to leave room for something else on the network.
+
+        Args:
+            rate (int, None): The limit in KB/s, 0 for no limit. It's for all ingests together unless an ingest_uuid
+                is given, None takes that back to the config (ingest_bandwidth and ingest_bandwidth_profile, or
+                ingest_bandwidth_per_ingest for one ingest).
+            ingest_uuid (string, None): Limit just this ingest (on top of the overall limit), it has to be queued or
+                in progress.
 
         Returns:
             The return status::
 
                 0 -- Success
+                11 -- Ingest not found
+                16 -- Invalid rate (not a whole number of KB/s, 0 or more)
+
+            Also the overall limit now in force and the limits for each ingest, in KB/s.
         """
+        # Anything else would end up asking the download threads to sleep for a negative time (or worse).
+        if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, long)) or rate < 0):
+            return rsp_codes[16]
+
         with self.ingest_history_lock:
-            rsp = rsp_codes[0]
-            rsp["history"] = self.ingest_history
+            if ingest_uuid is None:
+                self.bandwidth.set_override(rate)
+            elif ingest_uuid in self.ingest_bandwidth:
+                self.ingest_bandwidth[ingest_uuid].set_rate((self.bandwidth_per_ingest if rate is None else rate) * 1024)
+            else:
+                return rsp_codes[11]
+
+            rsp = dict(rsp_codes[0])
+            rsp["rate"] = self.bandwidth.scheduled_rate() / 1024
+            rsp["ingests"] = dict((uuid, limiter.rate / 1024) for uuid, limiter in self.ingest_bandwidth.iteritems())
             return rsp
 
+    def get_ingest_history(self, limit=None, cursor=None):
+        """
+        Returns the ingest history since it was last cleared or the server was restarted, a page at a time if a
+        limit is given.
+
+        Args:
+            limit (int, None): The most ingests to return the history of in one response.
+            cursor (string, None): The next_cursor from the previous page, start from the beginning if not given.
+
+        Returns:
+            The return status::
+
+                0 -- Success
+
+            The history keyed by ingest uuid, plus next_cursor (null on the last page) if a limit was given.
+        """
+        with self.ingest_history_lock:
+            page, next_cursor = paginate(self.ingest_history.keys(), limit, cursor)
+
+            rsp = dict(rsp_codes[0])
+            rsp["history"] = dict((ingest_uuid, list(self.ingest_history[ingest_uuid])) for ingest_uuid in page)
+
+        if limit is not None:
+            rsp["next_cursor"] = next_cursor
+        return rsp
+
     def clear_ingest_history(self):
         """
         Clears the ingest history
@@ -220,21 +572,23 @@ class Content(object):
         Returns information about a list of ingest_uuids
 
         Args:
-            ingest_uuids (list): The list of ingest_uuids to investigate
+            ingest_uuids (list): The list of ingest_uuids to investigate, each has to be queued or in progress.
 
         Returns:
             The return status::
 
                 0 -- Success
                 11 -- Ingest not found
+
+            Ingests that have started include their progress, see get_ingest_info().
         """
 
         try:
-            ingests = [self.ingest_queue[ingest_uuid] for ingest_uuid in ingest_uuids]
+            ingests = [self.find_ingest(ingest_uuid) for ingest_uuid in ingest_uuids]
         except KeyError:
             return rsp_codes[11]
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp["ingests"] = ingests
         return rsp
 
@@ -243,20 +597,26 @@ class Content(object):
         Returns information about a particular ingest
 
         Args:
-            ingest_uuid (string): The ingest_uuid to investigate
+            ingest_uuid (string): The ingest_uuid to investigate, it has to be queued or in progress.
 
         Returns:
             The return status::
 
                 0 -- Success
                 11 -- Ingest not found
+
+            Once the ingest has started, its progress: bytes downloaded out of total, the fraction done, the
+            download rate since the last update and smoothed over the ones before (rate and smoothed_rate, in
+            bytes a second), eta in seconds (null until there's a rate to go on) and the same for each file.
+            The client that asked for the ingest is sent this a couple of times a second while it's downloading
+            (see the ingest_progress_rate option).
         """
 
         try:
-            ingest = self.ingest_queue[ingest_uuid]
+            ingest = self.find_ingest(ingest_uuid)
         except KeyError:
             return rsp_codes[11]
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp["ingest"] = ingest
         return rsp
@@ -1,162 +1,824 @@
-from ftplib import FTP
-from math import floor
+from ftplib import FTP, error_temp, error_perm
 from datetime import datetime
-import Queue, shutil, os, logging
+from itertools import count
+from threading import Thread, Lock, Event
+from xml.etree import ElementTree
+import Queue, shutil, os, logging, posixpath, time, hashlib, base64
 
-from screener.lib.util import create_dirs, create_hard_link
+from screener.lib.util import create_dirs, create_hard_link, save_json, load_json
+from screener.lib.progress import Progress
+
+# How much of a range gets written between checkpoints, see download_range()
+CHECKPOINT_INTERVAL = 4 * 1024 * 1024
+# How long to wait for a file's hashing to finish once it's downloaded, see FileHash.digest()
+HASH_TIMEOUT = 10 * 60
+
+def checkpoint_path(incoming_path, path):
+    '''
+    Where the checkpoint for downloading the DCP at path lives, next to the folder it's downloaded to.
+    '''
+    return os.path.join(incoming_path, path.strip('/') + '.checkpoint')
+
+def clear_checkpoint(incoming_path, path):
+    '''
+    Forgets about a download once the DCP has been ingested, it starts from scratch if it's ever ingested again.
+    '''
+    try:
+        os.remove(checkpoint_path(incoming_path, path))
+    except OSError:
+        pass
+
+class Checkpoint(object):
+    '''
+    Keeps track of how much of each file in a DCP download has safely made it to disk, so an interrupted download
+    can skip the files it has already got and carry on part way through the rest. Each file has a list of the ranges
+    it's downloaded in, [start, end, done], where the done bytes from start have been written and synced.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.files = load_json(path, {})
+
+    def ranges(self, server_path, size, local_file):
+        '''
+        The ranges recorded for a file, None if there's nothing to carry on from.
+        '''
+        entry = self.files.get(server_path)
+        if entry is None or entry['size'] != size or not os.path.isfile(local_file):
+            return None
+        return entry['ranges']
+
+    def start(self, server_path, size, ranges):
+        with self.lock:
+            self.files[server_path] = {"size": size, "ranges": ranges}
+            save_json(self.path, self.files)
+
+    def update(self, server_path, index, done):
+        with self.lock:
+            self.files[server_path]['ranges'][index][2] = done
+            save_json(self.path, self.files)
+
+class ListingCache(object):
+    '''
+    Remembers the directory listings from FTP servers for ttl seconds, so ingesting the same DCP again (or lots of
+    DCPs from the same place) doesn't mean walking the server all over again. It also remembers which servers don't
+    understand MLSD so we go straight to LIST with them, for ttl seconds too in case the server is upgraded.
+    '''
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        # (server, path) -> (expiry time, [(name, is_dir, size)])
+        self.listings = {}
+        # server -> expiry time
+        self.no_mlsd = {}
+        self.lock = Lock()
+
+    def mlsd(self, server):
+        '''
+        Whether to try MLSD with server, i.e. it hasn't turned it down lately.
+        '''
+        with self.lock:
+            expires = self.no_mlsd.get(server)
+            if expires is None:
+                return True
+            if expires <= time.time():
+                del self.no_mlsd[server]
+                return True
+            return False
+
+    def put_no_mlsd(self, server):
+        with self.lock:
+            self.no_mlsd[server] = time.time() + self.ttl
+
+    def get(self, server, path):
+        with self.lock:
+            listing = self.listings.get((server, path))
+            if listing is None:
+                return None
+
+            expires, entries = listing
+            if expires <= time.time():
+                del self.listings[(server, path)]
+                return None
+            return entries
+
+    def put(self, server, path, entries):
+        with self.lock:
+            # Drop anything that's expired while we're here so the cache doesn't grow forever.
+            now = time.time()
+            for key in [key for key, (expires, e) in self.listings.iteritems() if expires <= now]:
+                del self.listings[key]
+
+            self.listings[(server, path)] = (now + self.ttl, entries)
+
+def connect(ftp_details):
+    '''
+    Opens a new FTP session and logs in.
+    '''
+    logging.info('Connecting to FTP')
+
+    # Stupid API only take a boolean instead of an enum value!
+    ftp_mode = (ftp_details.get('mode', 'passive') == 'passive')
+
+    ftp = FTP()
+    ftp.set_pasv(ftp_mode)
+    ftp.connect(host=ftp_details['host'], port=(ftp_details['port'] or 21))
+
+    if 'user' in ftp_details or 'passwd' in ftp_details:
+        ftp.login(user=ftp_details['user'], passwd=ftp_details['passwd'])
+
+    return ftp
+
+def hang_up(ftp):
+    try:
+        ftp.quit()
+    except Exception:
+        # We're done with it anyway, e.g. the server already hung up on an aborted transfer.
+        ftp.close()
+
+class FTPPool(object):
+    '''
+    Logged in FTP sessions kept open between downloads, so ingesting lots of DCPs from the same server doesn't
+    mean connecting and logging in again for each one. Sessions are kept per server, user and mode. Each one is
+    checked with a NOOP before it's handed out again, sessions idle for longer than idle_timeout are hung up on and
+    no more than size are kept idle altogether (the least recently used go first).
+    '''
+    def __init__(self, size=8, idle_timeout=60):
+        self.size = size
+        self.idle_timeout = idle_timeout
+
+        # key -> [(time released, FTP)], most recently used last.
+        self.idle = {}
+        self.lock = Lock()
+
+    def key(self, ftp_details):
+        # passwd too, a session logged in with the right one mustn't be handed to someone with the wrong one.
+        return (ftp_details.get('host'), ftp_details.get('port') or 21, ftp_details.get('user'),
+                ftp_details.get('passwd'), ftp_details.get('mode', 'passive'))
+
+    def acquire(self, ftp_details):
+        key = self.key(ftp_details)
+        while True:
+            with self.lock:
+                expired = self.evict()
+                sessions = self.idle.get(key)
+                if not sessions:
+                    break
+
+                released, ftp = sessions.pop()
+                if not sessions:
+                    del self.idle[key]
+
+            for expired_ftp in expired:
+                hang_up(expired_ftp)
+
+            try:
+                ftp.voidcmd('NOOP')
+                return ftp
+            except Exception:
+                # The server has hung up on it or it's got itself in a muddle, try the next one.
+                ftp.close()
+
+        for expired_ftp in expired:
+            hang_up(expired_ftp)
+        return connect(ftp_details)
+
+    def release(self, ftp_details, ftp):
+        closing = []
+        with self.lock:
+            self.idle.setdefault(self.key(ftp_details), []).append((time.time(), ftp))
+
+            closing.extend(self.evict())
+            idle = sorted((released, key) for key, sessions in self.idle.iteritems() for released, f in sessions)
+            for released, key in idle[:max(0, len(idle) - self.size)]:
+                closing.append(self.idle[key].pop(0)[1])
+                if not self.idle[key]:
+                    del self.idle[key]
+
+        # Not while holding the lock, quit() waits for the server.
+        for ftp in closing:
+            hang_up(ftp)
+
+    def evict(self):
+        '''
+        Takes out the sessions that have been idle too long, call with the lock held.
+
+        Returns:
+            The sessions to hang up on.
+        '''
+        expired = []
+        cutoff = time.time() - self.idle_timeout
+        for key in self.idle.keys():
+            sessions = self.idle[key]
+            while sessions and sessions[0][0] <= cutoff:
+                expired.append(sessions.pop(0)[1])
+            if not sessions:
+                del self.idle[key]
+        return expired
+
+    def evict_idle(self):
+        '''
+        Hangs up on the sessions that have been idle too long, call every so often so they don't stay open until
+        the pool is next used.
+        '''
+        with self.lock:
+            expired = self.evict()
+        for ftp in expired:
+            hang_up(ftp)
+
+    def clear(self):
+        with self.lock:
+            closing = [ftp for sessions in self.idle.itervalues() for released, ftp in sessions]
+            self.idle = {}
+        for ftp in closing:
+            hang_up(ftp)
+
+class HashPool(object):
+    """
+    Worker threads to work out SHA-1s on, so downloads carry on while the chunks they've already fetched are hashed.
+    hashlib lets go of the GIL while it hashes, so with several downloads at once the hashing is spread over more
+    than one core rather than holding up the downloads on one.
+    """
+    def __init__(self, workers=2, backlog=64):
+        # One queue per worker so everything for the same file is done in order, and each is bounded so a download
+        # can't get too far ahead of its hashing.
+        self.queues = [Queue.Queue(backlog) for n in xrange(workers)]
+        self.turn = count()
+
+        self.threads = []
+        for n, queue in enumerate(self.queues):
+            thread = Thread(target=self.work, args=(queue,), name='Hasher-{0}'.format(n))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self, queue):
+        while True:
+            job = queue.get()
+            if job is None:
+                return
+            func, args = job
+            try:
+                func(*args)
+            except Exception:
+                # Whoever queued it hears about it (see FileHash.call()), the worker has to keep going for everyone else.
+                logging.exception('Hashing failed')
+
+    def stop(self, timeout=None):
+        """
+        Lets the workers finish what's queued for them and waits (up to timeout seconds each) for them to go.
+        """
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def queue(self):
+        """
+        One of the workers' queues, taking turns.
+        """
+        return self.queues[next(self.turn) % len(self.queues)]
+
+class FileHash(object):
+    """
+    The SHA-1 of a file downloaded as one or more ranges (see DCPDownloader.plan()), worked out as it's written.
+    A SHA-1 has to be fed the file in order, so each chunk is hashed on the way in if it carries straight on from
+    what's been hashed so far. What gets ahead of that (later segments, or what an earlier attempt downloaded) is
+    read back from disk as soon as everything before it has been hashed, so only those bytes are read twice and
+    while they're still likely to be cached.
+
+    It's worked out on one of a HashPool's workers if given a queue from it, or there and then if not.
+    """
+    def __init__(self, local_file, ranges, queue=None):
+        self.local_file = local_file
+        self.queue = queue
+        self.sha1 = hashlib.sha1()
+        self.error = None
+
+        self.lock = Lock()
+        self.ends = [end for start, end, done in ranges]
+        self.size = self.ends[-1] if ranges else 0
+        # How far each range has been written, how far the file has been hashed and which range that's in.
+        self.written = [start + done for start, end, done in ranges]
+        self.hashed = 0
+        self.current = 0
+        # Set while a thread is reading back from disk, nothing else is hashed until it's done.
+        self.reading = False
+
+    def run(self, func, *args):
+        if self.queue is None:
+            self.call(func, *args)
+        else:
+            self.queue.put((self.call, (func,) + args))
+
+    def call(self, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            # Raised from digest(), on whichever thread wants the answer.
+            logging.exception('Unable to hash {0}'.format(self.local_file))
+            if self.error is None:
+                self.error = e
+
+    def update(self, index, offset, chunk):
+        """
+        Adds chunk, which range index has just written at offset.
+        """
+        with self.lock:
+            self.written[index] = offset + len(chunk)
+            if offset == self.hashed and not self.reading:
+                self.run(self.sha1.update, chunk)
+                self.advance(offset + len(chunk))
+            behind = self.behind()
+
+        if behind:
+            self.catch_up()
+
+    def advance(self, hashed):
+        # Call with the lock held.
+        self.hashed = hashed
+        while self.current < len(self.ends) - 1 and self.hashed >= self.ends[self.current]:
+            self.current += 1
+
+    def behind(self):
+        # Whether something's been written straight after what's been hashed, call with the lock held.
+        return not self.reading and bool(self.written) and self.written[self.current] > self.hashed
+
+    def catch_up(self):
+        """
+        Reads back and hashes whatever has been written following on from what's been hashed so far.
+        """
+        while True:
+            with self.lock:
+                if not self.behind():
+                    return
+                self.reading = True
+                start, end = self.hashed, self.written[self.current]
+
+            # Not holding the lock, the downloads carry on writing meanwhile. Nothing else can be hashed until
+            # this is as chunks are only hashed when they follow straight on.
+            self.run(self.read, start, end)
+
+            with self.lock:
+                self.reading = False
+                self.advance(end)
+
+    def read(self, start, end, blocksize=1024 * 1024):
+        with open(self.local_file, 'rb') as f:
+            f.seek(start)
+            while start < end:
+                block = f.read(min(blocksize, end - start))
+                if not block:
+                    raise IOError('{0} is shorter than expected'.format(self.local_file))
+                self.sha1.update(block)
+                start += len(block)
+
+    def digest(self, timeout=HASH_TIMEOUT):
+        """
+        Waits (up to timeout seconds) for anything still to be hashed, call once the whole file has been written.
+
+        Returns:
+            The SHA-1 base64 encoded, as a PKL has it.
+        """
+        self.catch_up()
+        if self.queue is not None:
+            done = Event()
+            self.queue.put((done.set, ()))
+            if not done.wait(timeout):
+                raise IOError('Timed out hashing {0}'.format(self.local_file))
+
+        if self.error is not None:
+            raise self.error
+        if self.hashed != self.size:
+            raise IOError('Only {0} of the {1} bytes of {2} were hashed'.format(self.hashed, self.size,
+                                                                               self.local_file))
+        return base64.b64encode(self.sha1.digest())
 
 class DCPDownloader(object):
-    def __init__(self, incoming_path, ftp_details):
+    def __init__(self, incoming_path, ftp_details, connections=1, segment_size=None, listing_cache=None, pool=None,
+                 limiters=(), hash_pool=None):
+        """
+        Args:
+            incoming_path (string): Where to download DCPs to.
+            ftp_details (dict): FTP host, port, user, passwd and mode (passive or active)
+            connections (int): The most FTP sessions to download over at once, several files (or segments of one
+                big file) are fetched in parallel if more than 1.
+            segment_size (int, None): MXF files bigger than this many bytes are split into segments of about this
+                size and fetched in parallel, whole files only if None.
+            listing_cache (ListingCache, None): Where to remember directory listings, the DCP is always listed
+                afresh if not given.
+            pool (FTPPool, None): Where to get FTP sessions from and hand them back to afterwards, new ones are
+                opened (and closed afterwards) if not given.
+            limiters (list): TokenBuckets to hold the download speed down with, e.g. one shared by every ingest
+                and one just for this one.
+            hash_pool (HashPool, None): Where to work out the SHA-1s of the files, see digests(). They're worked
+                out by the threads doing the downloading if not given.
+        """
         self.incoming_path = incoming_path
         self.ftp_details = ftp_details
+        self.connections = max(1, connections)
+        self.segment_size = segment_size
+        self.listing_cache = listing_cache
+        self.pool = pool
+        self.limiters = limiters
+        self.hash_pool = hash_pool
 
-        create_dirs(self.incoming_path)
-
-    def __enter__(self):
-        logging.info('Connecting to FTP')
+        # Path relative to the DCP folder -> FileHash for each file downloaded, and the same by server path.
+        self.hashes = {}
+        self.server_hashes = {}
 
-        # Stupid API only take a boolean instead of an enum value!
-        ftp_mode = (self.ftp_details.get('mode', 'passive') == 'passive')
+        # Listings are cached per server and user, another user could see something different.
+        self.server = (ftp_details.get('host'), ftp_details.get('port') or 21, ftp_details.get('user'))
 
-        self.ftp = FTP()
-        self.ftp.set_pasv(ftp_mode)
-        self.ftp.connect(host=self.ftp_details['host'], port=(self.ftp_details['port'] or 21))
+        create_dirs(self.incoming_path)
 
-        if 'user' in self.ftp_details or 'passwd' in self.ftp_details:
-            self.ftp.login(user=self.ftp_details['user'], passwd=self.ftp_details['passwd'])
+    def connect(self):
+        if self.pool is not None:
+            return self.pool.acquire(self.ftp_details)
+        return connect(self.ftp_details)
 
+    def __enter__(self):
+        self.ftp = self.connect()
+        # Extra sessions for parallel downloads are opened as they're needed, see download_all()
+        self.sessions = [self.ftp]
         return self
 
-    def __exit__(self, *args):
-        self.ftp.quit()
+    def __exit__(self, exc_type, exc_value, traceback):
+        for ftp in self.sessions:
+            # Anything could have happened to the sessions if the download went wrong, don't reuse them.
+            if self.pool is not None and exc_type is None:
+                self.pool.release(self.ftp_details, ftp)
+            else:
+                hang_up(ftp)
+
+    def download(self, path, progress=None):
+        """
+        Downloads the DCP at path on the server into the incoming path, keeping progress (see Progress) up to date.
 
-    def download(self, path):
+        Returns:
+            Where the DCP was downloaded to.
+        """
         download_path = os.path.join(self.incoming_path, path)
         create_dirs(download_path)
 
-        # Work out what we're dealing with, store this info on the object itself for easy access :)
+        # Work out what we're dealing with.
         items, total_size = self.get_folder_info(self.ftp, path)
 
-        local_paths = []
-        server_paths = []
+        progress = progress or Progress()
 
-        progress_tracker = {
-            "downloaded": 0,
-            "total_size": total_size,
-            "progress": 0
-        }
+        # Carry on from wherever we got to if we've tried downloading this DCP before.
+        self.checkpoint = Checkpoint(checkpoint_path(self.incoming_path, path))
 
-        for item in items:
-            path_parts = item.split("/")
-            localfilepath = "\\".join(path_parts[2:])
-            local_paths.append(localfilepath)
+        # Each task is a file, or a byte range of one, to fetch: (server_path, local_file, size, index, start, end,
+        # done), index being which of the file's ranges it is.
+        tasks = []
+        for item, local_path, size in items:
+            local_file = os.path.join(download_path, *local_path.split('/'))
+            create_dirs(os.path.dirname(local_file))
 
-            server_paths.append(item)
+            ranges = self.plan(item, local_file, size)
+            progress.add_file(item, size, sum(done for start, end, done in ranges))
+            for index, (start, end, done) in enumerate(ranges):
+                if start + done < end:
+                    tasks.append((item, local_file, size, index, start, end, done))
 
-        to_parent_dir(self.ftp, path)
+            file_hash = FileHash(local_file, ranges, self.hash_pool.queue() if self.hash_pool else None)
+            self.hashes[local_path] = self.server_hashes[item] = file_hash
 
         """
         Code which calls functions to download files from the ftp server.
         This can be commented out when testing if the files have already been downloaded.
         """
-        for local_path, server_path in zip(local_paths, server_paths):
-            dirname = os.path.dirname(local_path)
-            if dirname is not None:
-                full_download_path = os.path.join(download_path, dirname)
-                if not os.path.isdir(full_download_path):
-                    create_dirs(full_download_path)
-
-            if local_path.endswith('.mxf'): # binary file
-                download_bin(self.ftp, progress_tracker, download_path, local_path, server_path)
-            else:
-                download_text(self.ftp, progress_tracker, download_path, local_path, server_path)
+        self.download_all(tasks, progress)
+        progress.finish()
 
         logging.info("Finished getting folder info.")
         
         return download_path
 
-    def get_folder_info(self, ftp, path):
+    def digests(self):
+        """
+        Waits for the hashing to finish.
+
+        Returns:
+            The SHA-1 of each file downloaded (base64 encoded, like the PKL has them) keyed by its path relative to
+            the DCP folder.
+        """
+        return dict((local_path, file_hash.digest()) for local_path, file_hash in self.hashes.iteritems())
+
+    def plan(self, server_path, local_file, size):
+        """
+        Splits a file up into the ranges to download, or picks up the ones from the checkpoint if we've already made
+        a start on it. A new file is created (and preallocated if it's going to be written to in more than one place
+        at once).
+        """
+        ranges = self.checkpoint.ranges(server_path, size, local_file)
+        if ranges is not None:
+            return ranges
+
+        if not self.segment_size or self.connections == 1 or not server_path.endswith('.mxf') or size <= self.segment_size:
+            ranges = [[0, size, 0]]
+        else:
+            count = min(self.connections, -(-size // self.segment_size))
+            step = -(-size // count)
+            ranges = [[start, min(start + step, size), 0] for start in xrange(0, size, step)]
+
+        with open(local_file, 'wb') as f:
+            if len(ranges) > 1:
+                f.truncate(size)
+
+        self.checkpoint.start(server_path, size, ranges)
+        return ranges
+
+    def fetch(self, ftp, task, progress):
+        server_path, local_file, size, index, start, end, done = task
+
+        def synced(written):
+            self.checkpoint.update(server_path, index, done + written)
+
+        # The last range reads to the end, no need to cut the transfer short.
+        length = None if end == size else end - start - done
+        file_hash = self.server_hashes[server_path]
+
+        def chunk_written(offset, chunk):
+            file_hash.update(index, offset, chunk)
+
+        download_range(ftp, progress, server_path, local_file, start + done, length, synced, self.limiters,
+                       chunk_written)
+
+    def download_all(self, tasks, progress):
         """
-        Aggregate the DCP folder contents so we know what we're dealing with.
+        Fetches each task over one of up to self.connections FTP sessions. If any of them fail the rest are left
+        and the first error is raised once the sessions that are busy have finished.
         """
+        lock = Lock()
+        if self.connections == 1 or len(tasks) < 2:
+            for task in tasks:
+                self.fetch(self.ftp, task, progress)
+            return
 
-        # Not particularly happy about having to do it this way (saving to the object), but it'll work for now.
-        self.items = []
-        self.total_size = 0
         queue = Queue.Queue()
+        for task in tasks:
+            queue.put(task)
+        errors = []
+
+        def work(ftp):
+            try:
+                if ftp is None:
+                    ftp = self.connect()
+                    with lock:
+                        self.sessions.append(ftp)
+
+                while not errors:
+                    try:
+                        task = queue.get_nowait()
+                    except Queue.Empty:
+                        return
+                    self.fetch(ftp, task, progress)
+            except Exception as e:
+                logging.exception('Download failed')
+                errors.append(e)
+
+        threads = [Thread(target=work, args=(self.ftp if n == 0 else None,), name='Download-{0}'.format(n))
+                   for n in xrange(min(self.connections, len(tasks)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
 
-        def process_line(line):
-            parts = line.split()
- 
-            if parts[0][0] == 'd': # Checks the permission signature :)
-                queue.put(parts[8])
-            else:
-                self.items.append("{path}{filename}".format(path=current_path, filename=parts[8]))
-                self.total_size += int(parts[4])
-
-        queue.put(path)
-        current_path = ftp.pwd()
-        while not queue.empty():
-            p = queue.get()
-            ftp.cwd(p)
-            current_path = "{directory}{slash}".format(directory=ftp.pwd(), slash="/")
-            ftp.retrlines('LIST', process_line)
-            
-        to_parent_dir(ftp, path)
-        
-        return self.items, self.total_size
+    def get_folder_info(self, ftp, path):
+        """
+        Aggregate the DCP folder contents so we know what we're dealing with. Everything is listed by its full path
+        so we never have to change directory.
+
+        Returns:
+            A list of (server path, path relative to the DCP folder, size) for each file and the total size.
+        """
+        root = path if path.startswith('/') else posixpath.join(ftp.pwd(), path)
+
+        items = []
+        total_size = 0
+        folders = [(root.rstrip('/'), '')]
+        while folders:
+            folder, relative = folders.pop()
+            for name, is_dir, size in self.list_dir(ftp, folder or '/'):
+                if is_dir:
+                    folders.append((folder + '/' + name, relative + name + '/'))
+                else:
+                    items.append((folder + '/' + name, relative + name, size))
+                    total_size += size
+
+        return items, total_size
+
+    def list_dir(self, ftp, path):
+        """
+        The contents of a directory on the server as a list of (name, is directory, size), from the listing cache
+        if we've seen it recently.
+        """
+        cache = self.listing_cache
+        if cache is not None:
+            entries = cache.get(self.server, path)
+            if entries is not None:
+                return entries
+
+        entries = None
+        if cache is None or cache.mlsd(self.server):
+            try:
+                entries = list_mlsd(ftp, path)
+            except error_perm as e:
+                # 500/502, it's an older server that doesn't do MLSD. Anything else (e.g. 550, no such directory)
+                # would go just as wrong with LIST.
+                if str(e)[:3] not in ('500', '502'):
+                    raise
+                if cache is not None:
+                    cache.put_no_mlsd(self.server)
+
+        if entries is None:
+            entries = list_long(ftp, path)
+
+        if cache is not None:
+            cache.put(self.server, path, entries)
+        return entries
 
 # Some util functions.
 
-def to_parent_dir(ftp, path):
-    for directory in path.split('/'):
-        ftp.cwd('..') # Go back to where we started from so we don't get ourselves into a hole.
+def list_mlsd(ftp, path):
+    """
+    Lists a directory with MLSD (RFC 3659), which is meant to be read by a machine so gives us exact sizes and
+    handles any file name.
+    """
+    entries = []
+
+    def parse(line):
+        facts, _, name = line.partition(' ')
+        facts = dict(fact.split('=', 1) for fact in facts.lower().split(';') if '=' in fact)
+
+        kind = facts.get('type')
+        if kind in ('file', 'dir'):
+            entries.append((name, kind == 'dir', int(facts.get('size', 0))))
+
+    ftp.retrlines('MLSD {0}'.format(path), parse)
+    return entries
+
+def list_long(ftp, path):
+    """
+    Lists a directory with LIST for servers that don't do MLSD. There's no standard format, this expects the usual
+    ls -l style, e.g. "-rw-r--r-- 1 owner group 1234 Jan 01 00:00 file name".
+    """
+    entries = []
+
+    def parse(line):
+        # The name is everything after the date, spaces and all.
+        parts = line.split(None, 8)
+        if len(parts) < 9 or parts[8] in ('.', '..'):
+            return # e.g. "total 123"
+
+        entries.append((parts[8], parts[0][0] == 'd', int(parts[4])))
+
+    ftp.retrlines('LIST {0}'.format(path), parse)
+    return entries
 
 # Some functions to download files from the DCP FTP
 
-def download_text(ftp, progress_tracker, folder_path, filename, servername):
+def download_range(ftp, progress, servername, local_file, offset=0, length=None, synced=None, limiters=(),
+                   chunk_written=None):
     '''
-    Downloads text files from an FTP to the DCP directory.
+    Downloads length bytes of servername from offset (or everything from offset if length is None) and writes
+    them at the same offset in local_file, which must already exist. Other ranges of the same file can be downloaded
+    into it at the same time, each over its own FTP session.
+
+    Every CHECKPOINT_INTERVAL bytes, and at the end whether the download worked or not, what's been written is synced
+    to disk and synced(bytes written so far) is called to record it. chunk_written(offset, chunk) is called once
+    each chunk is in the file, where anyone else reading it can see it (see FileHash).
     '''
-    with open(os.path.join(folder_path, filename), 'w') as f:
-        logging.info("Starting download: {0}".format(servername))
-        ftp.retrbinary('RETR {0}'.format(servername), write_download(progress_tracker, f))
+    # Unbuffered, so what's been written can be read back straight away.
+    with open(local_file, 'r+b', 0) as f:
+        f.seek(offset)
+        write = write_download(progress, f, limiters, servername)
+        written = [0, 0] # So far, at the last checkpoint
+
+        def sync():
+            f.flush()
+            os.fsync(f.fileno())
+            written[1] = written[0]
+            if synced is not None:
+                synced(written[0])
+
+        def write_chunk(chunk):
+            write(chunk)
+            if chunk_written is not None:
+                chunk_written(offset + written[0], chunk)
+            written[0] += len(chunk)
+            if written[0] - written[1] >= CHECKPOINT_INTERVAL:
+                sync()
+
+        logging.info("Starting download: {0} from {1}".format(servername, offset))
+        try:
+            if length is None:
+                ftp.retrbinary('RETR {0}'.format(servername), write_chunk, rest=offset or None)
+            else:
+                retr_range(ftp, servername, offset, length, write_chunk)
+        finally:
+            # Hang on to what we did get if the link dropped.
+            sync()
 
-    logging.info("Download of {0} complete.".format(servername))
+    logging.info("Download of {0} from {1} complete.".format(servername, offset))
 
-def download_bin(ftp, progress_tracker, folder_path, filename, servername):
+def retr_range(ftp, servername, offset, length, callback, blocksize=8192):
     '''
-    Downloads binary files from an FTP to the DCP directory but writes them to /dev/null (or NULL on win32).
+    Like FTP.retrbinary() with rest=offset but stops after length bytes, hanging up on the rest of the file.
     '''
-    # Write a dummy placeholder file
-    with open(os.path.join(folder_path, filename), 'w') as f:
-        f.write('Dummy placeholder')
+    ftp.voidcmd('TYPE I')
+    conn = ftp.transfercmd('RETR {0}'.format(servername), offset or None)
+    try:
+        remaining = length
+        while remaining:
+            data = conn.recv(min(blocksize, remaining))
+            if not data:
+                break
+            callback(data)
+            remaining -= len(data)
+    finally:
+        conn.close()
+
+    try:
+        ftp.voidresp()
+    except error_temp:
+        # 426, we hung up on it before it got to the end of the file. Unless it hung up on us first.
+        if remaining:
+            raise
+
+def write_download(progress, f, limiters=(), name=None):
+    '''
+    Provides a function for FTP.retrlines/retrbinary to call when processing a chunk. It adds the chunk to progress
+    (see Progress, which works out how fast it's going and tells the TMS every so often), for the file name if given.
+    Each chunk waits on the limiters (see TokenBucket) before it's written, which holds up reading the next one.
+    '''
+    def write_chunk(chunk):
+        for limiter in limiters:
+            limiter.consume(len(chunk))
+        f.write(chunk)
+        progress.update(len(chunk), name)
 
-    # Pipe data to /dev/null
-    with open(os.devnull, 'wb') as f:
-        logging.info("Starting download: {0}".format(servername))
-        ftp.retrbinary('RETR {0}'.format(servername), write_download(progress_tracker, f))
+    return write_chunk
 
 
-    logging.info("Download of {0} complete.".format(servername))
 
-def write_download(progress_tracker, f):
-    '''
-    Provides a function for FTP.retrlines/retrbinary to call when processing a chunk. It uses the DCP's downloaded
-    counter to keep track of how much of the DCP has been downloaded, alerting TMS of progress.
-    '''
-    def write_chunk(chunk, progress_tracker=progress_tracker, f=f):
-        f.write(chunk)
-        progress_tracker["downloaded"] += len(chunk)
-        old_progress = progress_tracker["progress"]
-        progress_tracker["progress"] = float(progress_tracker["downloaded"]) / progress_tracker["total_size"]
+class HashMismatchError(Exception):
+    def __init__(self, paths):
+        Exception.__init__(self, 'Hash mismatch: {0}'.format(', '.join(paths)))
+        # The files (relative to the DCP folder) that didn't match the PKL.
+        self.paths = paths
 
-        if floor(100 * progress_tracker["progress"]) - floor(100 * old_progress) > 0:
-            logging.info('Download progress: {0:.0%}'.format(progress_tracker["progress"]))
+def pkl_hashes(pkl_path):
+    '''
+    Reads the hash of each asset from a PKL.
 
-    return write_chunk
+    Returns:
+        Asset uuid (without the urn:uuid: prefix) -> base64 encoded SHA-1.
+    '''
+    hashes = {}
+    for element in ElementTree.parse(pkl_path).getroot().iter():
+        # Interop and SMPTE PKLs have different namespaces, go by the local names.
+        if element.tag.rpartition('}')[2] != 'Asset':
+            continue
+
+        fields = dict((child.tag.rpartition('}')[2], (child.text or '').strip()) for child in element)
+        if fields.get('Id') and fields.get('Hash'):
+            asset_id = fields['Id']
+            if asset_id.lower().startswith('urn:uuid:'):
+                asset_id = asset_id[len('urn:uuid:'):]
+            hashes[asset_id] = fields['Hash']
+    return hashes
+
+def verify_hashes(dcp, digests):
+    '''
+    Checks the downloaded files against the hashes in the DCP's PKL.
 
+    Args:
+        dcp (DCP): The DCP, parsed.
+        digests (dict): From DCPDownloader.digests().
 
+    Returns:
+        The paths (relative to the DCP folder) of the assets that don't match.
+    '''
+    mismatched = []
+    for asset_id, expected in pkl_hashes(dcp.pkl.path).iteritems():
+        try:
+            path = posixpath.normpath(dcp.assetmap[asset_id].path.replace('\\', '/'))
+        except KeyError:
+            logging.warning('Asset {0} is in the PKL but not the assetmap'.format(asset_id))
+            continue
+
+        actual = digests.get(path)
+        if actual is None:
+            logging.warning('Asset {0} ({1}) was not downloaded'.format(asset_id, path))
+        elif actual != expected:
+            logging.error('Hash mismatch for {0}: expected {1} got {2}'.format(path, expected, actual))
+            mismatched.append(path)
+    return mismatched
 
 class RepackageDCPError(Exception):
     pass
@@ -28,6 +28,12 @@ class Bus(object):
 
         return self
 
+    def remove(self, key):
+        # Forget about the key altogether, for short lived keys (e.g. one per connection) that would otherwise pile up.
+        self.subscriptions.pop(key, None)
+
+        return self
+
     def has_subscription(self, key, callback):
         return key in self.subscriptions and callback in self.subscriptions[key]
 
@@ -35,9 +41,9 @@ class Bus(object):
         return key in self.subscriptions and len(self.subscriptions[key]) > 0
 
     def publish(self, key, *args, **kwargs):
-        if key in self.subscriptions:
-            for callback in self.subscriptions[key]:
-                callback(self, *args, **kwargs)
+        # Copy the list, callbacks can come and go from other threads while we're publishing.
+        for callback in list(self.subscriptions.get(key, ())):
+            callback(self, *args, **kwargs)
 
         return self
 
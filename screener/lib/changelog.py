@@ -0,0 +1,52 @@
+"""
+Recent changes to the stores, so clients that have been away can catch up on what they missed.
+"""
+
+from collections import deque
+from itertools import islice
+from threading import Lock
+from uuid import uuid4
+
+
+class ChangeLog(object):
+    """
+    The last size changes made to any of the stores in order, each numbered with a version that only ever goes up.
+    Older changes drop off the end, a client that has been away longer than that has to fetch everything again.
+    """
+    def __init__(self, size=10000):
+        # Versions start again from 0 when the server restarts, the id lets clients tell that's happened.
+        self.id = str(uuid4())
+
+        self.changes = deque(maxlen=size)
+        self.version = 0
+        self.lock = Lock()
+
+    def record(self, topic, change):
+        """
+        Adds a change published on topic and numbers it (change['version']).
+
+        Returns:
+            The version of the change.
+        """
+        with self.lock:
+            self.version += 1
+            change['version'] = self.version
+            self.changes.append((topic, change))
+            return self.version
+
+    def since(self, version, topics=None):
+        """
+        The changes made after version, only those published on one of topics if given.
+
+        Returns:
+            The current version and the list of changes, or None instead of the list if some of the changes since
+            version have already dropped off the end.
+        """
+        with self.lock:
+            # Versions are consecutive, so where to start from is just an offset from the oldest one we have.
+            oldest = self.changes[0][1]['version'] if self.changes else self.version + 1
+            if version < oldest - 1 or version > self.version:
+                return self.version, None
+
+            changes = islice(self.changes, version + 1 - oldest, None)
+            return self.version, [change for topic, change in changes if topics is None or topic in topics]
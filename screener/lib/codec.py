@@ -0,0 +1,215 @@
+"""
+Value codecs for the KLV messages.
+
+JSON is the default and what every client understands. Clients that want to can negotiate the MessagePack
+(http://msgpack.org) binary format instead, which is smaller and quicker to pack for big lists of CPLs. The codec
+used for a message is carried in byte 14 of the KLV key so each message can be decoded on its own.
+
+If the msgpack package is installed we'll use that, otherwise fall back to the pure python implementation below
+which covers the types we can send as JSON.
+"""
+
+from struct import pack as struct_pack, unpack_from, error as struct_error
+import json
+
+JSON, MSGPACK = range(2)
+
+# Which MessagePack implementation we ended up with.
+implementation = 'python'
+
+
+class CodecError(Exception):
+    pass
+
+
+def to_bytes(data):
+    """
+    Values can turn up as strings, bytearrays or memoryviews onto a receive buffer, str() of a memoryview gives
+    its repr rather than its contents.
+    """
+    return data.tobytes() if isinstance(data, memoryview) else str(data)
+
+
+def _pack(obj, out):
+    t = type(obj)
+    if obj is None:
+        out.append('\xc0')
+    elif t is bool:
+        out.append('\xc3' if obj else '\xc2')
+    elif t is int or t is long:
+        if 0 <= obj < 0x80:
+            out.append(chr(obj))
+        elif -0x20 <= obj < 0:
+            out.append(chr(obj & 0xff))
+        elif 0 <= obj <= 0xff:
+            out.append('\xcc' + chr(obj))
+        elif 0 <= obj <= 0xffff:
+            out.append(struct_pack('>BH', 0xcd, obj))
+        elif 0 <= obj <= 0xffffffff:
+            out.append(struct_pack('>BI', 0xce, obj))
+        elif 0 <= obj <= 0xffffffffffffffff:
+            out.append(struct_pack('>BQ', 0xcf, obj))
+        elif -0x80 <= obj < 0:
+            out.append(struct_pack('>Bb', 0xd0, obj))
+        elif -0x8000 <= obj < 0:
+            out.append(struct_pack('>Bh', 0xd1, obj))
+        elif -0x80000000 <= obj < 0:
+            out.append(struct_pack('>Bi', 0xd2, obj))
+        elif -0x8000000000000000 <= obj < 0:
+            out.append(struct_pack('>Bq', 0xd3, obj))
+        else:
+            raise CodecError('Integer out of range: {0}'.format(obj))
+    elif t is float:
+        out.append(struct_pack('>Bd', 0xcb, obj))
+    elif t is str or t is unicode:
+        if t is unicode:
+            obj = obj.encode('utf-8')
+        n = len(obj)
+        if n < 0x20:
+            out.append(chr(0xa0 | n))
+        elif n <= 0xff:
+            out.append('\xd9' + chr(n))
+        elif n <= 0xffff:
+            out.append(struct_pack('>BH', 0xda, n))
+        else:
+            out.append(struct_pack('>BI', 0xdb, n))
+        out.append(obj)
+    elif t is list or t is tuple:
+        n = len(obj)
+        if n < 0x10:
+            out.append(chr(0x90 | n))
+        elif n <= 0xffff:
+            out.append(struct_pack('>BH', 0xdc, n))
+        else:
+            out.append(struct_pack('>BI', 0xdd, n))
+        for item in obj:
+            _pack(item, out)
+    elif t is dict:
+        n = len(obj)
+        if n < 0x10:
+            out.append(chr(0x80 | n))
+        elif n <= 0xffff:
+            out.append(struct_pack('>BH', 0xde, n))
+        else:
+            out.append(struct_pack('>BI', 0xdf, n))
+        for k, v in obj.iteritems():
+            _pack(k, out)
+            _pack(v, out)
+    else:
+        raise TypeError('{0!r} is not MessagePack serializable'.format(obj))
+
+def pack(obj):
+    """
+    Serialises obj to a MessagePack string.
+    """
+    out = []
+    _pack(obj, out)
+    return ''.join(out)
+
+
+# Fixed size formats: type byte -> (struct format, size)
+_fixed = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8)
+}
+
+# Length prefixed formats: type byte -> (struct format of the length, size)
+_str_lengths = {0xd9: ('>B', 1), 0xda: ('>H', 2), 0xdb: ('>I', 4), 0xc4: ('>B', 1), 0xc5: ('>H', 2), 0xc6: ('>I', 4)}
+_array_lengths = {0xdc: ('>H', 2), 0xdd: ('>I', 4)}
+_map_lengths = {0xde: ('>H', 2), 0xdf: ('>I', 4)}
+
+def _unpack(data, offset):
+    b = ord(data[offset])
+    offset += 1
+
+    if b < 0x80:
+        return b, offset
+    elif b >= 0xe0:
+        return b - 0x100, offset
+    elif 0xa0 <= b <= 0xbf:
+        end = offset + (b & 0x1f)
+        return data[offset:end].decode('utf-8'), end
+    elif 0x90 <= b <= 0x9f:
+        return _unpack_array(data, offset, b & 0x0f)
+    elif 0x80 <= b <= 0x8f:
+        return _unpack_map(data, offset, b & 0x0f)
+    elif b == 0xc0:
+        return None, offset
+    elif b == 0xc2:
+        return False, offset
+    elif b == 0xc3:
+        return True, offset
+    elif b in _fixed:
+        fmt, size = _fixed[b]
+        return unpack_from(fmt, data, offset)[0], offset + size
+    elif b in _str_lengths:
+        fmt, size = _str_lengths[b]
+        start = offset + size
+        end = start + unpack_from(fmt, data, offset)[0]
+        # 0xc4-0xc6 are raw binary, leave those as they are.
+        val = data[start:end]
+        return (val.decode('utf-8') if b >= 0xd9 else val), end
+    elif b in _array_lengths:
+        fmt, size = _array_lengths[b]
+        return _unpack_array(data, offset + size, unpack_from(fmt, data, offset)[0])
+    elif b in _map_lengths:
+        fmt, size = _map_lengths[b]
+        return _unpack_map(data, offset + size, unpack_from(fmt, data, offset)[0])
+
+    raise CodecError('Unsupported MessagePack type byte: 0x{0:02x}'.format(b))
+
+def _unpack_array(data, offset, n):
+    items = []
+    for i in xrange(n):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+def _unpack_map(data, offset, n):
+    items = {}
+    for i in xrange(n):
+        k, offset = _unpack(data, offset)
+        v, offset = _unpack(data, offset)
+        items[k] = v
+    return items, offset
+
+def unpack(data):
+    """
+    Deserialises a MessagePack string, strings come back as unicode the same way json.loads() hands them back.
+    """
+    data = to_bytes(data)
+    try:
+        obj, offset = _unpack(data, 0)
+    except (IndexError, struct_error) as e:
+        raise CodecError('Truncated MessagePack data: {0}'.format(e))
+
+    if offset > len(data):
+        raise CodecError('Truncated MessagePack data')
+    elif offset < len(data):
+        raise CodecError('Trailing data after MessagePack value')
+    return obj
+
+try:
+    import msgpack
+
+    def pack(obj):
+        return msgpack.packb(obj, use_bin_type=False)
+
+    def unpack(data):
+        try:
+            # Happy to read straight out of a buffer, no need to copy it into a string first.
+            return msgpack.unpackb(data if isinstance(data, (memoryview, bytearray)) else str(data), raw=False)
+        except ValueError as e:
+            raise CodecError(str(e))
+
+    implementation = 'msgpack'
+except ImportError:
+    pass
+
+
+# codec id -> (encode, decode)
+codecs = {
+    JSON: (json.dumps, lambda data: json.loads(to_bytes(data))),
+    MSGPACK: (pack, unpack)
+}
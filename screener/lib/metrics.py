@@ -0,0 +1,151 @@
+"""
+Request counters and latency histograms so we can see which handlers are slow or hot.
+"""
+
+from threading import Lock
+from timeit import default_timer as timer
+
+# Each power of 2 is split into SUB_BUCKETS / 2 linear buckets, which keeps every value within ~6% of its bucket.
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS
+HALF_BUCKETS = SUB_BUCKETS >> 1
+
+# Enough buckets for anything up to 2^40us (~12 days), anything bigger ends up in the last bucket.
+MAX_MAGNITUDE = 40 - SUB_BITS + 1
+BUCKETS = SUB_BUCKETS + (MAX_MAGNITUDE - 1) * HALF_BUCKETS
+
+
+def bucket_index(value):
+    """
+    Works out the histogram bucket a (positive integer) value belongs in.
+    """
+    if value < SUB_BUCKETS:
+        return value
+
+    magnitude = value.bit_length() - SUB_BITS
+    index = SUB_BUCKETS + (magnitude - 1) * HALF_BUCKETS + (value >> magnitude) - HALF_BUCKETS
+    return min(index, BUCKETS - 1)
+
+def bucket_value(index):
+    """
+    The highest value that ends up in a bucket.
+    """
+    if index < SUB_BUCKETS:
+        return index
+
+    magnitude = (index - SUB_BUCKETS) // HALF_BUCKETS + 1
+    sub = (index - SUB_BUCKETS) % HALF_BUCKETS + HALF_BUCKETS
+    return ((sub + 1) << magnitude) - 1
+
+
+class Histogram(object):
+    """
+    HDR style histogram of latencies in microseconds. Recording is a couple of integer operations and a list
+    increment, percentiles are worked out by walking the buckets when asked for.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.buckets[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """
+        The value (in microseconds) that p percent of the recorded values are at or below.
+        """
+        if not self.count:
+            return 0
+
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(bucket_value(index), self.max)
+
+        return self.max
+
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "min": self.min or 0,
+            "max": self.max,
+            "mean": round(self.mean(), 1),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9)
+        }
+
+
+class Metrics(object):
+    """
+    Per handler key counters and histograms for each phase of dealing with a request. Latencies are recorded in
+    microseconds.
+    """
+    PHASES = ('decode', 'handle', 'encode', 'write')
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def incr(self, handler_key, counter, n=1):
+        with self.lock:
+            counters = self.counters.setdefault(handler_key, {})
+            counters[counter] = counters.get(counter, 0) + n
+
+    def record(self, handler_key, phase, seconds):
+        with self.lock:
+            try:
+                histogram = self.histograms[(handler_key, phase)]
+            except KeyError:
+                histogram = self.histograms[(handler_key, phase)] = Histogram()
+            histogram.record(seconds * 1000000)
+
+    def snapshot(self):
+        """
+        All of the counters and histogram summaries, keyed by the handler key in hex.
+        """
+        with self.lock:
+            snapshot = {}
+            for handler_key, counters in self.counters.iteritems():
+                snapshot.setdefault('0x{0:02x}'.format(handler_key), {}).update(counters)
+            for (handler_key, phase), histogram in self.histograms.iteritems():
+                snapshot.setdefault('0x{0:02x}'.format(handler_key), {})[phase] = histogram.summary()
+            return snapshot
+
+    def dump(self):
+        """
+        Plain text version of the snapshot, one line per counter/histogram.
+        """
+        lines = []
+        for key, stats in sorted(self.snapshot().iteritems()):
+            for name, stat in sorted(stats.iteritems()):
+                if isinstance(stat, dict):
+                    lines.append('{0} {1} count={count} min={min} mean={mean} p50={p50} p90={p90} p99={p99} p999={p999} max={max}'.format(key, name, **stat))
+                else:
+                    lines.append('{0} {1} {2}'.format(key, name, stat))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,140 @@
+"""
+Keeping track of how a download is getting on.
+"""
+
+from threading import Lock
+import time
+
+
+class Progress(object):
+    """
+    Bytes downloaded out of total for a whole download and each of its files, and how fast it's going.
+
+    update() is called for every chunk so it only adds up the bytes, throughput is worked out at most every interval
+    seconds and each time that's passed to on_update(snapshot). It's always the latest state that's passed on, so
+    however fast the chunks come in whoever is listening hears about it at most 1 / interval times a second.
+    """
+    def __init__(self, total=0, on_update=None, interval=1.0, smoothing=0.3, clock=time.time):
+        self.lock = Lock()
+        self.clock = clock
+        self.on_update = on_update
+        self.interval = interval
+
+        # How much each new sample counts towards the smoothed rate, the rest is what it was before.
+        self.smoothing = smoothing
+
+        self.total = total
+        self.downloaded = 0
+        # name -> [downloaded, total, downloaded at the last sample, smoothed rate]
+        self.files = {}
+
+        # Bytes a second over the last sample and smoothed over the ones before it.
+        self.rate = 0.0
+        self.smoothed_rate = None
+
+        self.started = self.last_sample = clock()
+        self.last_downloaded = 0
+
+    def add_file(self, name, total, downloaded=0):
+        """
+        Adds a file of total bytes to the download, downloaded of them having been fetched already (e.g. by an
+        earlier attempt) which doesn't count towards the rate.
+        """
+        with self.lock:
+            self.total += total
+            self.downloaded += downloaded
+            self.last_downloaded += downloaded
+            self.files[name] = [downloaded, total, downloaded, None]
+
+    def update(self, n, name=None):
+        """
+        Adds n bytes just downloaded, of the file name if given.
+        """
+        with self.lock:
+            self.downloaded += n
+            if name is not None:
+                self.files[name][0] += n
+
+            now = self.clock()
+            if now - self.last_sample < self.interval:
+                return
+            self.sample(now)
+            snapshot = self.snapshot_locked()
+
+        # Outside the lock, whoever's listening may take a while about it.
+        if self.on_update is not None:
+            self.on_update(snapshot)
+
+    def finish(self):
+        """
+        Passes on the final state, however soon it is after the last update.
+        """
+        with self.lock:
+            self.sample(self.clock())
+            snapshot = self.snapshot_locked()
+
+        if self.on_update is not None:
+            self.on_update(snapshot)
+
+    def sample(self, now):
+        # Call with the lock held.
+        elapsed = now - self.last_sample
+        if elapsed <= 0:
+            return
+
+        self.rate = (self.downloaded - self.last_downloaded) / elapsed
+        self.smoothed_rate = self.smooth(self.smoothed_rate, self.rate)
+        for info in self.files.itervalues():
+            info[3] = self.smooth(info[3], (info[0] - info[2]) / elapsed)
+            info[2] = info[0]
+
+        self.last_sample = now
+        self.last_downloaded = self.downloaded
+
+    def smooth(self, smoothed, rate):
+        if smoothed is None:
+            return rate
+        return self.smoothing * rate + (1 - self.smoothing) * smoothed
+
+    @staticmethod
+    def eta(downloaded, total, rate):
+        """
+        Seconds left to download the rest of total at rate, None if there's no telling.
+        """
+        if downloaded >= total:
+            return 0
+        if not rate:
+            return None
+        return (total - downloaded) / rate
+
+    def snapshot(self):
+        """
+        Returns:
+            How far the download has got as a dict that can be sent to the client: downloaded, total, progress
+            (0 to 1), rate and smoothed_rate in bytes a second, eta in seconds (None until there's a rate to go on),
+            elapsed seconds and the same for each file, keyed by name, under files.
+        """
+        with self.lock:
+            return self.snapshot_locked()
+
+    def snapshot_locked(self):
+        files = {}
+        for name, (downloaded, total, last, rate) in self.files.iteritems():
+            files[name] = {
+                "downloaded": downloaded,
+                "total": total,
+                "progress": float(downloaded) / total if total else 1.0,
+                "rate": rate or 0.0,
+                "eta": self.eta(downloaded, total, rate)
+            }
+
+        return {
+            "downloaded": self.downloaded,
+            "total": self.total,
+            "progress": float(self.downloaded) / self.total if self.total else 1.0,
+            "rate": self.rate,
+            "smoothed_rate": self.smoothed_rate or 0.0,
+            "eta": self.eta(self.downloaded, self.total, self.smoothed_rate),
+            "elapsed": self.clock() - self.started,
+            "files": files
+        }
@@ -0,0 +1,109 @@
+"""
+Bandwidth limiting for ingest downloads.
+"""
+
+from datetime import datetime
+from threading import Lock
+import re, time
+
+
+class TokenBucket(object):
+    """
+    Lets through rate bytes a second on average, with bursts of up to burst bytes. consume() blocks the caller until
+    it's allowed to carry on, which for a download slows down reading from the socket and so the sender too.
+    A rate of 0 means no limit.
+    """
+    def __init__(self, rate=0, burst=None):
+        self.lock = Lock()
+        self.burst = burst
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            # A second's worth by default, and at least enough for a few chunks to go through in one go.
+            self.capacity = self.burst or max(rate, 64 * 1024)
+            self.tokens = self.capacity
+            self.last = time.time()
+
+    def consume(self, n):
+        with self.lock:
+            if not self.rate:
+                return
+
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+            # Go into debt rather than waiting for enough tokens, so a chunk bigger than the bucket still gets through
+            # and whoever comes next waits for it to be paid off.
+            self.tokens -= n
+            wait = -self.tokens / float(self.rate) if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+class Profile(object):
+    """
+    Different rates for different times of day, given as comma separated HH:MM-HH:MM=rate windows, e.g.
+    "09:00-23:30=2048". A window can go past midnight ("22:00-02:00=512"), the first matching window wins.
+    """
+    window_re = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(\d+)\s*$')
+
+    def __init__(self, spec=''):
+        # [(start minute of the day, end minute of the day, rate)]
+        self.windows = []
+        for window in filter(None, (spec or '').split(',')):
+            match = self.window_re.match(window)
+            if match is None:
+                raise ValueError('Invalid bandwidth window: "{0}"'.format(window))
+
+            start_h, start_m, end_h, end_m, rate = [int(part) for part in match.groups()]
+            self.windows.append((start_h * 60 + start_m, end_h * 60 + end_m, rate))
+
+    def rate_at(self, when, default=0):
+        minute = when.hour * 60 + when.minute
+        for start, end, rate in self.windows:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return rate
+        return default
+
+
+class ScheduledBucket(TokenBucket):
+    """
+    A TokenBucket whose rate follows a Profile through the day (default outside any of its windows) unless it's
+    been overridden. The profile is checked at most once a second from consume().
+    """
+    def __init__(self, profile, default=0, burst=None, scale=1):
+        self.profile = profile
+        self.default = default
+        self.override = None
+
+        # Profile and override rates are multiplied by this, e.g. 1024 for rates given in KB/s.
+        self.scale = scale
+
+        TokenBucket.__init__(self, self.scheduled_rate(), burst)
+        self.checked = time.time()
+
+    def scheduled_rate(self, when=None):
+        if self.override is not None:
+            return self.override * self.scale
+        return self.profile.rate_at(when or datetime.now(), self.default) * self.scale
+
+    def set_override(self, rate):
+        """
+        Sticks to rate whatever the time of day, or goes back to following the profile if rate is None.
+        """
+        self.override = rate
+        self.set_rate(self.scheduled_rate())
+
+    def consume(self, n):
+        now = time.time()
+        if now - self.checked >= 1:
+            self.checked = now
+            rate = self.scheduled_rate()
+            if rate != self.rate:
+                self.set_rate(rate)
+
+        TokenBucket.consume(self, n)
@@ -2,10 +2,15 @@
 Utility functions
 """
 
+from bisect import bisect_right
+from collections import OrderedDict, deque
 from struct import pack, unpack
 from Queue import Queue
+from threading import Lock, Condition
 from uuid import uuid4
-import json, klv, os, sys
+import json, klv, os, sys, time
+
+from screener.lib.codec import codecs, CodecError, JSON
 
 
 def int_to_bytes(num):
@@ -36,58 +41,493 @@ def encode_msg(handler_key, **kwargs):
     '''
     Takes json serialisable python objects and constructs a SMTPE compliant KLV message.
     '''
-    # See SMPTE ST-336-2007 for details on the header format
-    key = [0x06, 0x0e, 0x2b, 0x34, 0x02, 0x04, 0x01] + ([0x00] * 8) + [handler_key]
-    if kwargs:
-        value = json.dumps(kwargs)
-        msg = klv.encode(key, value)
-    else:
-        msg = bytearray(key + [0x00]) # 0 length, 0 message
+    return encode_value(handler_key, kwargs)
+
+# See SMPTE ST-336-2007 for details on the header format, byte 14 of the key tells the other end which codec to use.
+KEY_PREFIX = '\x06\x0e\x2b\x34\x02\x04\x01' + ('\x00' * 7)
+
+# Bytes 10-13 of the key are free for a client to tag a request with a correlation id, the response to it comes
+# back with the same id so the client can have lots of requests in flight at once. 0 means untagged.
+CORRELATION_OFFSET = 10
+
+# Every response key we send is one of 256 handler keys in one of a couple of codecs, so build each key once.
+key_headers = {}
+
+def key_header(handler_key, codec=JSON, correlation=0):
+    if correlation:
+        return KEY_PREFIX[:CORRELATION_OFFSET] + pack('>I', correlation) + chr(codec) + chr(handler_key)
+
+    try:
+        return key_headers[(codec, handler_key)]
+    except KeyError:
+        header = key_headers[(codec, handler_key)] = KEY_PREFIX + chr(codec) + chr(handler_key)
+        return header
+
+def correlation_id(key):
+    '''
+    The correlation id a message was tagged with, 0 if it wasn't.
+    '''
+    return unpack('>I', str(key[CORRELATION_OFFSET:CORRELATION_OFFSET + 4]))[0]
+
+def correlate(parts, correlation):
+    '''
+    Tags an already encoded message (from encode_parts()) with a correlation id, only the header gets copied so
+    cached responses can be sent back to any request.
+    '''
+    if not correlation:
+        return parts
+
+    header = parts[0]
+    return [header[:CORRELATION_OFFSET] + pack('>I', correlation) + header[CORRELATION_OFFSET + 4:]] + parts[1:]
+
+short_ber = [chr(n) for n in xrange(128)]
 
-    return msg
+def encode_ber(length):
+    '''
+    BER encodes a value length, short form up to 127 and the shortest long form after that.
+    '''
+    if length < 128:
+        return short_ber[length]
+
+    packed = pack('>Q', length).lstrip('\x00')
+    return chr(0x80 | len(packed)) + packed
+
+def encode_parts(handler_key, value, codec=JSON, correlation=0):
+    '''
+    Encodes a KLV message as [key + length, value] ready to hand to writeSequence(), which saves copying the value
+    into a new buffer just to stick a 17-25 byte header on the front of it.
+    '''
+    if not value:
+        return [key_header(handler_key, codec, correlation) + '\x00'] # 0 length, 0 message
+
+    body = codecs[codec][0](value)
+    return [key_header(handler_key, codec, correlation) + encode_ber(len(body)), body]
+
+def encode_value(handler_key, value, codec=JSON):
+    '''
+    Constructs a SMPTE compliant KLV message, serialising the value dictionary with the codec given.
+    '''
+    return bytearray(''.join(encode_parts(handler_key, value, codec)))
 
 def decode_msg(msg, header_len=16):
-    k, v = klv.decode(msg, header_len)
-    decoded_val = json.loads(bytes_to_str(v)) if v else {}
+    '''
+    Splits a KLV message into its key (as a bytearray) and decoded value. msg can be a memoryview onto a receive
+    buffer, only the key gets copied out of it and the value is handed to the codec as a view.
+    '''
+    k = bytearray(msg[:header_len])
+
+    # BER length is at most 9 bytes, see encode_ber()
+    val_length, ber_length = klv.decode_ber(bytearray(msg[header_len:header_len + 9]))
+    start = header_len + ber_length
+    v = msg[start:start + val_length]
+
+    try:
+        decode = codecs[k[14]][1]
+    except KeyError:
+        raise CodecError('Unknown codec: {0}'.format(k[14]))
+
+    decoded_val = decode(v) if val_length else {}
     return k, decoded_val
 
+def msg_length(buf, offset=0, header_len=16, end=None):
+    '''
+    Works out the total length of the KLV message starting at offset in buf (key + BER length + value).
+    Returns None if there aren't enough bytes in the buffer yet to tell. end is where the data in buf stops if
+    it doesn't fill the whole buffer.
+    '''
+    if end is None:
+        end = len(buf)
+
+    ber_offset = offset + header_len
+    if end <= ber_offset:
+        return None
+
+    # Short form BER is a single byte, long form tells us how many more bytes hold the length.
+    ber_length = 1
+    if buf[ber_offset] > 127:
+        ber_length += buf[ber_offset] & 127
+    if end < ber_offset + ber_length:
+        return None
+
+    val_length, ber_length = klv.decode_ber(buf[ber_offset:ber_offset + ber_length])
+    return header_len + ber_length + val_length
+
+
+class KLVStream(object):
+    '''
+    Reassembles KLV messages from a stream of bytes. TCP makes no promises about how our messages are split up
+    between reads so feed() everything that comes off the socket in here and it'll hand back each complete message,
+    holding on to any partial message until the rest of it turns up.
+    '''
+    def __init__(self, header_len=16):
+        self.header_len = header_len
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        buf = self.buffer
+        buf.extend(data)
+
+        msgs = []
+        offset = 0
+        while True:
+            length = msg_length(buf, offset, self.header_len)
+            if length is None or len(buf) < offset + length:
+                break
+
+            msgs.append(buf[offset:offset + length])
+            offset += length
+
+        # Drop everything we've handed out in one go rather than per message.
+        if offset:
+            del buf[:offset]
+
+        return msgs
+
+    def __len__(self):
+        return len(self.buffer)
+
+
+def paginate(keys, limit=None, cursor=None):
+    '''
+    Picks out a page of keys for the handlers that return whole collections. Keys are sorted and the cursor is the
+    last key of the previous page, so paging carries on from the right place if items are added or removed between
+    requests.
+
+    Returns:
+        The keys in the page and the cursor for the next page, None when there aren't any more.
+    '''
+    keys = sorted(keys)
+    start = bisect_right(keys, cursor) if cursor is not None else 0
+    if limit is None:
+        return keys[start:], None
+
+    end = start + max(1, limit)
+    page = keys[start:end]
+    return page, (page[-1] if end < len(keys) else None)
+
+
+VERSION_LOCK = Lock()
+
+class Versioned(object):
+    '''
+    Mixin for the stores that gives them a version number which only ever goes up. Call changed() whenever the
+    contents of the store are modified so anything holding on to a copy of them can tell it's out of date.
+
+    Pass changed() what changed (e.g. added=[uuid]) and, if the store has been given a bus and topic, that gets
+    published as a delta so clients can be told about it rather than having to poll, see ScreenServer.subscribe().
+    With a changelog it's also recorded there and numbered with the change log's version rather than the store's.
+    '''
+    version = 0
+
+    # Set bus and topic to have changes published, event is the name clients subscribe to them by.
+    bus = None
+    topic = None
+    event = None
+    changelog = None
+
+    def changed(self, **delta):
+        with VERSION_LOCK:
+            self.version += 1
+            if not delta or self.topic is None:
+                return
+
+            delta.update(event=self.event, version=self.version)
+
+            # Recorded while we still hold the lock so the change log is in the same order as the changes.
+            if self.changelog is not None:
+                self.changelog.record(self.topic, delta)
+
+        if self.bus is not None:
+            self.bus.publish(self.topic, delta)
+
 
 class IndexableQueue(Queue, object):
     '''
     Variant of Queue that returns queue item uuid on put() and allows reference to that item by its uuid.
-    The queue backend is a list of tuples instead of a deque, index 0 is the uuid, index 1 is the item.
-    [(item0_uuid, item0), (item1_uuid, item1), (item2_uuid, item2), ...]
-    
-    This is slightly better than an OrderedDict because we'll be consuming in a queue-like fashion primarily
-    and only doing a seek on the odd occasion so this implementation is better in my opinion.
+
+    Items go in with a priority (higher comes out first, items with the same priority come out in the order they
+    went in) and can be moved about or cancelled while they're waiting. Each priority has its own deque of entries,
+    [uuid, item, live, priority], with a uuid -> entry index on the side so everything is O(1) apart from picking the highest
+    priority, which is over the handful of priorities in use rather than the items. Cancelling or moving an entry
+    just marks it dead and drops it from the index, get() skips over the dead ones.
     '''
+    def _init(self, maxsize):
+        # priority -> deque of entries
+        self.queue = {}
+        self.index = {}
+
+    def _qsize(self):
+        return len(self.index)
+
+    def _put(self, entry):
+        uuid, item, priority = entry
+        self._append(uuid, item, priority)
+
+    def _append(self, uuid, item, priority, first=False):
+        entry = [uuid, item, True, priority]
+        self.index[uuid] = entry
+
+        line = self.queue.get(priority)
+        if line is None:
+            line = self.queue[priority] = deque()
+        if first:
+            line.appendleft(entry)
+        else:
+            line.append(entry)
+
+    def _get(self):
+        while True:
+            priority = max(self.queue)
+            line = self.queue[priority]
+            entry = line.popleft()
+            if not line:
+                del self.queue[priority]
+
+            if entry[2]:
+                del self.index[entry[0]]
+                return entry[0], entry[1]
+
+    def _tombstone(self, uuid):
+        entry = self.index.pop(uuid)
+        entry[2] = False
+        entry[1] = None
+        return entry
+
+    def get(self, block=True, timeout=None):
+        '''
+        Returns:
+            (uuid, item) for the item at the front of the queue.
+        '''
+        return super(IndexableQueue, self).get(block, timeout)
+
+    def put(self, item, priority=0, block=True, timeout=None, uuid=None):
+        '''
+        Adds an item to the back of the line for its priority. A uuid is made up for it unless one is given, e.g.
+        when putting back an item from before a restart.
+
+        Returns:
+            The uuid the item can be looked up by.
+        '''
+        uuid = uuid or str(uuid4())
+        super(IndexableQueue, self).put((uuid, item, priority), block, timeout)
+        return uuid
+
     def __getitem__(self, uuid):
         with self.mutex:
-            try:
-                return next(item[1] for item in self.queue if item[0] == uuid)
-            except StopIteration:
+            return self.index[uuid][1]
+
+    def __contains__(self, uuid):
+        with self.mutex:
+            return uuid in self.index
+
+    def priority(self, uuid):
+        with self.mutex:
+            return self.index[uuid][3]
+
+    def move(self, uuid, priority=None, first=False):
+        '''
+        Moves a waiting item to the back of the line for priority, or the front if first is True. It stays at the
+        same priority if one isn't given.
+
+        Returns:
+            True if the item was moved, False if it isn't in the queue (any more).
+        '''
+        with self.mutex:
+            if uuid not in self.index:
+                return False
+
+            old = self.index[uuid]
+            item = old[1]
+            self._tombstone(uuid)
+            self._append(uuid, item, old[3] if priority is None else priority, first)
+            return True
+
+    def cancel(self, uuid):
+        '''
+        Takes a waiting item out of the queue, it counts as done as far as join() is concerned.
+
+        Returns:
+            True if the item was cancelled, False if it isn't in the queue (any more).
+        '''
+        with self.mutex:
+            if uuid not in self.index:
+                return False
+
+            self._tombstone(uuid)
+            if not self.index:
+                # Nothing left alive, no need to wait for get() to clear out the dead.
+                self.queue.clear()
+
+            self.unfinished_tasks -= 1
+            if not self.unfinished_tasks:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify()
+            return True
+
+class FairQueue(object):
+    '''
+    Queues items from a number of sources (e.g. FTP hosts) and hands them out round robin between the sources, so a
+    source with a lot queued up can't hold up everyone else. No more than per_source items from the same source are
+    handed out at once, call task_done() when one is finished with to let the next one from that source go.
+
+    Each source has its own IndexableQueue so items can still be looked up by the uuid put() returns, and moved up
+    or down the line for their source by priority.
+    '''
+    def __init__(self, per_source=1):
+        self.per_source = per_source
+
+        # source -> IndexableQueue, in the order they get their next turn. Sources drop out when they run dry.
+        self.queues = OrderedDict()
+        # uuid -> source for everything waiting.
+        self.sources = {}
+        # source -> number of items handed out and not done yet.
+        self.active = {}
+        # Items put() and not yet task_done() or cancelled, for join().
+        self.unfinished = 0
+
+        self.lock = Lock()
+        # Signalled whenever an item might have become ready to go, i.e. one is put() or a source frees up.
+        self.ready = Condition(self.lock)
+        self.all_done = Condition(self.lock)
+        # Set by close(), nothing more is handed out.
+        self.closed = False
+
+    def put(self, source, item, priority=0, uuid=None):
+        with self.lock:
+            if source not in self.queues:
+                self.queues[source] = IndexableQueue()
+            uuid = self.queues[source].put(item, priority, uuid=uuid)
+            self.sources[uuid] = source
+
+            self.unfinished += 1
+            self.ready.notify()
+            return uuid
+
+    def get(self, block=True, timeout=None):
+        '''
+        Takes the next item due, waiting for one if block is True (up to timeout seconds if given).
+
+        Returns:
+            (source, uuid, item), or None if nothing can go (yet) because the queue is empty or the sources with
+            something queued are all at their limit, or at all because the queue has been closed.
+        '''
+        with self.lock:
+            if self.closed:
                 return None
+            job = self._next()
+            if not block or job is not None:
+                return job
 
-    def _init(self, maxsize):
-        self.queue = []
+            end = None if timeout is None else time.time() + timeout
+            while job is None:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
 
-    def _put(self, item):
-        self.queue.append((str(uuid4()), item))
+                self.ready.wait(remaining)
+                if self.closed:
+                    return None
+                job = self._next()
 
-    def _get(self):
-        return self.queue.pop(0)[1]
+            return job
+
+    def close(self):
+        '''
+        Stops handing anything out, whoever is waiting in get() (and whoever calls it from now on) gets None.
+        What's queued stays queued.
+        '''
+        with self.lock:
+            self.closed = True
+            self.ready.notify_all()
+
+    def _next(self):
+        for source, queue in self.queues.iteritems():
+            if self.active.get(source, 0) < self.per_source:
+                break
+        else:
+            return None
+
+        uuid, item = queue.get()
+        del self.sources[uuid]
+        self.active[source] = self.active.get(source, 0) + 1
+
+        # Off to the back of the line, if there's anything left.
+        del self.queues[source]
+        if not queue.empty():
+            self.queues[source] = queue
+
+        return source, uuid, item
+
+    def task_done(self, source):
+        '''
+        Marks an item from source that get() handed out as finished with.
+        '''
+        with self.lock:
+            self.active[source] -= 1
+            if not self.active[source]:
+                del self.active[source]
 
-    def get(self):
-        return self.queue.pop(0)
+            # The next one from this source (if there is one) can go now.
+            self.ready.notify()
+            self._finished(1)
 
-    def put(self, item, **kwargs):
-        super(IndexableQueue, self).put(item, **kwargs)
+    def _finished(self, count):
+        self.unfinished -= count
+        if not self.unfinished:
+            self.all_done.notify_all()
 
-        # return the uuid
-        return next(qitem[0] for qitem in self.queue if qitem[1] == item)
+    def join(self, timeout=None):
+        '''
+        Waits until every item put() has been through task_done() or been cancelled.
+
+        Returns:
+            True if they all have, False if timeout ran out first.
+        '''
+        with self.lock:
+            end = None if timeout is None else time.time() + timeout
+            while self.unfinished:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.all_done.wait(remaining)
+            return True
+
+    def __getitem__(self, uuid):
+        with self.lock:
+            return self.queues[self.sources[uuid]][uuid]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sources)
+
+    def move(self, uuid, priority=None, first=False):
+        '''
+        Moves a waiting item within the line for its source, see IndexableQueue.move()
+        '''
+        with self.lock:
+            if uuid not in self.sources:
+                return False
+            return self.queues[self.sources[uuid]].move(uuid, priority, first)
 
     def cancel(self, uuid):
-        self.queue = [qitem for qitem in self.queue if qitem[0] != uuid]
+        '''
+        Takes a waiting item out of the queue.
+
+        Returns:
+            True if the item was cancelled, False if it isn't waiting (any more).
+        '''
+        with self.lock:
+            source = self.sources.pop(uuid, None)
+            if source is None:
+                return False
+
+            queue = self.queues[source]
+            queue.cancel(uuid)
+            if queue.empty():
+                del self.queues[source]
+
+            self._finished(1)
+            return True
 
 def synchronized(lock):
     """
@@ -154,4 +594,29 @@ def create_hard_link(hard_link_to, source_file):
             error = error + '|| to: |' + str(hard_link_to) + '| source: |' + str(source_file) + '|'
             raise Exception(error)
     else:
-        os.link(source_file, hard_link_to)
\ No newline at end of file
+        os.link(source_file, hard_link_to)
+def save_json(file_path, data):
+    """
+    Writes data out as json without ever leaving a half written file behind, it's written to a temporary file
+    first and moved into place.
+    """
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Windows won't rename over the top of an existing file.
+    if sys.platform == 'win32' and os.path.exists(file_path):
+        os.remove(file_path)
+    os.rename(tmp_path, file_path)
+
+def load_json(file_path, default=None):
+    """
+    Reads back a file written by save_json(), default if it isn't there or can't be read.
+    """
+    try:
+        with open(file_path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return default
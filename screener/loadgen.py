@@ -0,0 +1,261 @@
+'''
+Load generator for sizing Screener instances and catching performance regressions.
+
+Opens a number of connections to a running server and fires a mix of requests at it at a fixed overall rate
+(open loop, i.e. requests go out on schedule whether or not earlier ones have been answered), then reports
+throughput and latency percentiles per operation.
+
+python -m screener.loadgen --connections 50 --rate 2000 --duration 30 --mix status=80,playlist_uuids=10,playlist_insert=5,playlist_delete=5
+'''
+import argparse, json, random, sys
+from itertools import count, cycle
+
+from twisted.internet import reactor, protocol
+from twisted.internet.endpoints import TCP4ClientEndpoint, connectProtocol
+
+from screener.lib.codec import JSON, MSGPACK
+from screener.lib.metrics import Histogram, timer
+from screener.lib.util import encode_parts, decode_msg, correlation_id, KLVStream
+
+ZERO_UUID = "00000000-0000-0000-0000-000000000000"
+
+playlist = json.dumps({
+    "title": "Load test playlist",
+    "duration": 3600,
+    "events": [{
+        "cpl_id": "00000000-0000-0000-0000-100000000001",
+        "type": "composition",
+        "text": "Test CPL",
+        "duration_in_frames": 43200,
+        "duration_in_seconds": 1800,
+        "edit_rate": [24, 1]
+    }]
+})
+
+
+class LoadTest(object):
+    """
+    Keeps the shared state of a run: which operations are available, the playlists we've created and the stats.
+    """
+    def __init__(self, mix, ftp_details=None, dcp_path=None, seed=None):
+        self.random = random.Random(seed)
+        self.ftp_details = ftp_details
+        self.dcp_path = dcp_path
+
+        # Playlists we've created and can go on to get/delete
+        self.playlist_uuids = []
+
+        self.ops = {
+            'status': lambda: (0x02, {}),
+            'system_time': lambda: (0x03, {}),
+            'cpl_uuids': lambda: (0x04, {}),
+            'playlist_uuids': lambda: (0x26, {}),
+            'playlist_insert': lambda: (0x16, {"playlist_contents": playlist}),
+            'playlist_get': lambda: (0x28, {"playlist_uuid": self.pick_playlist()}),
+            'playlist_update': lambda: (0x17, {"playlist_uuid": self.pick_playlist(), "playlist_contents": playlist}),
+            'playlist_delete': lambda: (0x18, {"playlist_uuid": self.pick_playlist(remove=True)}),
+            'schedule_uuids': lambda: (0x19, {}),
+            'ingest': lambda: (0x06, {"connection_details": self.ftp_details, "dcp_path": self.dcp_path})
+        }
+
+        for name in mix:
+            if name not in self.ops:
+                raise ValueError('Unknown operation "{0}", choose from: {1}'.format(name, ', '.join(sorted(self.ops))))
+
+        # Cumulative weights so picking an operation is a single bisect-free walk over a short list.
+        self.mix = []
+        total = 0
+        for name, weight in sorted(mix.iteritems()):
+            total += weight
+            self.mix.append((total, name))
+        self.total_weight = total
+
+        self.latencies = dict((name, Histogram()) for name in mix)
+        self.errors = dict((name, 0) for name in mix)
+        self.sent = 0
+        self.received = 0
+
+    def pick_op(self):
+        point = self.random.random() * self.total_weight
+        for threshold, name in self.mix:
+            if point < threshold:
+                return name
+        return self.mix[-1][1]
+
+    def pick_playlist(self, remove=False):
+        if not self.playlist_uuids:
+            return ZERO_UUID
+
+        index = self.random.randrange(len(self.playlist_uuids))
+        if remove:
+            # Swap with the last one so removing is O(1)
+            self.playlist_uuids[index], self.playlist_uuids[-1] = self.playlist_uuids[-1], self.playlist_uuids[index]
+            return self.playlist_uuids.pop()
+        return self.playlist_uuids[index]
+
+    def record(self, name, latency, rsp):
+        self.received += 1
+        self.latencies[name].record(latency * 1000000)
+
+        if rsp.get('status', 0) != 0:
+            self.errors[name] += 1
+        elif 'playlist_uuid' in rsp and name == 'playlist_insert':
+            self.playlist_uuids.append(rsp['playlist_uuid'])
+
+    def report(self, elapsed, out=sys.stdout):
+        out.write('{0:<18}{1:>10}{2:>8}{3:>12}{4:>10}{5:>10}{6:>10}{7:>10}\n'.format('operation', 'count', 'errors', 'req/s', 'p50 ms', 'p99 ms', 'p999 ms', 'max ms'))
+
+        total = Histogram()
+        for name, histogram in sorted(self.latencies.iteritems()):
+            self.report_line(out, name, histogram, self.errors[name], elapsed)
+
+            # Merge the buckets for the overall line.
+            for index, n in enumerate(histogram.buckets):
+                total.buckets[index] += n
+            total.count += histogram.count
+            total.total += histogram.total
+            total.max = max(total.max, histogram.max)
+
+        self.report_line(out, 'total', total, sum(self.errors.itervalues()), elapsed)
+        out.write('sent {0}, received {1}, unanswered {2} in {3:.1f}s\n'.format(self.sent, self.received, self.sent - self.received, elapsed))
+
+    def report_line(self, out, name, histogram, errors, elapsed):
+        out.write('{0:<18}{1:>10}{2:>8}{3:>12.1f}{4:>10.2f}{5:>10.2f}{6:>10.2f}{7:>10.2f}\n'.format(name, histogram.count, errors,
+            histogram.count / elapsed, histogram.percentile(50) / 1000.0, histogram.percentile(99) / 1000.0,
+            histogram.percentile(99.9) / 1000.0, histogram.max / 1000.0))
+
+
+class LoadProtocol(protocol.Protocol):
+    """
+    One connection to the server. Each request is tagged with a correlation id so we can match up the responses
+    however they come back.
+    """
+    def __init__(self, test, codec=JSON):
+        self.test = test
+        self.codec = codec
+        self.stream = KLVStream()
+
+        # correlation id -> (operation, time sent)
+        self.correlation_ids = count(1)
+        self.pending = {}
+
+    def connectionMade(self):
+        if self.codec != JSON:
+            self.send('negotiate', 0x41, {"codecs": [self.codec]}, codec=JSON)
+
+    def send(self, name, handler_key, kwargs, codec=None):
+        correlation = next(self.correlation_ids)
+        self.pending[correlation] = (name, timer())
+        self.transport.writeSequence(encode_parts(handler_key, kwargs, self.codec if codec is None else codec, correlation))
+
+    def request(self, name):
+        handler_key, kwargs = self.test.ops[name]()
+        self.test.sent += 1
+        self.send(name, handler_key, kwargs)
+
+    def dataReceived(self, data):
+        now = timer()
+        for msg in self.stream.feed(data):
+            k, rsp = decode_msg(msg)
+
+            try:
+                name, sent = self.pending.pop(correlation_id(k))
+            except KeyError:
+                continue # Something we didn't ask for, e.g. ingest progress.
+
+            if name != 'negotiate':
+                self.test.record(name, now - sent, rsp)
+
+
+def run(host, port, connections, rate, duration, test, codec=JSON):
+    """
+    Connects, fires requests at the given rate (per second, across all connections) for duration seconds and
+    stops the reactor once we've given the stragglers a second to come back. Returns how long we were sending for.
+    """
+    endpoint = TCP4ClientEndpoint(reactor, host, port)
+    conns = []
+
+    def connected(p):
+        conns.append(p)
+        if len(conns) == connections:
+            start()
+
+    def failed(failure):
+        sys.stderr.write('Connection failed: {0}\n'.format(failure.getErrorMessage()))
+        if reactor.running:
+            reactor.stop()
+
+    for i in xrange(connections):
+        d = connectProtocol(endpoint, LoadProtocol(test, codec))
+        d.addCallbacks(connected, failed)
+
+    state = {}
+
+    def start():
+        state['start'] = timer()
+        state['next'] = state['start']
+        state['conns'] = cycle(conns)
+        fire()
+
+    def fire():
+        now = timer()
+        if now - state['start'] >= duration:
+            state['elapsed'] = now - state['start']
+            reactor.callLater(1, finish)
+            return
+
+        # Send everything that's due, then sleep until the next one. Exponential gaps give us Poisson arrivals.
+        while state['next'] <= now:
+            next(state['conns']).request(test.pick_op())
+            state['next'] += test.random.expovariate(rate)
+
+        reactor.callLater(max(0, state['next'] - timer()), fire)
+
+    def finish():
+        for p in conns:
+            p.transport.loseConnection()
+        reactor.stop()
+
+    reactor.run()
+    return state.get('elapsed')
+
+
+def parse_mix(mix):
+    '''
+    Turns "status=80,playlist_uuids=20" into {"status": 80, "playlist_uuids": 20}
+    '''
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Screener load generator')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9500)
+    parser.add_argument('--connections', type=int, default=10, help='Number of concurrent connections')
+    parser.add_argument('--rate', type=float, default=1000, help='Requests per second across all connections')
+    parser.add_argument('--duration', type=float, default=10, help='How long to run for, in seconds')
+    parser.add_argument('--mix', default='status=80,playlist_uuids=10,playlist_insert=5,playlist_delete=5',
+        help='Comma separated operation=weight pairs')
+    parser.add_argument('--codec', choices=['json', 'msgpack'], default='json')
+    parser.add_argument('--ftp', default=None, help='FTP details for ingest operations as host:port:user:passwd')
+    parser.add_argument('--dcp-path', default=None, help='DCP to ingest for ingest operations')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    ftp_details = None
+    if args.ftp:
+        host, port, user, passwd = args.ftp.split(':', 3)
+        ftp_details = {"host": host, "port": int(port), "user": user, "passwd": passwd}
+
+    test = LoadTest(parse_mix(args.mix), ftp_details, args.dcp_path, args.seed)
+    codec = MSGPACK if args.codec == 'msgpack' else JSON
+
+    elapsed = run(args.host, args.port, args.connections, args.rate, args.duration, test, codec)
+    if elapsed:
+        test.report(elapsed)
+
+if __name__ == '__main__':
+    main()
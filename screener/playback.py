@@ -1,17 +1,28 @@
 from screener import rsp_codes
+from screener.lib.util import Versioned
 from smpteparsers.cpl import CPL
 from smpteparsers.playlist import Playlist, PlaylistValidationError
 
 EJECT, STOP, PLAY, PAUSE = range(4)
 
-class Playback(object):
-    def __init__(self, content, playlists):
+class Playback(Versioned):
+    event = 'playback'
+
+    def __init__(self, content, playlists, bus=None):
         self.content = content
         self.playlists = playlists
 
+        # State changes are published on here once we've been given a topic, see Versioned.
+        self.bus = bus
+
         self.state = EJECT
         self.loaded_item = None
 
+    def set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.changed(state=state)
+
     def load_cpl(self, cpl_uuid, *args):
         """
         Loads a CPL for playback
@@ -96,8 +107,8 @@ class Playback(object):
 
                 0 -- Success
         """
-        self.state = EJECT
         self.loaded_item = None
+        self.set_state(EJECT)
 
         return rsp_codes[0]
 
@@ -114,7 +125,7 @@ class Playback(object):
         if self.loaded_item is None:
             return rsp_codes[3]
 
-        self.state = PLAY
+        self.set_state(PLAY)
         return rsp_codes[0]
 
     def stop(self, *args):
@@ -127,7 +138,7 @@ class Playback(object):
                 0 -- Success
         """
 
-        self.state = STOP
+        self.set_state(STOP)
         return rsp_codes[0]
 
     def pause(self, *args):
@@ -143,7 +154,7 @@ class Playback(object):
         if self.loaded_item is None:
             return rsp_codes[3]
 
-        self.state = PAUSE
+        self.set_state(PAUSE)
         return rsp_codes[0]
 
     def skip_forward(self, *args):
@@ -256,7 +267,7 @@ class Playback(object):
 
             Also brief information on playlist or cpl loaded, if one is loaded.
         """
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['state'] = self.state
 
         if isinstance(self.loaded_item, Playlist):
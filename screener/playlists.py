@@ -2,16 +2,21 @@ from uuid import uuid4
 import traceback, os, json
 
 from screener import rsp_codes
+from screener.lib.util import Versioned, paginate
 from smpteparsers.playlist import Playlist, PlaylistValidationError
 
-class Playlists(object):
-    def __init__(self, playlists_path=None):
+class Playlists(Versioned):
+    event = 'playlists'
+
+    def __init__(self, playlists_path=None, bus=None):
         """
         Initialises the Playlist store, reads in playlists stored on disk if the path is supplied.
 
         Args:
             playlists_path (string, None): The directory containing the playlist files in json format.
+            bus (Bus, None): Changes are published on here once we've been given a topic, see Versioned.
         """
+        self.bus = bus
         self.playlists = {}
         self.playlists_path = playlists_path
 
@@ -60,26 +65,36 @@ class Playlists(object):
                 0 -- Success
         """
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['playlist_uuids'] = self.playlists.keys()
         return rsp
 
-    def get_playlists(self, playlist_uuids, *args):
+    def get_playlists(self, playlist_uuids=None, limit=None, cursor=None, *args):
         """
-        Grab information about a particular playlist
+        Grab information about a list of playlists, a page at a time if a limit is given.
 
         Args:
-            playlist_uuids (list): The UUIDs of the playlists you want to grab info for.
+            playlist_uuids (list, None): The UUIDs of the playlists you want to grab info for, all of them if not given.
+            limit (int, None): The most playlists to return in one response.
+            cursor (string, None): The next_cursor from the previous page, start from the beginning if not given.
 
         Returns:
             The return status::
 
                 0 -- Success
                 2 -- Playlist not found
+
+            The playlists, plus next_cursor (null on the last page) if a limit was given.
         """
+        if playlist_uuids is None:
+            playlist_uuids = self.playlists.keys()
+        elif any(playlist_uuid not in self.playlists for playlist_uuid in playlist_uuids):
+            return rsp_codes[2]
+
+        page, next_cursor = paginate(playlist_uuids, limit, cursor)
 
         playlists = []
-        for playlist_uuid in playlist_uuids:
+        for playlist_uuid in page:
             status = self.get_playlist(playlist_uuid)
             if status['status'] != 0:
                 return status # Error getting the playlist
@@ -87,8 +102,10 @@ class Playlists(object):
             # Discard the other information and keep the playlist object :)
             playlists.append(status['playlist'])
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['playlists'] = playlists
+        if limit is not None:
+            rsp['next_cursor'] = next_cursor
         return rsp
 
     def get_playlist(self, playlist_uuid, *args):
@@ -108,7 +125,7 @@ class Playlists(object):
         if playlist_uuid not in self.playlists:
             return rsp_codes[2]
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['playlist'] = self.playlists[playlist_uuid]
         return rsp
 
@@ -142,8 +159,9 @@ class Playlists(object):
             return rsp
 
         self.playlists[playlist_uuid] = playlist
+        self.changed(added=[playlist_uuid])
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['playlist_uuid'] = playlist_uuid
         return rsp
 
@@ -174,6 +192,7 @@ class Playlists(object):
             return rsp
 
         self.playlists[playlist_uuid] = playlist
+        self.changed(updated=[playlist_uuid])
 
         return rsp_codes[0]
 
@@ -196,4 +215,6 @@ class Playlists(object):
         except KeyError:
             return rsp_codes[2]
 
+        self.changed(removed=[playlist_uuid])
+
         return rsp_codes[0]
@@ -1,12 +1,18 @@
 from uuid import uuid4
 from screener import rsp_codes
+from screener.lib.util import Versioned
 
-class Schedule(object):
-    def __init__(self, content, playlists, playback):
+class Schedule(Versioned):
+    event = 'schedule'
+
+    def __init__(self, content, playlists, playback, bus=None):
         self.content = content
         self.playlists = playlists
         self.playback = playback
 
+        # Scheduled playback events are published on here, to the topic of the client that scheduled them.
+        self.bus = bus
+
         # List of upcoming scheduled showings ordered by closest date to now() first
         self.schedule = {}
 
@@ -25,7 +31,7 @@ class Schedule(object):
                 0 -- Success
         """
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['schedule_uuids'] = self.schedule.keys()
         return rsp
 
@@ -57,7 +63,7 @@ class Schedule(object):
 
             schedules.append(schedule)
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['schedules'] = schedules
         return rsp
 
@@ -84,8 +90,9 @@ class Schedule(object):
         if schedule_uuid not in self.schedule:
             return rsp_codes[10]
 
-        # Clean up the schedule ready for returning to the client.
-        schedule = self.schedule[schedule_uuid]
+        # Clean up a copy of the schedule ready for returning to the client, we still need the original to play it.
+        schedule = dict(self.schedule[schedule_uuid])
+        schedule.pop('reply_to', None)
         if 'cpl' in schedule:
             schedule['cpl_uuid'] = schedule['cpl'].uuid
             del(schedule['cpl'])
@@ -93,11 +100,11 @@ class Schedule(object):
             schedule['playlist_uuid'] = schedule['playlist'].uuid
             del(schedule['playlist'])
 
-        rsp = rsp_codes[0]
+        rsp = dict(rsp_codes[0])
         rsp['schedule'] = schedule
         return rsp
 
-    def schedule_cpl(self, cpl_uuid, start_datetime, *args):
+    def schedule_cpl(self, cpl_uuid, start_datetime, reply_to=None, *args):
         """
         Schedules a cpl to play at a specified date/time.
 
@@ -124,14 +131,16 @@ class Schedule(object):
 
             # Just make sure we don't overwrite an existing schedule!
             if schedule_uuid not in self.schedule:
-                self.schedule[schedule_uuid] = {"start": start_datetime, "cpl": cpl}
+                self.schedule[schedule_uuid] = {"start": start_datetime, "cpl": cpl, "reply_to": reply_to}
                 break
 
-        rsp = rsp_codes[0]
+        self.changed(added=[schedule_uuid])
+
+        rsp = dict(rsp_codes[0])
         rsp['schedule_uuid'] = schedule_uuid
         return rsp
 
-    def schedule_playlist(self, playlist_uuid, start_datetime, *args):
+    def schedule_playlist(self, playlist_uuid, start_datetime, reply_to=None, *args):
         """
         Schedules a playlist to play at a specified date/time.
 
@@ -158,10 +167,12 @@ class Schedule(object):
 
             # Just make sure we don't overwrite an existing schedule!
             if schedule_uuid not in self.schedule:
-                self.schedule[schedule_uuid] = {"start": start_datetime, "playlist": playlist}
+                self.schedule[schedule_uuid] = {"start": start_datetime, "playlist": playlist, "reply_to": reply_to}
                 break
 
-        rsp = rsp_codes[0]
+        self.changed(added=[schedule_uuid])
+
+        rsp = dict(rsp_codes[0])
         rsp['schedule_uuid'] = schedule_uuid
         return rsp
 
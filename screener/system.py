@@ -14,6 +14,6 @@ def system_time(*args):
         Also the time in POSIX UTC format
     """
 
-    rsp = rsp_codes[0]
+    rsp = dict(rsp_codes[0])
     rsp['time'] = int(time())
     return rsp
\ No newline at end of file
@@ -10,5 +10,5 @@ setup(
     url = 'http://www.artsalliancemedia.com',
     packages = ('screener',),
     requires = ('klv', 'twisted', 'smpteparsers'),
-    extras_require = {"docs": ("sphinx",)}
+    extras_require = {"docs": ("sphinx",), "msgpack": ("msgpack-python",)}
 )
\ No newline at end of file
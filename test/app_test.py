@@ -0,0 +1,191 @@
+import unittest, gc, os, shutil, time
+from threading import Event
+
+from twisted.internet import reactor
+from twisted.python.threadpool import ThreadPool
+from twisted.test.proto_helpers import StringTransport
+
+from screener.app import ScreenServer, Screener
+from screener.lib.changelog import ChangeLog
+from screener.lib.util import encode_msg, encode_parts, correlation_id, KLVStream, decode_msg
+from playlists_test import success_playlist
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+class FakeFactory(object):
+    def __init__(self, ss):
+        self.ss = ss
+        self.clients = set()
+        self.pool = ThreadPool(minthreads=1, maxthreads=1)
+        self.pool.start()
+
+class TestScreener(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+        self.factory = FakeFactory(self.s)
+
+        self.transport = StringTransport()
+        self.protocol = Screener(self.s, self.factory)
+        self.protocol.makeConnection(self.transport)
+
+    def tearDown(self):
+        self.protocol.connectionLost(None)
+        self.factory.pool.stop()
+
+        self.s.content.stop()
+
+        # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def responses(self):
+        msgs = KLVStream().feed(self.transport.value())
+        self.transport.clear()
+        return [decode_msg(msg) for msg in msgs]
+
+    def test_merged_and_split_requests(self):
+        data = str(encode_msg(0x02) + encode_msg(0x03) + encode_msg(0x26))
+
+        self.protocol.dataReceived(data[:5])
+        self.assertEqual(self.responses(), [])
+
+        self.protocol.dataReceived(data[5:])
+        self.assertEqual([k[15] for k, v in self.responses()], [0x02, 0x03, 0x26])
+
+    def test_pooled_handler_does_not_block(self):
+        started, release = Event(), Event()
+        def slow_handler(**kwargs):
+            started.set()
+            release.wait(5)
+            return {"status": 0}
+        self.s.handlers[0x30] = slow_handler
+
+        try:
+            self.protocol.dataReceived(str(encode_msg(0x30)))
+            self.assertTrue(started.wait(5))
+
+            # Status comes straight back while the slow handler is still going.
+            self.protocol.dataReceived(str(encode_msg(0x02)))
+            self.assertEqual([k[15] for k, v in self.responses()], [0x02])
+        finally:
+            release.set()
+
+    def test_pooled_failure_responds(self):
+        def broken_handler(**kwargs):
+            raise TypeError('Unexpected argument')
+        self.s.handlers[0x30] = broken_handler
+
+        self.protocol.dataReceived(''.join(encode_parts(0x30, {}, correlation=7)))
+
+        # The response comes back from the pool through the reactor.
+        end = time.time() + 5
+        while not self.transport.value() and time.time() < end:
+            reactor.runUntilCurrent()
+            time.sleep(0.01)
+
+        (k, v), = self.responses()
+        self.assertEqual((k[15], correlation_id(k)), (0x30, 7))
+        self.assertEqual(v['status'], 15)
+
+    def test_batch_pooled_only_if_read_only(self):
+        self.assertTrue(self.s.is_pooled(0x40, {"requests": [[0x30, {}], [0x27, {}]]}))
+        self.assertFalse(self.s.is_pooled(0x40, {"requests": [[0x30, {}], [0x00, {}]]}))
+        self.assertFalse(self.s.is_pooled(0x40, {"requests": []}))
+        self.assertFalse(self.s.is_pooled(0x40, {"requests": "junk"}))
+        self.assertFalse(self.s.is_pooled(0x00, {}))
+
+    def test_async_rsp_routed_to_connection(self):
+        other_transport = StringTransport()
+        other = Screener(self.s, self.factory)
+        other.makeConnection(other_transport)
+
+        try:
+            self.assertNotEqual(self.protocol.topic, other.topic)
+
+            self.s.bus.publish(other.topic, 0x08, {"status": 0, "ingest_uuid": "foo", "state": 1})
+            reactor.runUntilCurrent()
+
+            self.assertEqual(self.transport.value(), '')
+            k, v = decode_msg(other_transport.value())
+            self.assertEqual(k[15], 0x08)
+            self.assertEqual(v['ingest_uuid'], 'foo')
+        finally:
+            other.connectionLost(None)
+
+        self.assertFalse(other.topic in self.s.bus.subscriptions)
+
+    def test_ingest_told_reply_topic(self):
+        ingests = []
+        def ingest(connection_details, dcp_path, reply_to=None):
+            ingests.append(reply_to)
+            return {"status": 0}
+        self.s.handlers[0x06] = ingest
+
+        self.protocol.dataReceived(str(encode_msg(0x06, connection_details={}, dcp_path="foo")))
+        self.assertEqual(ingests, [self.protocol.topic])
+
+    def test_correlation_echoed(self):
+        # The second 0x04 comes from the response cache but still needs its own id.
+        for handler_key, correlation in [(0x02, 1), (0x04, 2), (0x04, 3), (0x03, 0)]:
+            self.protocol.dataReceived(''.join(encode_parts(handler_key, {}, correlation=correlation)))
+
+        self.assertEqual([(k[15], correlation_id(k)) for k, v in self.responses()], [(0x02, 1), (0x04, 2), (0x04, 3), (0x03, 0)])
+
+    def test_write_after_disconnect(self):
+        self.protocol.connected = 0
+        self.protocol.write_rsp((0x30, {"status": 0}, [str(encode_msg(0x30, status=0))]))
+        self.assertEqual(self.transport.value(), '')
+
+class TestSharedContent(unittest.TestCase):
+    def setUp(self):
+        self.first = ScreenServer(paths=paths)
+
+        self.second_paths = {'playlists': os.path.join(paths['playlists'], 'screen_2')}
+        self.second = ScreenServer(paths=self.second_paths, content=self.first.content, bus=self.first.bus)
+
+    def tearDown(self):
+        self.first.content.stop()
+
+        # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
+        del(self.first)
+        del(self.second)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v, ignore_errors=True)
+
+    def test_content_shared(self):
+        self.assertTrue(self.first.content is self.second.content)
+        self.assertTrue(self.first.bus is self.second.bus)
+
+        self.assertEqual(self.first.process_msg(0x04)[1]['cpl_uuids'], self.second.process_msg(0x04)[1]['cpl_uuids'])
+
+    def test_changelog_shared(self):
+        # Content changes are all logged in one place whichever screen was built last.
+        self.assertTrue(self.second.changelog is self.first.changelog)
+        self.assertTrue(self.first.content.changelog is self.first.changelog)
+
+        self.assertRaises(ValueError, ScreenServer, paths={'playlists': os.path.join(paths['playlists'], 'screen_3')},
+                          content=self.first.content, bus=self.first.bus, changelog=ChangeLog())
+
+    def test_screen_state_separate(self):
+        self.assertFalse(self.first.playlists is self.second.playlists)
+        self.assertFalse(self.first.playback is self.second.playback)
+        self.assertFalse(self.first.schedule is self.second.schedule)
+
+        k,v = self.first.process_msg(0x16, playlist_contents=success_playlist)
+        self.assertEqual(v['status'], 0)
+
+        self.assertEqual(len(self.first.process_msg(0x26)[1]['playlist_uuids']), 1)
+        self.assertEqual(len(self.second.process_msg(0x26)[1]['playlist_uuids']), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest, gc, os, shutil
+
+from screener.app import ScreenServer
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+
+    def tearDown(self):
+        self.s.content.stop()
+
+        # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def test_empty(self):
+        k,v = self.s.process_msg(0x40, requests=[])
+        self.assertEqual(k, 0x40)
+        self.assertEqual(v['status'], 0)
+        self.assertEqual(v['results'], [])
+
+    def test_results_in_order(self):
+        k,v = self.s.process_msg(0x40, requests=[
+            [0x02, {}],
+            [0x28, {"playlist_uuid": "00000000-0000-0000-0000-000000000000"}],
+            [0x03, {}]
+        ])
+        self.assertEqual(k, 0x40)
+        self.assertEqual(v['status'], 0)
+        self.assertEqual([result[0] for result in v['results']], [0x02, 0x28, 0x03])
+
+        self.assertEqual(v['results'][0][1]['status'], 0)
+        self.assertEqual(v['results'][0][1]['state'], 0)
+        self.assertEqual(v['results'][1][1]['status'], 2) # Playlist not found
+        self.assertEqual(v['results'][2][1]['status'], 0)
+        self.assertTrue('time' in v['results'][2][1])
+
+    def test_invalid(self):
+        # Unknown handler key
+        k,v = self.s.process_msg(0x40, requests=[[0x02, {}], [0xFF, {}]])
+        self.assertEqual(v['status'], 12)
+        self.assertEqual(v['index'], 1)
+
+        # No nesting batches
+        k,v = self.s.process_msg(0x40, requests=[[0x40, {"requests": []}]])
+        self.assertEqual(v['status'], 12)
+        self.assertEqual(v['index'], 0)
+
+        # The codec can only be switched on its own
+        k,v = self.s.process_msg(0x40, requests=[[0x02, {}], [0x41, {"codecs": ["json"]}]])
+        self.assertEqual(v['status'], 12)
+        self.assertEqual(v['index'], 1)
+
+        # Malformed request
+        k,v = self.s.process_msg(0x40, requests=[[0x02]])
+        self.assertEqual(v['status'], 12)
+        self.assertEqual(v['index'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
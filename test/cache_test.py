@@ -0,0 +1,76 @@
+import unittest, gc, os, shutil
+
+from screener.app import ScreenServer
+from screener.lib.util import decode_msg
+from screener.lib.codec import JSON, MSGPACK
+from playlists_test import success_playlist
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+
+    def tearDown(self):
+        self.s.content.stop()
+
+        # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def test_repeat_is_cached(self):
+        k,v,first = self.s.process_encoded(0x26)
+        self.assertEqual(k, 0x26)
+        self.assertEqual(v['status'], 0)
+
+        k,v,second = self.s.process_encoded(0x26)
+        self.assertEqual(k, 0x26)
+        self.assertEqual(v, None) # Straight from the cache
+        self.assertTrue(first is second)
+
+    def test_changes_invalidate(self):
+        k,v,before = self.s.process_encoded(0x26)
+        version = self.s.playlists.version
+
+        self.s.process_msg(0x16, playlist_contents=success_playlist)
+        self.assertTrue(self.s.playlists.version > version)
+
+        k,v,after = self.s.process_encoded(0x26)
+        self.assertNotEqual(v, None)
+        self.assertEqual(len(decode_msg(''.join(after))[1]['playlist_uuids']), 1)
+
+    def test_failed_change_keeps_cache(self):
+        self.s.process_encoded(0x26)
+        version = self.s.playlists.version
+
+        # Invalid playlist, nothing changes.
+        self.s.process_msg(0x16, playlist_contents="")
+        self.assertEqual(self.s.playlists.version, version)
+
+        k,v,encoded = self.s.process_encoded(0x26)
+        self.assertEqual(v, None)
+
+    def test_keyed_by_arguments_and_codec(self):
+        k,v,first = self.s.process_encoded(0x28, playlist_uuid="00000000-0000-0000-0000-000000000000")
+        k,v,second = self.s.process_encoded(0x28, playlist_uuid="00000000-0000-0000-0000-000000000001")
+        self.assertNotEqual(v, None)
+
+        k,v,third = self.s.process_encoded(0x28, MSGPACK, playlist_uuid="00000000-0000-0000-0000-000000000000")
+        self.assertNotEqual(v, None)
+        self.assertEqual(decode_msg(''.join(third))[0][14], MSGPACK)
+
+    def test_not_cacheable(self):
+        self.s.process_encoded(0x02)
+        k,v,encoded = self.s.process_encoded(0x02)
+        self.assertNotEqual(v, None)
+
+if __name__ == '__main__':
+    unittest.main()
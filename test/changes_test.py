@@ -0,0 +1,82 @@
+import unittest, gc, os, shutil
+
+from screener.app import ScreenServer
+from screener.lib.changelog import ChangeLog
+from playlists_test import success_playlist
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+class TestChangesSince(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths, changelog=ChangeLog(size=3))
+
+    def tearDown(self):
+        self.s.content.stop()
+
+        # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v, ignore_errors=True)
+
+    def insert(self):
+        return self.s.process_msg(0x16, playlist_contents=success_playlist)[1]['playlist_uuid']
+
+    def test_catch_up(self):
+        k, v = self.s.process_msg(0x44, version=0)
+        self.assertEqual((v['status'], v['version'], v['changes']), (0, 0, []))
+        log_id = v['log_id']
+
+        first = self.insert()
+        self.s.process_msg(0x18, playlist_uuid=first)
+
+        k, v = self.s.process_msg(0x44, version=0, log_id=log_id)
+        self.assertEqual(v['version'], 2)
+        self.assertEqual([(change['event'], change.get('added'), change.get('removed')) for change in v['changes']],
+            [('playlists', [first], None), ('playlists', None, [first])])
+
+        k, v = self.s.process_msg(0x44, version=1, log_id=log_id)
+        self.assertEqual([change['version'] for change in v['changes']], [2])
+
+    def test_resync(self):
+        for i in xrange(5):
+            self.insert()
+
+        k, v = self.s.process_msg(0x44, version=1)
+        self.assertEqual(v['status'], 14)
+        self.assertEqual(v['version'], 5)
+        self.assertFalse('changes' in v)
+
+        k, v = self.s.process_msg(0x44, version=2)
+        self.assertEqual(v['status'], 0)
+
+    def test_server_restarted(self):
+        self.insert()
+        k, v = self.s.process_msg(0x44, version=0, log_id='some other server')
+        self.assertEqual(v['status'], 14)
+
+    def test_playback_not_logged(self):
+        self.s.playback.loaded_item = object()
+        self.s.process_msg(0x00)
+        self.assertEqual(self.s.process_msg(0x44, version=0)[1]['changes'], [])
+
+    def test_other_screens_filtered(self):
+        second = ScreenServer(paths={'playlists': os.path.join(paths['playlists'], 'screen_2')}, content=self.s.content, bus=self.s.bus, changelog=self.s.changelog)
+        try:
+            second.process_msg(0x16, playlist_contents=success_playlist)
+            mine = self.insert()
+
+            k, v = self.s.process_msg(0x44, version=0)
+            self.assertEqual(v['version'], 2)
+            self.assertEqual([change['added'] for change in v['changes']], [[mine]])
+        finally:
+            del(second)
+
+if __name__ == '__main__':
+    unittest.main()
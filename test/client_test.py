@@ -0,0 +1,177 @@
+import unittest, gc, os, shutil, socket
+from threading import Thread, Event
+
+from screener.app import ScreenServer, Screener
+from screener.client import CommMixin, Client, RequestTimeout, RECV_BUFFER_SIZE
+from screener.lib.util import encode_msg
+from app_test import FakeFactory
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+class SocketTransport(object):
+    """
+    Just enough of a transport to run the Screener protocol over a plain socket without the reactor.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.producer = None
+
+    def writeSequence(self, data):
+        self.sock.sendall(''.join(data))
+
+    def registerProducer(self, producer, streaming):
+        # sendall() blocks so we've always got room for more.
+        self.producer = producer
+        while self.producer is producer:
+            producer.resumeProducing()
+
+    def unregisterProducer(self):
+        self.producer = None
+
+    def loseConnection(self):
+        self.sock.close()
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+        self.factory = FakeFactory(self.s)
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+
+        self.client = Client(host='127.0.0.1', port=listener.getsockname()[1])
+        self.conn, addr = listener.accept()
+        listener.close()
+
+        self.protocol = Screener(self.s, self.factory)
+        self.protocol.makeConnection(SocketTransport(self.conn))
+
+        self.server_thread = Thread(target=self.serve)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+    def serve(self):
+        try:
+            while True:
+                data = self.conn.recv(65536)
+                if not data:
+                    return
+                self.protocol.dataReceived(data)
+        except socket.error:
+            pass
+
+    def tearDown(self):
+        self.client.close()
+        self.server_thread.join(5)
+        self.conn.close()
+        self.protocol.connectionLost(None)
+        self.factory.pool.stop()
+        self.s.content.stop()
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def test_many_in_flight(self):
+        futures = [self.client.request(0x02 if i % 2 else 0x03) for i in xrange(200)]
+
+        for i, future in enumerate(futures):
+            rsp = future.result(5)
+            self.assertEqual(rsp['status'], 0)
+            self.assertEqual('time' in rsp, i % 2 == 0)
+
+    def test_stream(self):
+        for i in xrange(25):
+            self.s.content.content['{0:02d}'.format(i)] = {"id": i}
+
+        pages = list(self.client.stream(0x30, limit=10))
+        self.assertEqual([len(page['cpls']) for page in pages], [10, 10, 5])
+
+        # Everything's finished with, nothing left waiting on a response.
+        self.assertEqual(self.client.pending, {})
+
+    def test_done_callback(self):
+        called = Event()
+        future = self.client.request(0x03)
+        future.add_done_callback(lambda f: called.set())
+
+        self.assertTrue(called.wait(5))
+        self.assertTrue(future.done())
+
+    def test_pushes_go_to_handlers(self):
+        pushed = Event()
+        self.client.rsp_handlers[0x08] = lambda **info: pushed.set()
+
+        self.protocol.send_rsp(0x08, {"status": 0, "ingest_uuid": "foo", "state": 1})
+        self.assertTrue(pushed.wait(5))
+
+    def test_timeout(self):
+        release = Event()
+        self.s.handlers[0x02] = lambda **kwargs: release.wait(5) and {"status": 0}
+
+        try:
+            self.assertRaises(RequestTimeout, self.client.request(0x02).result, 0.1)
+        finally:
+            release.set()
+
+    def test_disconnect_fails_pending(self):
+        self.conn.shutdown(socket.SHUT_RDWR)
+        self.assertRaises(socket.error, self.client.request(0x02).result, 5)
+
+        # And anything after that fails straight away.
+        self.assertRaises(socket.error, self.client.request(0x02).result, 0)
+
+class TestReader(unittest.TestCase):
+    def setUp(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+
+        self.reader = CommMixin('127.0.0.1', listener.getsockname()[1])
+        self.conn, addr = listener.accept()
+        listener.close()
+
+    def tearDown(self):
+        self.reader.close()
+        self.conn.close()
+
+    def test_many_per_read(self):
+        msgs = [encode_msg(0x02, seq=i) for i in xrange(50)]
+        self.conn.sendall(str(bytearray().join(msgs)))
+
+        received = []
+        while len(received) < len(msgs):
+            views = self.reader.recv_msgs()
+            self.assertTrue(all(isinstance(view, memoryview) for view in views))
+            received.extend(view.tobytes() for view in views)
+
+        self.assertEqual(received, [str(msg) for msg in msgs])
+
+    def test_split_and_large(self):
+        big = encode_msg(0x04, cpl_uuids=['x' * 36] * 10000)
+        self.assertTrue(len(big) > RECV_BUFFER_SIZE)
+        data = str(encode_msg(0x03, time=1) + big + encode_msg(0x02))
+
+        # Dribble the first few bytes so we start with a partial header.
+        for i in xrange(20):
+            self.conn.sendall(data[i])
+        self.conn.sendall(data[20:])
+
+        self.assertEqual(self.reader.recv_rsp()[1], {"time": 1})
+        self.assertEqual(len(self.reader.recv_rsp()[1]['cpl_uuids']), 10000)
+        k, v = self.reader.recv_rsp()
+        self.assertEqual((k[15], v), (0x02, {}))
+
+    def test_closed(self):
+        self.conn.close()
+        self.assertRaises(socket.error, self.reader.recv_rsp)
+
+if __name__ == '__main__':
+    unittest.main()
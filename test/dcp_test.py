@@ -0,0 +1,401 @@
+import unittest, os, shutil, tempfile, time, hashlib, base64
+from ftplib import error_perm
+from threading import Event
+
+from screener.dcp import DCPDownloader, FTPPool, ListingCache, HashPool, FileHash, checkpoint_path, pkl_hashes, \
+    verify_hashes
+from screener.lib.ratelimit import TokenBucket
+from screener.lib.progress import Progress
+from ftp_server import FTPServer
+
+class DownloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.remote = os.path.join(self.root, 'remote')
+        self.incoming = os.path.join(self.root, 'incoming')
+
+        self.files = {
+            'ASSETMAP': 'assetmap',
+            'PKL.xml': 'pkl',
+            'video.mxf': os.urandom(300 * 1024 + 7),
+            'audio.mxf': os.urandom(20 * 1024)
+        }
+        os.makedirs(os.path.join(self.remote, 'DCP1'))
+        for name, data in self.files.iteritems():
+            with open(os.path.join(self.remote, 'DCP1', name), 'wb') as f:
+                f.write(data)
+
+        self.server = FTPServer(self.remote)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.root)
+
+    def download(self, **kwargs):
+        with DCPDownloader(self.incoming, self.server.details, **kwargs) as downloader:
+            return downloader.download('DCP1')
+
+    def assertDownloaded(self, path):
+        self.assertEqual(sorted(os.listdir(path)), sorted(self.files))
+        for name, data in self.files.iteritems():
+            with open(os.path.join(path, name), 'rb') as f:
+                self.assertEqual(f.read(), data, name)
+
+class TestDownload(DownloadTestCase):
+    def test_serial(self):
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.server.count('PASS'), 1)
+        self.assertEqual(self.server.count('REST'), 0)
+
+    def test_parallel_segments(self):
+        self.assertDownloaded(self.download(connections=3, segment_size=64 * 1024))
+
+        # Three sessions, video.mxf in three segments and everything else whole.
+        self.assertEqual(self.server.count('PASS'), 3)
+        self.assertEqual(self.server.count('RETR'), 6)
+        self.assertEqual(sorted(int(arg) for cmd, arg in self.server.commands if cmd == 'REST'), [102403, 204806])
+
+    def test_limited(self):
+        total = sum(len(data) for data in self.files.itervalues())
+        start = time.time()
+        self.assertDownloaded(self.download(connections=3, segment_size=64 * 1024, limiters=[TokenBucket(1024 * 1024, burst=64 * 1024)]))
+
+        # Less the 64K that's let through in one go.
+        self.assertTrue(time.time() - start >= (total - 64 * 1024) / (1024 * 1024.0) * 0.9)
+
+    def test_progress(self):
+        updates = []
+        progress = Progress(on_update=updates.append, interval=0)
+        with DCPDownloader(self.incoming, self.server.details, connections=3, segment_size=64 * 1024) as downloader:
+            downloader.download('DCP1', progress)
+
+        total = sum(len(data) for data in self.files.itervalues())
+        self.assertEqual(updates[-1]['downloaded'], total)
+        self.assertEqual(updates[-1]['total'], total)
+        self.assertEqual(updates[-1]['progress'], 1.0)
+        self.assertEqual(updates[-1]['files']['/DCP1/video.mxf']['downloaded'], len(self.files['video.mxf']))
+
+    def test_failure_raised(self):
+        self.server.fail_after = 10 * 1024
+        self.assertRaises(Exception, self.download, connections=3, segment_size=64 * 1024)
+
+class TestListing(DownloadTestCase):
+    def setUp(self):
+        super(TestListing, self).setUp()
+
+        # Reels in a sub folder, with spaces in the names.
+        os.makedirs(os.path.join(self.remote, 'DCP1', 'reel 1'))
+        self.files['reel 1/picture 1.mxf'] = os.urandom(1024)
+        with open(os.path.join(self.remote, 'DCP1', 'reel 1', 'picture 1.mxf'), 'wb') as f:
+            f.write(self.files['reel 1/picture 1.mxf'])
+
+    def assertDownloaded(self, path):
+        for name, data in self.files.iteritems():
+            with open(os.path.join(path, *name.split('/')), 'rb') as f:
+                self.assertEqual(f.read(), data, name)
+
+    def test_mlsd(self):
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.server.count('MLSD'), 2)
+        self.assertEqual(self.server.count('LIST'), 0)
+        self.assertEqual(self.server.count('CWD'), 0)
+
+    def test_list_fallback(self):
+        self.server.mlsd = False
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.server.count('LIST'), 2)
+        self.assertEqual(self.server.count('CWD'), 0)
+
+    def test_cache(self):
+        self.server.mlsd = False
+        cache = ListingCache(ttl=60)
+        self.download(listing_cache=cache)
+        self.download(listing_cache=cache)
+
+        # Only the first download lists anything, and it only tries MLSD the once.
+        self.assertEqual(self.server.count('MLSD'), 1)
+        self.assertEqual(self.server.count('LIST'), 2)
+
+    def test_missing_keeps_mlsd(self):
+        # A path that isn't there is no reason to give up on MLSD for the server.
+        cache = ListingCache(ttl=60)
+        with DCPDownloader(self.incoming, self.server.details, listing_cache=cache) as downloader:
+            self.assertRaises(error_perm, downloader.download, 'MISSING')
+        self.assertEqual(cache.no_mlsd, {})
+
+    def test_cache_expires(self):
+        cache = ListingCache(ttl=0)
+        self.download(listing_cache=cache)
+        self.download(listing_cache=cache)
+        self.assertEqual(self.server.count('MLSD'), 4)
+
+    def test_no_mlsd_expires(self):
+        # MLSD is tried again once the ttl is up, the server might have been upgraded since.
+        self.server.mlsd = False
+        cache = ListingCache(ttl=0)
+        self.download(listing_cache=cache)
+        self.download(listing_cache=cache)
+        self.assertEqual(self.server.count('MLSD'), 4)
+        self.assertEqual(self.server.count('LIST'), 4)
+
+class TestPool(DownloadTestCase):
+    def test_reused(self):
+        pool = FTPPool()
+        for i in xrange(3):
+            self.assertDownloaded(self.download(pool=pool))
+
+        # Logged in once, and checked each time it was reused.
+        self.assertEqual(self.server.count('PASS'), 1)
+        self.assertEqual(self.server.count('NOOP'), 2)
+        self.assertEqual(self.server.count('QUIT'), 0)
+
+        pool.clear()
+        self.assertEqual(pool.idle, {})
+
+    def test_dead_session(self):
+        pool = FTPPool()
+        self.download(pool=pool)
+        self.server.drop_connections()
+
+        self.assertDownloaded(self.download(pool=pool))
+        self.assertEqual(self.server.count('PASS'), 2)
+
+    def test_idle_timeout(self):
+        pool = FTPPool(idle_timeout=0)
+        self.download(pool=pool)
+        self.download(pool=pool)
+        self.assertEqual(self.server.count('PASS'), 2)
+        self.assertEqual(self.server.count('NOOP'), 0)
+
+    def test_evict_idle(self):
+        pool = FTPPool(idle_timeout=0.2)
+        self.download(pool=pool)
+        pool.evict_idle()
+        self.assertEqual(self.server.count('QUIT'), 0)
+
+        # Hung up on without waiting for the pool to be used again.
+        time.sleep(0.3)
+        pool.evict_idle()
+        self.assertEqual(pool.idle, {})
+        self.assertEqual(self.server.count('QUIT'), 1)
+
+    def test_size(self):
+        pool = FTPPool(size=1)
+        self.download(pool=pool, connections=3, segment_size=64 * 1024)
+        self.assertEqual(sum(len(sessions) for sessions in pool.idle.itervalues()), 1)
+
+        # Only one of the three sessions was kept, the other two are hung up on.
+        self.assertEqual(self.server.count('QUIT'), 2)
+
+    def test_not_reused_after_error(self):
+        pool = FTPPool()
+        self.server.fail_after = 10 * 1024
+        self.assertRaises(Exception, self.download, pool=pool)
+        self.assertEqual(pool.idle, {})
+
+    def test_keyed(self):
+        pool = FTPPool()
+        self.download(pool=pool)
+
+        details = dict(self.server.details, user='someone else')
+        with DCPDownloader(self.incoming, details, pool=pool) as downloader:
+            downloader.download('DCP1')
+        self.assertEqual(self.server.count('PASS'), 2)
+
+class TestResume(DownloadTestCase):
+    def retrs(self):
+        return [(cmd, arg) for cmd, arg in self.server.commands if cmd in ('RETR', 'REST')]
+
+    def test_resume(self):
+        # Everything but video.mxf gets through, and the first 80K of that.
+        self.server.fail_after = 80 * 1024
+        self.assertRaises(Exception, self.download)
+        self.assertTrue(os.path.isfile(checkpoint_path(self.incoming, 'DCP1')))
+
+        self.server.fail_after = None
+        del self.server.commands[:]
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.retrs(), [('REST', str(80 * 1024)), ('RETR', '/DCP1/video.mxf')])
+
+    def test_resume_segments(self):
+        self.server.fail_after = 50 * 1024
+        self.assertRaises(Exception, self.download, connections=3, segment_size=64 * 1024)
+
+        self.server.fail_after = None
+        del self.server.commands[:]
+        self.assertDownloaded(self.download(connections=3, segment_size=64 * 1024))
+
+        # Each segment carries on from the last whole 8K chunk it got before the link dropped.
+        offsets = sorted(int(arg) for cmd, arg in self.retrs() if cmd == 'REST')
+        self.assertEqual(offsets, [48 * 1024, 102403 + 48 * 1024, 204806 + 48 * 1024])
+
+    def test_changed_size_starts_again(self):
+        self.server.fail_after = 80 * 1024
+        self.assertRaises(Exception, self.download)
+
+        self.files['video.mxf'] = os.urandom(10 * 1024)
+        with open(os.path.join(self.remote, 'DCP1', 'video.mxf'), 'wb') as f:
+            f.write(self.files['video.mxf'])
+
+        self.server.fail_after = None
+        del self.server.commands[:]
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.retrs(), [('RETR', '/DCP1/video.mxf')])
+
+PKL = '''<?xml version="1.0" encoding="UTF-8"?>
+<PackingList xmlns="http://www.smpte-ra.org/schemas/429-8/2007/PKL">
+  <Id>urn:uuid:00000000-0000-0000-0000-000000000000</Id>
+  <AssetList>
+    <Asset>
+      <Id>urn:uuid:11111111-1111-1111-1111-111111111111</Id>
+      <Hash>{0}</Hash>
+      <Size>1</Size>
+    </Asset>
+    <Asset>
+      <Id>urn:uuid:22222222-2222-2222-2222-222222222222</Id>
+      <Hash>{1}</Hash>
+      <Size>1</Size>
+    </Asset>
+  </AssetList>
+</PackingList>
+'''
+
+class Asset(object):
+    def __init__(self, path):
+        self.path = path
+
+class FakeDCP(object):
+    def __init__(self, pkl_path, assetmap):
+        self.pkl = Asset(pkl_path)
+        self.assetmap = dict((asset_id, Asset(path)) for asset_id, path in assetmap.iteritems())
+
+class TestFileHash(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(300)
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+        self.read_back = []
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def file_hash(self, ranges, queue=None):
+        file_hash = FileHash(self.path, ranges, queue)
+        read = file_hash.read
+        def counted(start, end):
+            self.read_back.append((start, end))
+            read(start, end)
+        file_hash.read = counted
+        return file_hash
+
+    def write(self, file_hash, index, start, end):
+        file_hash.update(index, start, self.data[start:end])
+
+    def expected(self):
+        return base64.b64encode(hashlib.sha1(self.data).digest())
+
+    def test_segments(self):
+        file_hash = self.file_hash([[0, 100, 0], [100, 200, 0], [200, 300, 0]])
+
+        # The first segment is hashed on the way in, the third gets ahead of the second.
+        self.write(file_hash, 0, 0, 50)
+        self.write(file_hash, 2, 200, 250)
+        self.write(file_hash, 0, 50, 100)
+        self.write(file_hash, 1, 100, 200)
+        self.assertEqual(file_hash.hashed, 250)
+        self.write(file_hash, 2, 250, 300)
+
+        self.assertEqual(file_hash.digest(), self.expected())
+        # Only what the third segment wrote before the second was done is read back.
+        self.assertEqual(self.read_back, [(200, 250)])
+
+    def test_resumed(self):
+        # An earlier attempt got 100 bytes of the first segment and all of the second.
+        file_hash = self.file_hash([[0, 150, 100], [150, 300, 150]], HashPool(1).queue())
+        self.write(file_hash, 0, 100, 150)
+
+        self.assertEqual(file_hash.digest(), self.expected())
+        self.assertEqual(self.read_back, [(0, 150), (150, 300)])
+
+    def test_incomplete(self):
+        file_hash = self.file_hash([[0, 300, 0]])
+        self.write(file_hash, 0, 0, 100)
+        self.assertRaises(IOError, file_hash.digest)
+
+    def test_hasher_error(self):
+        pool = HashPool(1)
+        broken = self.file_hash([[0, 300, 300]], pool.queue())
+        def read(start, end):
+            raise ValueError('Broken')
+        broken.read = read
+        self.assertRaises(ValueError, broken.digest)
+
+        # The worker carries on with everyone else's files.
+        self.assertEqual(self.file_hash([[0, 300, 300]], pool.queue()).digest(), self.expected())
+        pool.stop(5)
+
+    def test_hasher_timeout(self):
+        pool = HashPool(1)
+        stuck = Event()
+        pool.queue().put((stuck.wait, ()))
+
+        file_hash = self.file_hash([[0, 300, 0]], pool.queue())
+        self.write(file_hash, 0, 0, 300)
+        self.assertRaises(IOError, file_hash.digest, 0.1)
+        stuck.set()
+        pool.stop(5)
+
+class TestHashes(DownloadTestCase):
+    def sha1(self, name):
+        return base64.b64encode(hashlib.sha1(self.files[name]).digest())
+
+    def digests(self, **kwargs):
+        with DCPDownloader(self.incoming, self.server.details, **kwargs) as downloader:
+            downloader.download('DCP1')
+        return downloader.digests()
+
+    def assertHashed(self, digests):
+        self.assertEqual(digests, dict((name, self.sha1(name)) for name in self.files))
+
+    def test_inline(self):
+        self.assertHashed(self.digests())
+
+    def test_segments(self):
+        self.assertHashed(self.digests(connections=3, segment_size=64 * 1024))
+
+    def test_pool(self):
+        self.assertHashed(self.digests(connections=3, segment_size=64 * 1024, hash_pool=HashPool(2)))
+
+    def test_resumed(self):
+        self.server.fail_after = 80 * 1024
+        self.assertRaises(Exception, self.download)
+
+        self.server.fail_after = None
+        self.assertHashed(self.digests(hash_pool=HashPool(1)))
+
+    def test_verify(self):
+        pkl_path = os.path.join(self.root, 'pkl.xml')
+        with open(pkl_path, 'w') as f:
+            f.write(PKL.format(self.sha1('video.mxf'), self.sha1('audio.mxf')))
+
+        self.assertEqual(pkl_hashes(pkl_path), {
+            '11111111-1111-1111-1111-111111111111': self.sha1('video.mxf'),
+            '22222222-2222-2222-2222-222222222222': self.sha1('audio.mxf')
+        })
+
+        dcp = FakeDCP(pkl_path, {
+            '11111111-1111-1111-1111-111111111111': 'video.mxf',
+            '22222222-2222-2222-2222-222222222222': './audio.mxf'
+        })
+        digests = self.digests(connections=3, segment_size=64 * 1024)
+        self.assertEqual(verify_hashes(dcp, digests), [])
+
+        digests['video.mxf'] = self.sha1('audio.mxf')
+        self.assertEqual(verify_hashes(dcp, digests), ['video.mxf'])
+
+if __name__ == '__main__':
+    unittest.main()
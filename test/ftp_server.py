@@ -0,0 +1,218 @@
+"""
+Just enough of an FTP server to ingest DCPs from in the tests, serving the files under a local directory.
+"""
+import os, socket, SocketServer
+from threading import Thread, Lock
+
+class FTPHandler(SocketServer.StreamRequestHandler):
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.server.connections.append(self.request)
+        self.cwd = '/'
+        self.rest = 0
+        self.pasv = None
+
+    def reply(self, line):
+        self.wfile.write(line + '\r\n')
+        self.wfile.flush()
+
+    def handle(self):
+        self.server.log('CONNECT')
+        self.reply('220 Test FTP server ready.')
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            cmd, _, arg = line.rstrip('\r\n').partition(' ')
+            cmd = cmd.upper()
+            self.server.log(cmd, arg)
+
+            handler = getattr(self, 'ftp_' + cmd, None)
+            if handler is None:
+                self.reply('502 Command not implemented.')
+            elif handler(arg) is False:
+                return
+
+    def local_path(self, path):
+        path = os.path.normpath(os.path.join(self.cwd, path)).replace('\\', '/')
+        return path, os.path.join(self.server.root, path.lstrip('/'))
+
+    def ftp_USER(self, arg):
+        self.reply('331 Password required.')
+
+    def ftp_PASS(self, arg):
+        self.reply('230 Logged in.')
+
+    def ftp_SYST(self, arg):
+        self.reply('215 UNIX Type: L8')
+
+    def ftp_NOOP(self, arg):
+        self.reply('200 NOOP ok.')
+
+    def ftp_TYPE(self, arg):
+        self.reply('200 Type set to {0}.'.format(arg))
+
+    def ftp_PWD(self, arg):
+        self.reply('257 "{0}" is the current directory.'.format(self.cwd))
+
+    def ftp_CWD(self, arg):
+        path, local = self.local_path(arg)
+        if not os.path.isdir(local):
+            return self.reply('550 No such directory.')
+
+        self.cwd = path
+        self.reply('250 Directory changed.')
+
+    def ftp_CDUP(self, arg):
+        return self.ftp_CWD('..')
+
+    def ftp_SIZE(self, arg):
+        path, local = self.local_path(arg)
+        if not os.path.isfile(local):
+            return self.reply('550 No such file.')
+        self.reply('213 {0}'.format(os.path.getsize(local)))
+
+    def ftp_REST(self, arg):
+        self.rest = int(arg)
+        self.reply('350 Restarting at {0}.'.format(self.rest))
+
+    def ftp_PASV(self, arg):
+        self.pasv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.pasv.bind(('127.0.0.1', 0))
+        self.pasv.listen(1)
+
+        port = self.pasv.getsockname()[1]
+        self.reply('227 Entering Passive Mode (127,0,0,1,{0},{1}).'.format(port >> 8, port & 0xff))
+
+    def open_data(self):
+        if self.pasv is None:
+            self.reply('425 Use PASV first.')
+            return None
+
+        self.reply('150 Opening data connection.')
+        conn, addr = self.pasv.accept()
+        self.pasv.close()
+        self.pasv = None
+        return conn
+
+    def send_data(self, chunks):
+        conn = self.open_data()
+        if conn is None:
+            return
+
+        try:
+            for chunk in chunks:
+                conn.sendall(chunk)
+        except socket.error:
+            self.reply('426 Connection closed; transfer aborted.')
+        else:
+            self.reply('226 Transfer complete.')
+        finally:
+            conn.close()
+
+    def ftp_LIST(self, arg):
+        path, local = self.local_path(arg if arg and not arg.startswith('-') else '.')
+        lines = ['total 0\r\n']
+        for name in sorted(os.listdir(local)):
+            full = os.path.join(local, name)
+            is_dir = os.path.isdir(full)
+            lines.append('{0} 1 owner group {1:>12} Jan 01 00:00 {2}\r\n'.format(
+                'drwxr-xr-x' if is_dir else '-rw-r--r--', 0 if is_dir else os.path.getsize(full), name))
+        self.send_data(lines)
+
+    def ftp_MLSD(self, arg):
+        if not self.server.mlsd:
+            return self.reply('500 Unknown command.')
+
+        path, local = self.local_path(arg or '.')
+        if not os.path.isdir(local):
+            return self.reply('550 No such directory.')
+
+        lines = ['type=cdir; .\r\n']
+        for name in sorted(os.listdir(local)):
+            full = os.path.join(local, name)
+            if os.path.isdir(full):
+                lines.append('type=dir;modify=20130101000000; {0}\r\n'.format(name))
+            else:
+                lines.append('type=file;size={0};modify=20130101000000; {1}\r\n'.format(os.path.getsize(full), name))
+        self.send_data(lines)
+
+    def ftp_RETR(self, arg):
+        path, local = self.local_path(arg)
+        rest, self.rest = self.rest, 0
+        if not os.path.isfile(local):
+            return self.reply('550 No such file.')
+
+        def chunks():
+            with open(local, 'rb') as f:
+                f.seek(rest)
+                sent = 0
+                while True:
+                    chunk = f.read(8192)
+                    if not chunk:
+                        return
+
+                    # Simulate the link dropping part way through a file.
+                    if self.server.fail_after is not None and sent + len(chunk) > self.server.fail_after:
+                        raise socket.error('Link dropped')
+                    sent += len(chunk)
+                    yield chunk
+
+        self.send_data(chunks())
+
+    def ftp_QUIT(self, arg):
+        self.reply('221 Goodbye.')
+        return False
+
+
+class FTPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), FTPHandler)
+        self.root = root
+        self.port = self.server_address[1]
+
+        # Stop sending each RETR after this many bytes if set.
+        self.fail_after = None
+        # Turn off to look like an older server that only does LIST.
+        self.mlsd = True
+
+        self.commands = []
+        self.commands_lock = Lock()
+        self.connections = []
+
+    def log(self, cmd, arg=''):
+        with self.commands_lock:
+            self.commands.append((cmd, arg))
+
+    def count(self, cmd):
+        with self.commands_lock:
+            return sum(1 for c, arg in self.commands if c == cmd)
+
+    def drop_connections(self):
+        '''
+        Hangs up on every client, like a server timing out idle sessions.
+        '''
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        del self.connections[:]
+
+    def start(self):
+        thread = Thread(target=self.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def details(self):
+        return {"host": '127.0.0.1', "port": self.port, "user": 'test', "passwd": 'test', "mode": 'passive'}
@@ -0,0 +1,241 @@
+import unittest, os, shutil, tempfile, time, hashlib, base64
+from threading import Event, Lock, Thread
+
+import screener.content
+from screener.content import Content, INGESTING, INGESTED, CANCELLED, FAILED, HASH_MISMATCH
+from screener.dcp import HashMismatchError, checkpoint_path
+from ftp_server import FTPServer
+from dcp_test import PKL, FakeDCP
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST')
+}
+
+class TestIngestWorkers(unittest.TestCase):
+    def setUp(self):
+        self.content = Content(incoming_path=paths['incoming'], assets_path=paths['assets'], ingest_path=paths['ingest'], workers=3, per_host=1)
+
+        # Stand in for the FTP download, each ingest waits until it's told to finish.
+        self.release = Event()
+        self.lock = Lock()
+        self.running = []
+        self.most_per_host = {}
+        self.content.ingest_dcp = self.fake_ingest
+
+    def tearDown(self):
+        self.release.set()
+        self.content.ingest_queue.join(5)
+        self.content.stop()
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def fake_ingest(self, ingest_uuid, item):
+        host = item['ftp_details']['host']
+        with self.lock:
+            self.running.append(host)
+            self.most_per_host[host] = max(self.most_per_host.get(host, 0), self.running.count(host))
+
+        self.release.wait(5)
+        with self.lock:
+            self.running.remove(host)
+
+        if item['dcp_path'] == 'broken':
+            raise IOError('No such file')
+        if item['dcp_path'] == 'corrupt':
+            raise HashMismatchError(['reel1.mxf'])
+
+    def ingest(self, host, dcp_path, priority=0):
+        return self.content.ingest({"host": host, "port": 21, "passwd": 'secret'}, dcp_path, priority)['ingest_uuid']
+
+    def wait_for(self, check, timeout=5):
+        end = time.time() + timeout
+        while time.time() < end:
+            if check():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def states(self, ingest_uuid):
+        return [entry['state'] for entry in self.content.get_ingest_history()['history'][ingest_uuid]]
+
+    def test_limits(self):
+        uuids = [self.ingest('a', 'dcp_a{0}'.format(i)) for i in xrange(3)]
+        uuids.append(self.ingest('b', 'dcp_b'))
+
+        # One from each host at a time, the rest of a's queue waits even though there's a spare worker.
+        self.assertTrue(self.wait_for(lambda: sorted(self.running) == ['a', 'b']))
+        time.sleep(0.1)
+        self.assertEqual(sorted(self.running), ['a', 'b'])
+
+        self.release.set()
+        self.assertTrue(self.wait_for(lambda: all(self.states(uuid)[-1] == INGESTED for uuid in uuids)))
+        self.assertEqual(self.most_per_host, {'a': 1, 'b': 1})
+
+    def test_worker_recorded(self):
+        self.release.set()
+        ingest_uuid = self.ingest('a', 'dcp')
+        self.assertTrue(self.wait_for(lambda: self.states(ingest_uuid)[-1] == INGESTED))
+
+        history = self.content.get_ingest_history()['history'][ingest_uuid]
+        self.assertTrue(history[1]['worker'] in (1, 2, 3))
+        self.assertEqual(history[1]['worker'], history[2]['worker'])
+
+    def test_failure(self):
+        self.release.set()
+        broken = self.ingest('a', 'broken')
+        self.assertTrue(self.wait_for(lambda: self.states(broken)[-1] == FAILED))
+        self.assertEqual(self.content.get_ingest_history()['history'][broken][-1]['error'], 'No such file')
+
+        # The worker carries on with the next one.
+        ingest_uuid = self.ingest('a', 'dcp')
+        self.assertTrue(self.wait_for(lambda: self.states(ingest_uuid)[-1] == INGESTED))
+
+    def test_hash_mismatch(self):
+        self.release.set()
+        corrupt = self.ingest('a', 'corrupt')
+        self.assertTrue(self.wait_for(lambda: self.states(corrupt)[-1] == HASH_MISMATCH))
+        self.assertEqual(self.content.get_ingest_history()['history'][corrupt][-1]['files'], ['reel1.mxf'])
+
+    def test_pending_survive_restart(self):
+        running = self.ingest('a', 'dcp_a0')
+        self.assertTrue(self.wait_for(lambda: self.running == ['a']))
+        waiting = self.ingest('a', 'dcp_a1', priority=2)
+        cancelled = self.ingest('a', 'dcp_a2')
+        self.content.cancel_ingest(cancelled)
+
+        self.assertTrue(self.content.flush_pending_ingests(5))
+
+        # Start up again without any workers, so everything stays queued where we can see it.
+        restarted = Content(incoming_path=paths['incoming'], assets_path=paths['assets'], ingest_path=paths['ingest'], workers=0)
+        self.assertEqual(restarted.ingest_queue[running]['dcp_path'], 'dcp_a0')
+        self.assertEqual(restarted.ingest_queue[waiting]['dcp_path'], 'dcp_a1')
+        self.assertRaises(KeyError, restarted.ingest_queue.__getitem__, cancelled)
+
+        # The priority comes back too.
+        self.assertEqual(restarted.ingest_queue.get(False)[1], waiting)
+        restarted.stop()
+
+    def test_stop(self):
+        running = self.ingest('a', 'dcp_a0')
+        self.assertTrue(self.wait_for(lambda: self.running == ['a']))
+        waiting = self.ingest('a', 'dcp_a1')
+
+        # The worker finishes the ingest it's on but doesn't start the next.
+        stopping = Thread(target=self.content.stop)
+        stopping.start()
+        self.assertTrue(self.wait_for(lambda: self.content.ingest_queue.closed))
+        self.release.set()
+        stopping.join(5)
+
+        self.assertFalse(any(thread.is_alive() for thread in self.content.ingest_threads))
+        self.assertFalse(self.content.pending_writer.is_alive())
+        self.assertEqual(self.states(running)[-1], INGESTED)
+
+        # The one that was waiting is still on disk for next time.
+        restarted = Content(incoming_path=paths['incoming'], assets_path=paths['assets'], ingest_path=paths['ingest'], workers=0)
+        self.assertEqual(restarted.ingest_queue[waiting]['dcp_path'], 'dcp_a1')
+        restarted.stop()
+        self.content.cancel_ingest(waiting)
+
+    def test_bandwidth(self):
+        ingest_uuid = self.ingest('a', 'dcp_a0')
+
+        rsp = self.content.set_ingest_bandwidth(100, ingest_uuid)
+        self.assertEqual((rsp['rate'], rsp['ingests']), (0, {ingest_uuid: 100}))
+        self.assertEqual(len(self.content.limiters(ingest_uuid)), 2)
+
+        rsp = self.content.set_ingest_bandwidth(2048)
+        self.assertEqual(rsp['rate'], 2048)
+        self.assertEqual(self.content.bandwidth.rate, 2048 * 1024)
+        self.assertEqual(self.content.set_ingest_bandwidth(None)['rate'], 0)
+
+        self.assertEqual(self.content.set_ingest_bandwidth(100, 'unknown')['status'], 11)
+
+        # None takes an ingest back to the per ingest limit from the config.
+        self.content.bandwidth_per_ingest = 50
+        self.assertEqual(self.content.set_ingest_bandwidth(None, ingest_uuid)['ingests'], {ingest_uuid: 50})
+
+        # Nothing changes for a rate that makes no sense.
+        for rate in (-1, 1.5, '100', True, [100]):
+            self.assertEqual(self.content.set_ingest_bandwidth(rate)['status'], 16)
+            self.assertEqual(self.content.set_ingest_bandwidth(rate, ingest_uuid)['status'], 16)
+        self.assertEqual(self.content.bandwidth.rate, 0)
+        self.assertEqual(self.content.limiters(ingest_uuid)[1].rate, 50 * 1024)
+
+        # Done with once the ingest has finished.
+        self.release.set()
+        self.content.ingest_queue.join(5)
+        self.assertEqual(self.content.set_ingest_bandwidth(100, ingest_uuid)['status'], 11)
+
+    def test_cancel(self):
+        self.ingest('a', 'dcp_a0')
+        self.assertTrue(self.wait_for(lambda: self.running == ['a']))
+        waiting = self.ingest('a', 'dcp_a1')
+
+        info = self.content.get_ingest_info(waiting)['ingest']
+        self.assertEqual(info['dcp_path'], 'dcp_a1')
+        self.assertEqual(info['ftp_details'], {"host": 'a', "port": 21})
+        self.assertFalse('reply_to' in info)
+        self.assertEqual(self.content.cancel_ingest(waiting)['status'], 0)
+        self.assertEqual(self.states(waiting), [0, CANCELLED])
+        self.assertEqual(self.content.cancel_ingest(waiting)['status'], 11)
+        self.assertEqual(self.content.get_ingest_info(waiting)['status'], 11)
+
+        self.release.set()
+        self.assertTrue(self.content.ingest_queue.join(5))
+        self.assertEqual(self.states(waiting), [0, CANCELLED])
+
+class TestIngestDCP(unittest.TestCase):
+    def setUp(self):
+        self.remote = tempfile.mkdtemp()
+        self.files = {
+            'ASSETMAP': 'assetmap',
+            'video.mxf': os.urandom(300 * 1024 + 7),
+            'audio.mxf': os.urandom(20 * 1024)
+        }
+        # The PKL has the audio's hash for the video.
+        audio_hash = base64.b64encode(hashlib.sha1(self.files['audio.mxf']).digest())
+        self.files['PKL.xml'] = PKL.format(audio_hash, audio_hash)
+
+        os.makedirs(os.path.join(self.remote, 'DCP1'))
+        for name, data in self.files.iteritems():
+            with open(os.path.join(self.remote, 'DCP1', name), 'wb') as f:
+                f.write(data)
+
+        self.server = FTPServer(self.remote)
+        self.server.start()
+
+        # Only the hashes and asset paths matter here, not a whole DCP's worth of XML.
+        self.parse_dcp = screener.content.DCP
+        screener.content.DCP = lambda path: FakeDCP(os.path.join(path, 'PKL.xml'), {
+            '11111111-1111-1111-1111-111111111111': 'video.mxf',
+            '22222222-2222-2222-2222-222222222222': 'audio.mxf'
+        })
+
+        self.content = Content(incoming_path=paths['incoming'], assets_path=paths['assets'], ingest_path=paths['ingest'], ftp_connections=3, segment_size=64 * 1024, hash_workers=1)
+
+    def tearDown(self):
+        self.content.stop()
+        screener.content.DCP = self.parse_dcp
+        self.server.stop()
+        shutil.rmtree(self.remote)
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def test_hash_mismatch(self):
+        ingest_uuid = self.content.ingest(self.server.details, 'DCP1')['ingest_uuid']
+        self.assertTrue(self.content.ingest_queue.join(10))
+
+        entry = self.content.get_ingest_history()['history'][ingest_uuid][-1]
+        self.assertEqual(entry['state'], HASH_MISMATCH)
+        self.assertEqual(entry['files'], ['video.mxf'])
+
+        # Nothing's kept, trying again starts from scratch.
+        self.assertFalse(os.path.exists(os.path.join(paths['incoming'], 'DCP1')))
+        self.assertFalse(os.path.exists(checkpoint_path(paths['incoming'], 'DCP1')))
+        self.assertEqual(self.content.get_cpl_uuids()['cpl_uuids'], [])
+
+if __name__ == '__main__':
+    unittest.main()
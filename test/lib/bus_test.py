@@ -82,6 +82,19 @@ class TestBus(unittest.TestCase):
 
         assert len(self.bus.subscriptions['test.key']) == 0, len(self.bus.subscriptions['test.key'])
 
+    def test_remove_is_chainable(self):
+        bus = self.bus.remove('test.key')
+        assert bus == self.bus
+
+    def test_remove(self):
+        self.bus.subscribe('test.key', self.callback)
+        self.bus.subscribe('test.key2', self.callback)
+
+        self.bus.remove('test.key')
+
+        assert 'test.key' not in self.bus.subscriptions
+        assert 'test.key2' in self.bus.subscriptions
+
     def test_has_subscription(self):
         self.bus.subscribe('test.key', self.callback)
 
@@ -0,0 +1,39 @@
+import unittest
+from screener.lib.changelog import ChangeLog
+
+class TestChangeLog(unittest.TestCase):
+    def setUp(self):
+        self.log = ChangeLog(size=5)
+
+    def record(self, count, topic='a'):
+        return [self.log.record(topic, {"n": i}) for i in xrange(count)]
+
+    def test_versions(self):
+        self.assertEqual(self.record(3), [1, 2, 3])
+        self.assertEqual(self.log.since(0), (3, [{"n": 0, "version": 1}, {"n": 1, "version": 2}, {"n": 2, "version": 3}]))
+        self.assertEqual(self.log.since(2), (3, [{"n": 2, "version": 3}]))
+        self.assertEqual(self.log.since(3), (3, []))
+
+    def test_empty(self):
+        self.assertEqual(self.log.since(0), (0, []))
+
+    def test_moved_past(self):
+        self.record(8)
+
+        # 4-8 are still there, so anyone that's seen 3 can catch up.
+        self.assertEqual([change['version'] for change in self.log.since(3)[1]], [4, 5, 6, 7, 8])
+        self.assertEqual(self.log.since(2), (8, None))
+
+    def test_from_the_future(self):
+        # e.g. the client's version is from before the server restarted.
+        self.record(2)
+        self.assertEqual(self.log.since(10), (2, None))
+
+    def test_topics(self):
+        self.log.record('a', {})
+        self.log.record('b', {})
+        self.log.record('a', {})
+        self.assertEqual([change['version'] for change in self.log.since(0, set(['a']))[1]], [1, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import unittest
+from screener.lib import codec
+from screener.lib.codec import JSON, MSGPACK, CodecError
+from screener.lib.util import encode_value, decode_msg
+
+BASE_EXPECTED_KEY = bytearray([0x06, 0x0e, 0x2b, 0x34, 0x02, 0x04, 0x01] + ([0x00] * 7))
+
+class TestPack(unittest.TestCase):
+    def roundtrip(self, obj):
+        return codec.unpack(codec.pack(obj))
+
+    def test_scalars(self):
+        for obj in [None, True, False, 0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 63,
+                -1, -32, -33, -128, -129, -32768, -32769, -2 ** 31 - 1, -2 ** 63, 1.1, -0.5]:
+            self.assertEqual(self.roundtrip(obj), obj)
+
+    def test_strings(self):
+        for obj in [u'', u'a', u'a' * 31, u'a' * 32, u'a' * 256, u'a' * 65536, u'caf\xe9']:
+            self.assertEqual(self.roundtrip(obj), obj)
+            self.assertTrue(isinstance(self.roundtrip(obj), unicode))
+
+        # Byte strings come back as unicode, the same as they would through json.
+        self.assertEqual(self.roundtrip('bar'), u'bar')
+
+    def test_containers(self):
+        for obj in [[], [1] * 15, [1] * 16, [1] * 70000, {}, dict((str(i), i) for i in xrange(16)), {"foo": {"bar": [True, None]}}]:
+            self.assertEqual(self.roundtrip(obj), obj)
+
+        self.assertEqual(self.roundtrip((1, 2)), [1, 2])
+
+    def test_known_encoding(self):
+        self.assertEqual(codec.pack({"foo": 1}), '\x81\xa3foo\x01')
+        self.assertEqual(codec.pack([None, True, False]), '\x93\xc0\xc3\xc2')
+        self.assertEqual(codec.pack(-1), '\xff')
+        self.assertEqual(codec.pack(300), '\xcd\x01\x2c')
+
+    def test_unsupported(self):
+        self.assertRaises(TypeError, codec.pack, object())
+
+    def test_truncated(self):
+        self.assertRaises(CodecError, codec.unpack, codec.pack([1, 2, 3])[:-1])
+        self.assertRaises(CodecError, codec.unpack, codec.pack([1, 2, 3]) + '\x00')
+
+class TestCodecMsg(unittest.TestCase):
+    def test_key(self):
+        self.assertEqual(encode_value(0x02, {}, MSGPACK), BASE_EXPECTED_KEY + bytearray([MSGPACK, 0x02, 0x00]))
+        self.assertEqual(encode_value(0x02, {"foo": 1}, JSON)[:16], BASE_EXPECTED_KEY + bytearray([JSON, 0x02]))
+
+    def test_val(self):
+        self.assertEqual(encode_value(0x02, {"foo": 1}, MSGPACK), BASE_EXPECTED_KEY + bytearray([MSGPACK, 0x02, 0x06]) + '\x81\xa3foo\x01')
+
+    def test_roundtrip(self):
+        value = {"status": 0, "cpl_uuids": ["00000000-0000-0000-0000-100000000001"] * 10, "title": u"caf\xe9"}
+        for c in [JSON, MSGPACK]:
+            k, v = decode_msg(encode_value(0x04, value, c))
+            self.assertEqual(k[14], c)
+            self.assertEqual(k[15], 0x04)
+            self.assertEqual(v, value)
+
+    def test_unknown_codec(self):
+        msg = BASE_EXPECTED_KEY + bytearray([0x7F, 0x02, 0x02]) + '{}'
+        self.assertRaises(CodecError, decode_msg, msg)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from screener.lib.util import encode_msg, decode_msg
+import klv
+from screener.lib.util import encode_msg, decode_msg, encode_ber, encode_parts, key_header, correlate, correlation_id
 
 BASE_EXPECTED_KEY = bytearray([0x06, 0x0e, 0x2b, 0x34, 0x02, 0x04, 0x01] + ([0x00] * 8))
 
@@ -32,6 +33,48 @@ class TestEncodeMsg(unittest.TestCase):
         self.assertEqual(encode_msg(0x00, foo={"bar": [True]}), BASE_EXPECTED_KEY + bytearray([0x00, 0x18] + list('{"foo": {"bar": [true]}}')))
 
 
+class TestEncodeParts(unittest.TestCase):
+    def test_ber(self):
+        for length in [0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 24, 2 ** 32 + 1]:
+            self.assertEqual(klv.decode_ber(encode_ber(length)), (length, len(encode_ber(length))))
+
+        self.assertEqual(encode_ber(127), '\x7f')
+        self.assertEqual(encode_ber(128), '\x81\x80')
+        self.assertEqual(encode_ber(256), '\x82\x01\x00')
+
+    def test_parts(self):
+        self.assertEqual(encode_parts(0x02, {}), [str(BASE_EXPECTED_KEY) + '\x02\x00'])
+        self.assertEqual(encode_parts(0x02, {"foo": "bar"}), [str(BASE_EXPECTED_KEY) + '\x02\x0e', '{"foo": "bar"}'])
+
+    def test_matches_encode_msg(self):
+        for kwargs in [{}, {"foo": "bar"}, {"foo": "x" * 127}, {"foo": "x" * 1000}]:
+            self.assertEqual(''.join(encode_parts(0x10, kwargs)), str(encode_msg(0x10, **kwargs)))
+
+    def test_header_reused(self):
+        self.assertTrue(key_header(0x10) is key_header(0x10))
+        self.assertEqual(key_header(0x10, 1), str(BASE_EXPECTED_KEY[:14]) + '\x01\x10')
+
+    def test_correlation(self):
+        parts = encode_parts(0x10, {"foo": "bar"}, correlation=0x01020304)
+        self.assertEqual(parts[0][10:14], '\x01\x02\x03\x04')
+
+        k, v = decode_msg(''.join(parts))
+        self.assertEqual(correlation_id(k), 0x01020304)
+        self.assertEqual(k[15], 0x10)
+        self.assertEqual(v, {"foo": "bar"})
+
+        # Tagged headers don't end up in the cache.
+        self.assertEqual(correlation_id(key_header(0x10)), 0)
+
+    def test_correlate(self):
+        parts = encode_parts(0x10, {"foo": "bar"})
+        self.assertTrue(correlate(parts, 0) is parts)
+
+        tagged = correlate(parts, 7)
+        self.assertEqual(tagged, encode_parts(0x10, {"foo": "bar"}, correlation=7))
+        self.assertEqual(correlation_id(parts[0]), 0)
+
+
 class TestDecodeMsg(unittest.TestCase):
     def test_key(self):
         msg = BASE_EXPECTED_KEY + bytearray([0x00, 0x00])
@@ -0,0 +1,66 @@
+import unittest, random
+from screener.lib.metrics import Histogram, Metrics, bucket_index, bucket_value, BUCKETS
+
+class TestBuckets(unittest.TestCase):
+    def test_exact_small_values(self):
+        for value in xrange(32):
+            self.assertEqual(bucket_value(bucket_index(value)), value)
+
+    def test_value_within_bucket(self):
+        rand = random.Random(1)
+        for i in xrange(10000):
+            value = rand.randint(0, 2 ** 39)
+            upper = bucket_value(bucket_index(value))
+            self.assertTrue(value <= upper)
+            self.assertTrue(upper - value <= value / 16 + 1)
+
+    def test_monotonic(self):
+        last = -1
+        for value in xrange(0, 100000, 7):
+            index = bucket_index(value)
+            self.assertTrue(index >= last)
+            last = index
+
+    def test_huge_values(self):
+        self.assertEqual(bucket_index(2 ** 50), BUCKETS - 1)
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        self.h = Histogram()
+
+    def test_empty(self):
+        self.assertEqual(self.h.percentile(99), 0)
+        self.assertEqual(self.h.summary()['count'], 0)
+
+    def test_percentiles(self):
+        for value in xrange(1, 10001):
+            self.h.record(value)
+
+        self.assertEqual(self.h.count, 10000)
+        self.assertEqual(self.h.min, 1)
+        self.assertEqual(self.h.max, 10000)
+        self.assertAlmostEqual(self.h.mean(), 5000.5)
+
+        for p, expected in [(50, 5000), (99, 9900), (99.9, 9990), (100, 10000)]:
+            self.assertTrue(abs(self.h.percentile(p) - expected) <= expected / 16, (p, self.h.percentile(p)))
+
+class TestMetrics(unittest.TestCase):
+    def test_snapshot(self):
+        m = Metrics()
+        m.incr(0x02, 'requests')
+        m.incr(0x02, 'requests')
+        m.record(0x02, 'handle', 0.0015)
+
+        snapshot = m.snapshot()
+        self.assertEqual(snapshot['0x02']['requests'], 2)
+        self.assertEqual(snapshot['0x02']['handle']['count'], 1)
+        self.assertEqual(snapshot['0x02']['handle']['max'], 1500)
+
+        self.assertTrue('0x02 handle count=1' in m.dump())
+        self.assertTrue('0x02 requests 2' in m.dump())
+
+        m.reset()
+        self.assertEqual(m.snapshot(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from screener.lib.progress import Progress
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.updates = []
+        self.progress = Progress(on_update=self.updates.append, interval=0.5, smoothing=0.5, clock=self.clock)
+        self.progress.add_file('a.mxf', 1000)
+        self.progress.add_file('b.mxf', 1000, 500)
+
+    def test_coalesced(self):
+        # Nothing goes out until interval has passed, however many chunks come in.
+        for n in xrange(10):
+            self.progress.update(10, 'a.mxf')
+        self.assertEqual(self.updates, [])
+
+        self.clock.now += 0.5
+        self.progress.update(10, 'a.mxf')
+        self.assertEqual(len(self.updates), 1)
+        self.assertEqual(self.updates[0]['downloaded'], 610)
+        self.assertEqual(self.updates[0]['files']['a.mxf']['downloaded'], 110)
+
+        self.clock.now += 0.1
+        self.progress.update(10, 'a.mxf')
+        self.assertEqual(len(self.updates), 1)
+        self.assertEqual(self.progress.snapshot()['downloaded'], 620)
+
+    def test_rate_and_eta(self):
+        # What was there already doesn't count towards the rate.
+        self.clock.now += 1
+        self.progress.update(100, 'a.mxf')
+        snapshot = self.updates[-1]
+        self.assertEqual(snapshot['rate'], 100)
+        self.assertEqual(snapshot['smoothed_rate'], 100)
+        self.assertEqual(snapshot['eta'], 14)
+        self.assertEqual(snapshot['files']['a.mxf']['eta'], 9)
+        self.assertEqual(snapshot['files']['b.mxf']['eta'], None)
+
+        self.clock.now += 1
+        self.progress.update(300, 'b.mxf')
+        snapshot = self.updates[-1]
+        self.assertEqual(snapshot['rate'], 300)
+        self.assertEqual(snapshot['smoothed_rate'], 200)
+        self.assertEqual(snapshot['eta'], 5.5)
+        self.assertEqual(snapshot['files']['a.mxf']['rate'], 50)
+        self.assertEqual(snapshot['files']['b.mxf']['eta'], 200 / 150.0)
+        self.assertEqual(snapshot['progress'], 0.45)
+
+    def test_finish(self):
+        self.progress.update(500, 'b.mxf')
+        self.progress.update(1000, 'a.mxf')
+        self.assertEqual(self.updates, [])
+
+        self.progress.finish()
+        self.assertEqual(self.updates[-1]['progress'], 1.0)
+        self.assertEqual(self.updates[-1]['eta'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest, time
+from threading import Thread
+from screener.lib.util import FairQueue, IndexableQueue
+
+class TestIndexableQueue(unittest.TestCase):
+    def setUp(self):
+        self.q = IndexableQueue()
+
+    def drain(self):
+        items = []
+        while not self.q.empty():
+            items.append(self.q.get()[1])
+        return items
+
+    def test_fifo(self):
+        uuids = [self.q.put(i) for i in xrange(5)]
+        self.assertEqual(self.q.qsize(), 5)
+        self.assertEqual(self.q[uuids[3]], 3)
+        self.assertEqual(self.q.get(), (uuids[0], 0))
+        self.assertEqual(self.drain(), [1, 2, 3, 4])
+        self.assertRaises(KeyError, self.q.__getitem__, uuids[3])
+
+    def test_equal_items(self):
+        # Every put gets its own uuid, even for items that compare equal.
+        a, b = self.q.put({"dcp_path": "x"}), self.q.put({"dcp_path": "x"})
+        self.assertNotEqual(a, b)
+        self.assertEqual([self.q.get()[0], self.q.get()[0]], [a, b])
+
+    def test_priority(self):
+        self.q.put('low', priority=-1)
+        self.q.put('a')
+        self.q.put('high', priority=5)
+        self.q.put('b')
+        self.assertEqual(self.drain(), ['high', 'a', 'b', 'low'])
+
+    def test_cancel(self):
+        uuids = [self.q.put(i) for i in xrange(4)]
+        self.assertTrue(self.q.cancel(uuids[0]))
+        self.assertTrue(self.q.cancel(uuids[2]))
+        self.assertFalse(self.q.cancel(uuids[2]))
+        self.assertEqual(self.q.qsize(), 2)
+        self.assertFalse(uuids[2] in self.q)
+        self.assertEqual(self.drain(), [1, 3])
+
+    def test_move(self):
+        uuids = [self.q.put(i) for i in xrange(4)]
+        self.assertTrue(self.q.move(uuids[3], first=True))
+        self.assertTrue(self.q.move(uuids[0]))
+        self.assertTrue(self.q.move(uuids[2], priority=1))
+        self.assertEqual(self.q.priority(uuids[2]), 1)
+        self.assertEqual(self.q.qsize(), 4)
+        self.assertEqual(self.drain(), [2, 3, 1, 0])
+        self.assertFalse(self.q.move(uuids[0]))
+
+    def test_join_counts_cancelled(self):
+        uuid = self.q.put(1)
+        self.q.put(2)
+        self.q.cancel(uuid)
+        self.q.get()
+        self.q.task_done()
+        self.q.join()
+
+class TestFairQueue(unittest.TestCase):
+    def setUp(self):
+        self.q = FairQueue(per_source=1)
+
+    def test_round_robin(self):
+        for i in xrange(3):
+            self.q.put('a', 'a{0}'.format(i))
+        self.q.put('b', 'b0')
+        self.q.put('c', 'c0')
+
+        taken = []
+        while True:
+            job = self.q.get(False)
+            if job is None:
+                break
+            source, uuid, item = job
+            taken.append(item)
+            self.q.task_done(source)
+
+        # b and c don't have to wait for everything from a.
+        self.assertEqual(taken, ['a0', 'b0', 'c0', 'a1', 'a2'])
+        self.assertEqual(len(self.q), 0)
+
+    def test_per_source_limit(self):
+        self.q.put('a', 'a0')
+        self.q.put('a', 'a1')
+        self.q.put('b', 'b0')
+
+        self.assertEqual(self.q.get(False)[2], 'a0')
+        self.assertEqual(self.q.get(False)[2], 'b0')
+        # a1 has to wait for a0 to be done.
+        self.assertEqual(self.q.get(False), None)
+
+        self.q.task_done('a')
+        self.assertEqual(self.q.get(False)[2], 'a1')
+
+    def test_lookup_and_cancel(self):
+        uuid = self.q.put('a', 'a0')
+        self.q.put('a', 'a1')
+        self.assertEqual(self.q[uuid], 'a0')
+
+        self.q.cancel(uuid)
+        self.assertRaises(KeyError, self.q.__getitem__, uuid)
+        self.assertEqual(self.q.get(False)[2], 'a1')
+
+    def test_priority_within_source(self):
+        self.q.put('a', 'a0')
+        self.q.put('a', 'a1')
+        uuid = self.q.put('a', 'a2')
+        self.assertTrue(self.q.move(uuid, first=True))
+        self.q.put('a', 'urgent', priority=1)
+
+        taken = []
+        for i in xrange(4):
+            source, uuid, item = self.q.get(False)
+            taken.append(item)
+            self.q.task_done(source)
+        self.assertEqual(taken, ['urgent', 'a2', 'a0', 'a1'])
+
+    def test_get_waits(self):
+        got = []
+        t = Thread(target=lambda: got.append(self.q.get(timeout=5)))
+        t.start()
+
+        time.sleep(0.05)
+        self.q.put('a', 'a0')
+        t.join(5)
+        self.assertEqual(got[0][2], 'a0')
+
+    def test_get_timeout(self):
+        self.assertEqual(self.q.get(timeout=0.01), None)
+
+    def test_join(self):
+        self.q.put('a', 'a0')
+        self.q.put('a', 'a1')
+        uuid = self.q.put('b', 'b0')
+        self.assertFalse(self.q.join(0.01))
+
+        self.q.cancel(uuid)
+        source, uuid, item = self.q.get()
+        self.q.task_done(source)
+        self.assertFalse(self.q.join(0.01))
+
+        source, uuid, item = self.q.get()
+        Thread(target=self.q.task_done, args=(source,)).start()
+        self.assertTrue(self.q.join(5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest, time
+from datetime import datetime
+
+from screener.lib.ratelimit import TokenBucket, Profile, ScheduledBucket
+
+class TestTokenBucket(unittest.TestCase):
+    def timed(self, bucket, n):
+        start = time.time()
+        bucket.consume(n)
+        return time.time() - start
+
+    def test_rate(self):
+        bucket = TokenBucket(200000, burst=10000)
+
+        # The burst goes straight through, then it's held to the rate.
+        self.assertTrue(self.timed(bucket, 10000) < 0.05)
+        self.assertTrue(0.08 < self.timed(bucket, 20000) < 0.3)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0)
+        self.assertTrue(self.timed(bucket, 10 ** 9) < 0.05)
+
+        bucket.set_rate(100000)
+        bucket.consume(bucket.capacity)
+        self.assertTrue(self.timed(bucket, 10000) > 0.05)
+
+class TestProfile(unittest.TestCase):
+    def test_rate_at(self):
+        profile = Profile('12:00-23:30=2048, 23:30-02:00=512')
+        self.assertEqual(profile.rate_at(datetime(2013, 1, 1, 11, 59), 7), 7)
+        self.assertEqual(profile.rate_at(datetime(2013, 1, 1, 12, 0), 7), 2048)
+        self.assertEqual(profile.rate_at(datetime(2013, 1, 1, 23, 45), 7), 512)
+        self.assertEqual(profile.rate_at(datetime(2013, 1, 2, 1, 0), 7), 512)
+        self.assertEqual(profile.rate_at(datetime(2013, 1, 2, 2, 0), 7), 7)
+
+    def test_empty(self):
+        self.assertEqual(Profile('').rate_at(datetime.now(), 5), 5)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Profile, '12-13=5')
+
+class TestScheduledBucket(unittest.TestCase):
+    def test_override(self):
+        bucket = ScheduledBucket(Profile('00:00-23:59=10'), default=10, scale=1024)
+        self.assertEqual(bucket.rate, 10240)
+
+        bucket.set_override(0)
+        self.assertEqual(bucket.rate, 0)
+
+        bucket.set_override(None)
+        self.assertEqual(bucket.rate, 10240)
+
+if __name__ == '__main__':
+    unittest.main()
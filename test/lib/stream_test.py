@@ -0,0 +1,89 @@
+import unittest, random
+from screener.lib.util import encode_msg, decode_msg, msg_length, KLVStream
+
+def build_msgs(count):
+    # A mix of empty, short form and long form BER lengths.
+    msgs = []
+    for i in xrange(count):
+        if i % 3 == 0:
+            msgs.append(encode_msg(i % 256))
+        elif i % 3 == 1:
+            msgs.append(encode_msg(i % 256, seq=i))
+        else:
+            msgs.append(encode_msg(i % 256, seq=i, padding="x" * (i % 700)))
+    return msgs
+
+def split_stream(stream, sizes):
+    chunks = []
+    offset = 0
+    while offset < len(stream):
+        size = next(sizes)
+        chunks.append(str(stream[offset:offset + size]))
+        offset += size
+    return chunks
+
+class TestMsgLength(unittest.TestCase):
+    def test_incomplete_header(self):
+        msg = encode_msg(0x00, foo="bar")
+        self.assertEqual(msg_length(msg[:10]), None)
+        self.assertEqual(msg_length(msg[:16]), None)
+        self.assertEqual(msg_length(msg[:17]), len(msg))
+
+    def test_long_form_split_inside_length(self):
+        msg = encode_msg(0x00, foo="x" * 300)
+        self.assertTrue(msg[16] > 127)
+        self.assertEqual(msg_length(msg[:17]), None)
+        self.assertEqual(msg_length(msg[:16 + 1 + (msg[16] & 127)]), len(msg))
+
+    def test_offset(self):
+        first = encode_msg(0x01, foo="bar")
+        second = encode_msg(0x02)
+        self.assertEqual(msg_length(first + second, len(first)), len(second))
+
+class TestKLVStream(unittest.TestCase):
+    def setUp(self):
+        self.stream = KLVStream()
+        self.msgs = build_msgs(5000)
+        self.data = bytearray().join(self.msgs)
+
+    def replay(self, chunks):
+        received = []
+        for chunk in chunks:
+            received.extend(self.stream.feed(chunk))
+        return received
+
+    def assertAllReceived(self, received):
+        self.assertEqual(len(received), len(self.msgs))
+        for expected, msg in zip(self.msgs, received):
+            self.assertEqual(msg, expected)
+        self.assertEqual(len(self.stream), 0)
+
+    def test_whole_messages(self):
+        self.assertAllReceived(self.replay(str(msg) for msg in self.msgs))
+
+    def test_single_bytes(self):
+        self.assertAllReceived(self.replay(split_stream(self.data, iter(lambda: 1, None))))
+
+    def test_merged(self):
+        # Everything arriving in one read.
+        self.assertAllReceived(self.replay([str(self.data)]))
+
+    def test_random_splits(self):
+        rand = random.Random(1234)
+        self.assertAllReceived(self.replay(split_stream(self.data, iter(lambda: rand.randint(1, 4096), None))))
+
+    def test_partial_held_back(self):
+        msg = str(encode_msg(0x10, foo="bar"))
+        self.assertEqual(self.stream.feed(msg[:-1]), [])
+        self.assertEqual(len(self.stream), len(msg) - 1)
+
+        received = self.stream.feed(msg[-1:] + msg[:5])
+        self.assertEqual(len(received), 1)
+        self.assertEqual(len(self.stream), 5)
+
+        k, v = decode_msg(received[0])
+        self.assertEqual(k[15], 0x10)
+        self.assertEqual(v, {"foo": "bar"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest, gc, os, shutil
+from StringIO import StringIO
+
+from twisted.test.proto_helpers import StringTransport
+
+from screener.app import ScreenServer, Screener
+from screener.loadgen import LoadTest, LoadProtocol, parse_mix, ZERO_UUID
+from app_test import FakeFactory
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+class TestMix(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('status=80, playlist_uuids=20,ingest'), {'status': 80, 'playlist_uuids': 20, 'ingest': 1})
+
+    def test_unknown_operation(self):
+        self.assertRaises(ValueError, LoadTest, {'status': 1, 'reboot': 1})
+
+    def test_pick_op(self):
+        test = LoadTest({'status': 3, 'playlist_uuids': 1}, seed=1)
+        picks = [test.pick_op() for i in xrange(4000)]
+        self.assertEqual(set(picks), set(['status', 'playlist_uuids']))
+        self.assertTrue(2700 < picks.count('status') < 3300)
+
+    def test_pick_playlist(self):
+        test = LoadTest({'playlist_delete': 1}, seed=1)
+        self.assertEqual(test.pick_playlist(remove=True), ZERO_UUID)
+
+        test.playlist_uuids = ['a', 'b']
+        removed = set([test.pick_playlist(remove=True), test.pick_playlist(remove=True)])
+        self.assertEqual(removed, set(['a', 'b']))
+        self.assertEqual(test.playlist_uuids, [])
+
+class TestLoadProtocol(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+        self.factory = FakeFactory(self.s)
+        self.server_transport = StringTransport()
+        self.server = Screener(self.s, self.factory)
+        self.server.makeConnection(self.server_transport)
+
+        self.test = LoadTest({'status': 1, 'playlist_insert': 1, 'playlist_delete': 1}, seed=1)
+        self.client_transport = StringTransport()
+        self.client = LoadProtocol(self.test)
+        self.client.makeConnection(self.client_transport)
+
+    def tearDown(self):
+        self.server.connectionLost(None)
+        self.factory.pool.stop()
+        self.s.content.stop()
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def exchange(self):
+        self.server.dataReceived(self.client_transport.value())
+        self.client_transport.clear()
+        self.client.dataReceived(self.server_transport.value())
+        self.server_transport.clear()
+
+    def test_latencies_recorded(self):
+        for i in xrange(3):
+            self.client.request('status')
+        self.client.request('playlist_insert')
+        self.exchange()
+
+        self.assertEqual(self.test.sent, 4)
+        self.assertEqual(self.test.received, 4)
+        self.assertEqual(self.test.latencies['status'].count, 3)
+        self.assertEqual(len(self.test.playlist_uuids), 1)
+
+        self.client.request('playlist_delete')
+        self.exchange()
+        self.assertEqual(self.test.errors['playlist_delete'], 0)
+        self.assertEqual(self.test.playlist_uuids, [])
+
+        out = StringIO()
+        self.test.report(1.0, out)
+        self.assertTrue('sent 5, received 5, unanswered 0' in out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest, gc, os, shutil
+
+from twisted.test.proto_helpers import StringTransport
+
+from screener.app import ScreenServer, Screener
+from screener.lib.util import encode_parts, correlation_id, paginate, KLVStream, decode_msg
+from app_test import FakeFactory
+from playlists_test import success_playlist
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+def fake_uuid(i):
+    return '00000000-0000-0000-0000-{0:012d}'.format(i)
+
+class TestPaginate(unittest.TestCase):
+    def test_pages(self):
+        keys = [fake_uuid(i) for i in xrange(10, 0, -1)]
+
+        self.assertEqual(paginate(keys), (sorted(keys), None))
+        self.assertEqual(paginate(keys, 4), (sorted(keys)[:4], fake_uuid(4)))
+        self.assertEqual(paginate(keys, 4, fake_uuid(4)), (sorted(keys)[4:8], fake_uuid(8)))
+        self.assertEqual(paginate(keys, 4, fake_uuid(8)), (sorted(keys)[8:], None))
+        self.assertEqual(paginate(keys, 5, fake_uuid(5)), (sorted(keys)[5:], None))
+
+    def test_cursor_removed(self):
+        # The cursor doesn't have to still be there, we carry on from where it would have been.
+        keys = [fake_uuid(i) for i in xrange(1, 10) if i != 4]
+        self.assertEqual(paginate(keys, 2, fake_uuid(4))[0], [fake_uuid(5), fake_uuid(6)])
+
+class PagingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+        for i in xrange(1, 26):
+            self.s.content.content[fake_uuid(i)] = {"id": fake_uuid(i)}
+
+    def tearDown(self):
+        self.s.content.stop()
+
+        # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+class TestPaging(PagingTestCase):
+    def page_through(self, handler_key, field, limit, **kwargs):
+        items, cursor = [], None
+        while True:
+            k, v = self.s.process_msg(handler_key, limit=limit, cursor=cursor, **kwargs)
+            self.assertEqual(v['status'], 0)
+            self.assertTrue(len(v[field]) <= limit)
+            items.extend(v[field])
+
+            cursor = v['next_cursor']
+            if cursor is None:
+                return items
+
+    def test_get_cpls(self):
+        cpls = self.page_through(0x30, 'cpls', 10)
+        self.assertEqual([cpl['id'] for cpl in cpls], [fake_uuid(i) for i in xrange(1, 26)])
+
+    def test_get_cpls_unpaged(self):
+        k, v = self.s.process_msg(0x30)
+        self.assertEqual(len(v['cpls']), 25)
+        self.assertFalse('next_cursor' in v)
+
+        k, v = self.s.process_msg(0x30, cpl_uuids=[fake_uuid(3), fake_uuid(1)])
+        self.assertEqual([cpl['id'] for cpl in v['cpls']], [fake_uuid(1), fake_uuid(3)])
+
+        k, v = self.s.process_msg(0x30, cpl_uuids=[fake_uuid(100)])
+        self.assertEqual(v['status'], 1)
+
+    def test_get_cpls_subset(self):
+        cpls = self.page_through(0x30, 'cpls', 2, cpl_uuids=[fake_uuid(i) for i in xrange(1, 6)])
+        self.assertEqual(len(cpls), 5)
+
+    def test_get_playlists(self):
+        for i in xrange(5):
+            self.s.process_msg(0x16, playlist_contents=success_playlist)
+
+        self.assertEqual(len(self.page_through(0x27, 'playlists', 2)), 5)
+
+    def test_get_ingest_history(self):
+        for i in xrange(1, 8):
+            self.s.content.update_ingest_history(fake_uuid(i), 0)
+
+        k, v = self.s.process_msg(0x33, limit=5)
+        self.assertEqual(sorted(v['history']), [fake_uuid(i) for i in xrange(1, 6)])
+        self.assertEqual(v['next_cursor'], fake_uuid(5))
+
+        k, v = self.s.process_msg(0x33, limit=5, cursor=v['next_cursor'])
+        self.assertEqual(sorted(v['history']), [fake_uuid(6), fake_uuid(7)])
+        self.assertEqual(v['next_cursor'], None)
+
+class TestStreaming(PagingTestCase):
+    def setUp(self):
+        super(TestStreaming, self).setUp()
+        self.factory = FakeFactory(self.s)
+        self.transport = StringTransport()
+        self.protocol = Screener(self.s, self.factory)
+        self.protocol.makeConnection(self.transport)
+
+    def tearDown(self):
+        self.protocol.connectionLost(None)
+        self.factory.pool.stop()
+        super(TestStreaming, self).tearDown()
+
+    def pump(self):
+        # Stand in for the reactor asking for more whenever the socket has room.
+        while self.transport.producer is not None:
+            self.transport.producer.resumeProducing()
+
+        msgs = KLVStream().feed(self.transport.value())
+        self.transport.clear()
+        return [decode_msg(msg) for msg in msgs]
+
+    def test_stream(self):
+        self.protocol.dataReceived(''.join(encode_parts(0x30, {"stream": True, "limit": 10}, correlation=5)))
+
+        chunks = self.pump()
+        self.assertEqual([len(v['cpls']) for k, v in chunks], [10, 10, 5])
+        self.assertEqual([v['next_cursor'] for k, v in chunks], [fake_uuid(10), fake_uuid(20), None])
+        self.assertEqual(set((k[15], correlation_id(k)) for k, v in chunks), set([(0x30, 5)]))
+
+    def test_streams_queued(self):
+        self.protocol.dataReceived(''.join(encode_parts(0x30, {"stream": True, "limit": 20}, correlation=1)))
+        self.protocol.dataReceived(''.join(encode_parts(0x30, {"stream": True, "limit": 20, "cpl_uuids": [fake_uuid(1)]}, correlation=2)))
+
+        # Other responses carry on going out while streams are waiting.
+        self.protocol.dataReceived(''.join(encode_parts(0x02, {}, correlation=3)))
+
+        ids = [correlation_id(k) for k, v in self.pump()]
+        self.assertTrue(3 in ids)
+        self.assertEqual([i for i in ids if i != 3], [1, 1, 2])
+        self.assertEqual(len(self.protocol.streams), 0)
+
+    def test_stream_error(self):
+        self.protocol.dataReceived(''.join(encode_parts(0x30, {"stream": True, "cpl_uuids": [fake_uuid(100)]})))
+        self.assertEqual([v['status'] for k, v in self.pump()], [1])
+
+    def test_stream_exception(self):
+        def broken_handler(**kwargs):
+            raise TypeError('Unexpected argument')
+        self.s.handlers[0x30] = broken_handler
+
+        self.protocol.dataReceived(''.join(encode_parts(0x30, {"stream": True}, correlation=4)))
+        self.assertEqual([(correlation_id(k), v['status']) for k, v in self.pump()], [(4, 15)])
+        self.assertEqual(len(self.protocol.streams), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-import unittest, os, shutil
+import unittest, gc, os, shutil
 from screener.app import ScreenServer
 from screener.lib import config as config_handler
 from screener import cfg
@@ -15,8 +15,11 @@ class TestPlaybackNoContentLoaded(unittest.TestCase):
         self.s = ScreenServer(paths=paths)
 
     def tearDown(self):
+        self.s.content.stop()
+
         # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
         del(self.s)
+        gc.collect()
 
         for v in paths.itervalues():
             shutil.rmtree(v)
@@ -1,4 +1,4 @@
-import unittest, os, shutil, re
+import unittest, gc, os, shutil, re
 from screener.app import ScreenServer
 from screener.lib import config as config_handler
 from screener import cfg
@@ -44,8 +44,11 @@ class TestPlaylistsDefaultState(unittest.TestCase):
         self.s = ScreenServer(paths=paths)
 
     def tearDown(self):
+        self.s.content.stop()
+
         # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
         del(self.s)
+        gc.collect()
 
         for v in paths.itervalues():
             shutil.rmtree(v)
@@ -112,8 +115,11 @@ class TestPlaylistsExists(unittest.TestCase):
         self.playlist_uuid = v['playlist_uuid']
 
     def tearDown(self):
+        self.s.content.stop()
+
         # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
         del(self.s)
+        gc.collect()
 
         for v in paths.itervalues():
             shutil.rmtree(v)
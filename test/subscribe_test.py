@@ -0,0 +1,123 @@
+import unittest, gc, os, shutil
+
+from twisted.test.proto_helpers import StringTransport
+
+from screener.app import ScreenServer, Screener
+from screener.playback import PLAY, STOP
+from app_test import FakeFactory
+from playlists_test import success_playlist
+
+paths = {
+    'incoming': os.path.join(os.path.dirname(__file__), 'INCOMING'),
+    'assets': os.path.join(os.path.dirname(__file__), 'ASSET'),
+    'ingest': os.path.join(os.path.dirname(__file__), 'INGEST'),
+    'playlists': os.path.join(os.path.dirname(__file__), 'PLAYLISTS')
+}
+
+class TestSubscribe(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+
+        self.pushed = []
+        self.s.bus.subscribe('to_client.test', lambda bus, key, result: self.pushed.append((key, result)))
+
+    def tearDown(self):
+        self.s.content.stop()
+
+        # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v, ignore_errors=True)
+
+    def subscribe(self, events, server=None):
+        k, v = (server or self.s).process_msg(0x43, reply_to='to_client.test', events=events)
+        return v
+
+    def test_playlist_changes(self):
+        self.assertEqual(self.subscribe(['playlists'])['events'], ['playlists'])
+
+        k, v = self.s.process_msg(0x16, playlist_contents=success_playlist)
+        playlist_uuid = v['playlist_uuid']
+        self.s.process_msg(0x17, playlist_uuid=playlist_uuid, playlist_contents=success_playlist)
+        self.s.process_msg(0x18, playlist_uuid=playlist_uuid)
+
+        self.assertEqual([key for key, change in self.pushed], [0x43] * 3)
+        changes = [change for key, change in self.pushed]
+        self.assertEqual([change.get('added') for change in changes], [[playlist_uuid], None, None])
+        self.assertEqual([change.get('updated') for change in changes], [None, [playlist_uuid], None])
+        self.assertEqual([change.get('removed') for change in changes], [None, None, [playlist_uuid]])
+        self.assertEqual(set(change['event'] for change in changes), set(['playlists']))
+        self.assertEqual(changes[-1]['version'], self.s.changelog.version)
+
+    def test_playback_changes(self):
+        self.subscribe(['playback'])
+        self.s.playback.loaded_item = object()
+
+        self.s.process_msg(0x00)
+        self.s.process_msg(0x00) # Already playing, nothing to tell anyone.
+        self.s.process_msg(0x01)
+        self.assertEqual([change['state'] for key, change in self.pushed], [PLAY, STOP])
+
+    def test_only_subscribed(self):
+        self.subscribe(['schedule'])
+        self.s.process_msg(0x16, playlist_contents=success_playlist)
+        self.assertEqual(self.pushed, [])
+
+    def test_resubscribe_replaces(self):
+        self.subscribe(['playlists'])
+        self.subscribe([])
+        self.s.process_msg(0x16, playlist_contents=success_playlist)
+        self.assertEqual(self.pushed, [])
+        self.assertEqual(self.s.subscriptions['to_client.test'], [])
+
+    def test_unknown_event(self):
+        self.assertEqual(self.subscribe(['playlists', 'weather'])['status'], 13)
+
+    def test_ingest_progress(self):
+        self.subscribe(['ingest'])
+        self.s.content.update_ingest_history('foo', 1)
+        self.assertEqual(self.pushed, [(0x43, {"status": 0, "event": "ingest", "ingest_uuid": "foo", "state": 1})])
+
+    def test_screens_kept_apart(self):
+        second = ScreenServer(paths={'playlists': os.path.join(paths['playlists'], 'screen_2')}, content=self.s.content, bus=self.s.bus)
+        try:
+            self.subscribe(['playlists', 'ingest'])
+
+            # Another screen's playlists are nothing to do with us but content (and so ingests) are shared.
+            second.process_msg(0x16, playlist_contents=success_playlist)
+            self.assertEqual(self.pushed, [])
+
+            second.content.update_ingest_history('foo', 1)
+            self.assertEqual(len(self.pushed), 1)
+        finally:
+            del(second)
+
+class TestConnectionSubscriptions(unittest.TestCase):
+    def setUp(self):
+        self.s = ScreenServer(paths=paths)
+        self.factory = FakeFactory(self.s)
+        self.protocol = Screener(self.s, self.factory)
+        self.protocol.makeConnection(StringTransport())
+
+    def tearDown(self):
+        self.factory.pool.stop()
+        self.s.content.stop()
+        del(self.s)
+        gc.collect()
+
+        for v in paths.itervalues():
+            shutil.rmtree(v)
+
+    def test_dropped_on_disconnect(self):
+        self.s.subscribe(['playlists', 'content'], reply_to=self.protocol.topic)
+        self.assertTrue(self.s.bus.has_any_subscriptions(self.s.change_topics['playlists']))
+
+        self.protocol.connectionLost(None)
+        self.assertFalse(self.protocol.topic in self.s.subscriptions)
+        self.assertFalse(self.s.bus.has_any_subscriptions(self.s.change_topics['playlists']))
+        self.assertFalse(self.s.bus.has_any_subscriptions(self.s.change_topics['content']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-import unittest, os, shutil
+import unittest, gc, os, shutil
 from datetime import datetime
 
 from screener.app import ScreenServer
@@ -17,8 +17,11 @@ class TestSystem(unittest.TestCase):
         self.s = ScreenServer(paths=paths)
 
     def tearDown(self):
+        self.s.content.stop()
+
         # Manually call this so it doesn't complain about not having the playlists_path when it deletes itself going out of scope.
         del(self.s)
+        gc.collect()
 
         for v in paths.itervalues():
             shutil.rmtree(v)
@@ -29,5 +32,29 @@ class TestSystem(unittest.TestCase):
         self.assertEqual(v['status'], 0)
         self.assertTrue(datetime.fromtimestamp(v['time']))
 
+    def test_negotiate_codec(self):
+        k,v = self.s.process_msg(0x41, codecs=[1, 0])
+        self.assertEqual(k, 0x41)
+        self.assertEqual(v['status'], 0)
+        self.assertEqual(v['codec'], 1)
+
+        # Fall back to JSON when there's nothing we support.
+        k,v = self.s.process_msg(0x41, codecs=[99])
+        self.assertEqual(v['status'], 0)
+        self.assertEqual(v['codec'], 0)
+
+    def test_get_metrics(self):
+        self.s.process_msg(0x03)
+        self.s.process_msg(0x03)
+
+        k,v = self.s.process_msg(0x42)
+        self.assertEqual(k, 0x42)
+        self.assertEqual(v['status'], 0)
+        self.assertEqual(v['metrics']['0x03']['handle']['count'], 2)
+
+        k,v = self.s.process_msg(0x42, reset=True)
+        k,v = self.s.process_msg(0x42)
+        self.assertFalse('0x03' in v['metrics'])
+
 if __name__ == '__main__':
     unittest.main()